@@ -0,0 +1,311 @@
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+# Registry jenis tugas latar: {jenis: (judul, fungsi(parameter, berkas))}
+JENIS_TUGAS = {}
+
+KOLOM_TUGAS = (
+    'id', 'jenis', 'parameter', 'status', 'percobaan', 'maks_percobaan', 'pesan',
+    'nama_berkas', 'mimetype', 'user_id', 'dibuat', 'mulai', 'selesai', 'kedaluwarsa'
+)
+
+
+def tugas_latar(jenis, judul):
+    """Daftarkan fungsi sebagai jenis tugas latar.
+
+    `fungsi(parameter, berkas)` menulis hasilnya ke berkas biner `berkas` lalu
+    mengembalikan (nama_berkas, mimetype), atau None jika tugas tidak
+    menghasilkan berkas (mis. rebuild rekap).
+    """
+    def daftar(fungsi):
+        if jenis in JENIS_TUGAS:
+            raise ValueError(f"Jenis tugas {jenis} sudah dipakai")
+        JENIS_TUGAS[jenis] = (judul, fungsi)
+        return fungsi
+    return daftar
+
+
+class AntrianTugas:
+    """Antrian tugas latar di tabel antrian_tugas.
+
+    Route hanya menyisipkan satu baris lalu langsung selesai; proses worker
+    (`flask --app app antrian-worker`) mengklaim tugas satu per satu dengan
+    satu UPDATE atomik, menjalankannya di app context sendiri dan menyimpan
+    hasilnya di disk. Tugas yang gagal diulang dengan jeda yang makin
+    panjang sampai `maks_percobaan`; hasil dan barisnya dihapus setelah
+    `masa_simpan`.
+
+    Selama tugas berjalan worker memperbarui kolom `detak` setiap
+    `interval_detak` detik. Hanya tugas yang detaknya berhenti lebih lama
+    dari `batas_detak` (worker mati) yang diantrekan ulang, jadi ekspor
+    yang memang lama tidak pernah dijalankan dua kali.
+    """
+
+    def __init__(self, direktori, maks_percobaan=3, masa_simpan=timedelta(hours=24),
+                 batas_detak=timedelta(minutes=2), interval_detak=20, jeda_ulang=30):
+        self.direktori = direktori
+        self.maks_percobaan = maks_percobaan
+        self.masa_simpan = masa_simpan
+        self.batas_detak = batas_detak
+        self.interval_detak = interval_detak
+        self.jeda_ulang = jeda_ulang
+
+    def path_hasil(self, id):
+        return os.path.join(self.direktori, f'{id}.hasil')
+
+    # ---------------------------------------------------------
+    # Dipakai route
+    # ---------------------------------------------------------
+    def masukkan(self, cur, jenis, parameter=None, user_id=None):
+        """Sisipkan tugas baru (commit oleh pemanggil) dan kembalikan id-nya"""
+        if jenis not in JENIS_TUGAS:
+            raise ValueError(f"Jenis tugas {jenis} tidak dikenal")
+        sekarang = datetime.now()
+        cur.execute("""
+            INSERT INTO antrian_tugas
+                (jenis, parameter, status, maks_percobaan, user_id, dibuat, jalankan_setelah)
+            VALUES (%s, %s, 'antri', %s, %s, %s, %s)
+        """, (jenis, json.dumps(parameter or {}), self.maks_percobaan, user_id, sekarang, sekarang))
+        return cur.lastrowid
+
+    def ambil(self, cur, id):
+        cur.execute(f"SELECT {', '.join(KOLOM_TUGAS)} FROM antrian_tugas WHERE id = %s", (id,))
+        baris = cur.fetchone()
+        return self._sebagai_dict(baris) if baris else None
+
+    def daftar(self, cur, user_id=None, jumlah=50):
+        """Tugas terbaru; semua pengguna jika `user_id` None"""
+        kondisi, params = '', []
+        if user_id is not None:
+            kondisi, params = 'WHERE user_id = %s', [user_id]
+        cur.execute(f"""
+            SELECT {', '.join(KOLOM_TUGAS)} FROM antrian_tugas
+            {kondisi} ORDER BY id DESC LIMIT %s
+        """, params + [jumlah])
+        return [self._sebagai_dict(b) for b in cur.fetchall()]
+
+    def ulangi(self, cur, id):
+        """Antrekan ulang tugas yang gagal dengan jatah percobaan baru"""
+        cur.execute("""
+            UPDATE antrian_tugas
+            SET status = 'antri', percobaan = 0, pesan = NULL, kedaluwarsa = NULL,
+                jalankan_setelah = %s
+            WHERE id = %s AND status = 'gagal'
+        """, (datetime.now(), id))
+        return cur.rowcount == 1
+
+    @staticmethod
+    def _sebagai_dict(baris):
+        tugas = dict(zip(KOLOM_TUGAS, baris))
+        tugas['parameter'] = json.loads(tugas['parameter'] or '{}')
+        tugas['judul'] = JENIS_TUGAS.get(tugas['jenis'], (tugas['jenis'],))[0]
+        return tugas
+
+    # ---------------------------------------------------------
+    # Dipakai worker
+    # ---------------------------------------------------------
+    def klaim(self, conn, pekerja):
+        """Ambil satu tugas siap jalan dan tandai 'berjalan'.
+
+        UPDATE ... LIMIT 1 mengunci baris yang dipilih, jadi dua worker tidak
+        pernah mengklaim tugas yang sama; id-nya dibaca kembali lewat
+        LAST_INSERT_ID(id) seperti pada nomor_urut.
+        """
+        cur = conn.cursor()
+        sekarang = datetime.now()
+        cur.execute("""
+            UPDATE antrian_tugas
+            SET status = 'berjalan', pekerja = %s, mulai = %s, detak = %s, percobaan = percobaan + 1,
+                id = LAST_INSERT_ID(id)
+            WHERE status = 'antri' AND jalankan_setelah <= %s
+            ORDER BY id
+            LIMIT 1
+        """, (pekerja, sekarang, sekarang, sekarang))
+        tugas = None
+        if cur.rowcount == 1:
+            cur.execute("SELECT LAST_INSERT_ID()")
+            tugas = self.ambil(cur, cur.fetchone()[0])
+        conn.commit()
+        cur.close()
+        return tugas
+
+    def _detak(self, pool, id, pekerja, berhenti):
+        """Thread yang memperbarui `detak` tugas selama tugasnya berjalan.
+
+        Memakai koneksi sendiri dari pool karena koneksi tugas sedang dipakai
+        fungsi tugas di thread utama.
+        """
+        conn = pool.acquire()
+        try:
+            cur = conn.cursor()
+            while not berhenti.wait(self.interval_detak):
+                try:
+                    cur.execute("""
+                        UPDATE antrian_tugas SET detak = %s
+                        WHERE id = %s AND status = 'berjalan' AND pekerja = %s
+                    """, (datetime.now(), id, pekerja))
+                    conn.commit()
+                except Exception:
+                    # Gangguan sesaat; coba lagi di detak berikutnya
+                    traceback.print_exc()
+            cur.close()
+        finally:
+            pool.release(conn)
+
+    def jalankan_satu(self, conn, pekerja, pool):
+        """Klaim dan jalankan satu tugas; False jika antrian kosong"""
+        tugas = self.klaim(conn, pekerja)
+        if tugas is None:
+            return False
+
+        berhenti = threading.Event()
+        detak = threading.Thread(target=self._detak, args=(pool, tugas['id'], pekerja, berhenti), daemon=True)
+        detak.start()
+        try:
+            self._jalankan(conn, pekerja, tugas)
+        finally:
+            berhenti.set()
+            detak.join()
+        return True
+
+    def _jalankan(self, conn, pekerja, tugas):
+        os.makedirs(self.direktori, exist_ok=True)
+        fd, sementara = tempfile.mkstemp(dir=self.direktori, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as berkas:
+                hasil = JENIS_TUGAS[tugas['jenis']][1](tugas['parameter'], berkas)
+        except Exception:
+            conn.rollback()
+            os.remove(sementara)
+            self._gagal(conn, pekerja, tugas, traceback.format_exc(limit=5))
+            return
+
+        nama_berkas = mimetype = None
+        if hasil is not None:
+            nama_berkas, mimetype = hasil
+
+        # Hanya pemilik klaim yang boleh menyelesaikan tugas; jika tugasnya
+        # sudah diambil alih atau ditandai gagal, hasil ini dibuang
+        sekarang = datetime.now()
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE antrian_tugas
+            SET status = 'selesai', pesan = NULL, nama_berkas = %s, mimetype = %s,
+                selesai = %s, kedaluwarsa = %s
+            WHERE id = %s AND status = 'berjalan' AND pekerja = %s
+        """, (nama_berkas, mimetype, sekarang, sekarang + self.masa_simpan, tugas['id'], pekerja))
+        if cur.rowcount == 1 and hasil is not None:
+            os.replace(sementara, self.path_hasil(tugas['id']))
+        else:
+            os.remove(sementara)
+        conn.commit()
+        cur.close()
+
+    def _gagal(self, conn, pekerja, tugas, pesan):
+        sekarang = datetime.now()
+        cur = conn.cursor()
+        if tugas['percobaan'] < tugas['maks_percobaan']:
+            jeda = timedelta(seconds=self.jeda_ulang * 2 ** (tugas['percobaan'] - 1))
+            cur.execute("""
+                UPDATE antrian_tugas SET status = 'antri', pesan = %s, jalankan_setelah = %s
+                WHERE id = %s AND status = 'berjalan' AND pekerja = %s
+            """, (pesan, sekarang + jeda, tugas['id'], pekerja))
+        else:
+            cur.execute("""
+                UPDATE antrian_tugas SET status = 'gagal', pesan = %s, selesai = %s, kedaluwarsa = %s
+                WHERE id = %s AND status = 'berjalan' AND pekerja = %s
+            """, (pesan, sekarang, sekarang + self.masa_simpan, tugas['id'], pekerja))
+        conn.commit()
+        cur.close()
+
+    def bersihkan(self, conn):
+        """Kembalikan tugas yang detaknya berhenti (worker mati) dan hapus tugas kedaluwarsa"""
+        sekarang = datetime.now()
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE antrian_tugas
+            SET status = IF(percobaan < maks_percobaan, 'antri', 'gagal'),
+                pesan = 'Worker berhenti sebelum tugas selesai',
+                jalankan_setelah = %s,
+                selesai = IF(percobaan < maks_percobaan, NULL, %s),
+                kedaluwarsa = IF(percobaan < maks_percobaan, NULL, %s)
+            WHERE status = 'berjalan' AND COALESCE(detak, mulai) < %s
+        """, (sekarang, sekarang, sekarang + self.masa_simpan, sekarang - self.batas_detak))
+
+        cur.execute("SELECT id FROM antrian_tugas WHERE kedaluwarsa < %s", (sekarang,))
+        kedaluwarsa = [b[0] for b in cur.fetchall()]
+        if kedaluwarsa:
+            cur.execute(
+                f"DELETE FROM antrian_tugas WHERE id IN ({', '.join(['%s'] * len(kedaluwarsa))})",
+                kedaluwarsa
+            )
+        conn.commit()
+        cur.close()
+
+        for id in kedaluwarsa:
+            try:
+                os.remove(self.path_hasil(id))
+            except FileNotFoundError:
+                pass
+        return len(kedaluwarsa)
+
+    def jalankan_worker(self, app, mysql, jeda=2.0, interval_bersih=60):
+        """Loop satu proses worker sampai menerima SIGTERM (tugas yang berjalan diselesaikan dulu)"""
+        berhenti = []
+        signal.signal(signal.SIGTERM, lambda *_: berhenti.append(True))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        pekerja = f'{socket.gethostname()}:{os.getpid()}'
+        bersih_terakhir = 0
+
+        while not berhenti:
+            with app.app_context():
+                conn = mysql.connection
+                if time.monotonic() - bersih_terakhir > interval_bersih:
+                    self.bersihkan(conn)
+                    bersih_terakhir = time.monotonic()
+                ada_tugas = self.jalankan_satu(conn, pekerja, mysql.pool)
+            if not ada_tugas:
+                time.sleep(jeda)
+
+    def jalankan_pool(self, app, mysql, jumlah_proses=2, jeda=2.0, log=print):
+        """Jalankan `jumlah_proses` worker sebagai proses anak; anak yang mati diganti baru.
+
+        Proses induk tidak pernah membuka koneksi database sehingga setiap
+        anak hasil fork membuat pool koneksinya sendiri.
+        """
+        ctx = multiprocessing.get_context('fork')
+        berhenti = []
+
+        def hentikan(*_):
+            berhenti.append(True)
+
+        signal.signal(signal.SIGTERM, hentikan)
+        signal.signal(signal.SIGINT, hentikan)
+
+        def mulai():
+            p = ctx.Process(target=self.jalankan_worker, args=(app, mysql, jeda), daemon=False)
+            p.start()
+            log(f"Worker antrian pid {p.pid} berjalan.")
+            return p
+
+        proses = [mulai() for _ in range(jumlah_proses)]
+        while not berhenti:
+            time.sleep(1)
+            for i, p in enumerate(proses):
+                if not p.is_alive() and not berhenti:
+                    log(f"Worker pid {p.pid} berhenti (kode {p.exitcode}), diganti baru.")
+                    proses[i] = mulai()
+
+        for p in proses:
+            p.terminate()
+        for p in proses:
+            p.join()
+        log("Semua worker antrian berhenti.")
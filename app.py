@@ -1,17 +1,56 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, make_response, session
-from flask_mysqldb import MySQL
+from flask import (
+    Flask, render_template, request, redirect, url_for, flash, make_response, session, jsonify, send_file,
+    stream_with_context, g, send_from_directory
+)
 from fpdf import FPDF
+from jinja2 import FileSystemBytecodeCache
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 import os
+import re
+import json
+import time
+import base64
+import uuid
+import hashlib
+import threading
+import mimetypes
+import click
 from functools import wraps
-from datetime import date
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 
+import metrics
 import config
+from db_pool import MySQLPool
+from query_stats import QueryStats, InstrumentedConnection
+from pdf_cache import PdfCache
+from ekspor import zip_stream, csv_stream, xlsx_stream
+from gejala import IndeksGejala
+from impor import baca_tabel, validasi_domba, BerkasTidakValid
+from antrian import AntrianTugas, tugas_latar
+from prakiraan import proyeksi_pakan, JENDELA_HARI
+from fragmen import Tunda
+from aset import PembangunAset, ManifestAset, CDN_CADANGAN
+from kompresi import KompresiRespons
+from migrations import (
+    migrasi, jalankan_migrasi, versi_sekarang, versi_terbaru, tambah_kolom, buat_index, MIGRASI
+)
 
 app = Flask(__name__)
 app.secret_key = 'kunci_rahasia_dombastis'
 
+# Template yang sudah dikompilasi disimpan sebagai bytecode di disk dan
+# dipakai bersama semua worker, jadi worker baru tidak mengompilasi ulang
+# base.html dkk. Berkas cache diberi checksum sumbernya, jadi template
+# yang diubah otomatis dikompilasi ulang. Tag {% cache %} ada di fragmen.py.
+os.makedirs(config.JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_options = {
+    **app.jinja_options,
+    'bytecode_cache': FileSystemBytecodeCache(config.JINJA_CACHE_DIR),
+    'extensions': [*app.jinja_options.get('extensions', ()), 'fragmen.CacheFragmen'],
+}
+
 # =========================================================
 # KONFIGURASI DATABASE
 # =========================================================
@@ -19,8 +58,30 @@ app.config['MYSQL_HOST'] = config.MYSQL_HOST
 app.config['MYSQL_USER'] = config.MYSQL_USER
 app.config['MYSQL_PASSWORD'] = config.MYSQL_PASSWORD
 app.config['MYSQL_DB'] = config.MYSQL_DB
-
-mysql = MySQL(app)
+app.config['MYSQL_PORT'] = config.MYSQL_PORT
+app.config['MYSQL_POOL_SIZE'] = config.MYSQL_POOL_SIZE
+app.config['MYSQL_POOL_IDLE_TIMEOUT'] = config.MYSQL_POOL_IDLE_TIMEOUT
+app.config['MYSQL_POOL_TIMEOUT'] = config.MYSQL_POOL_TIMEOUT
+
+# Setiap query dicatat per endpoint; yang melewati ambang SLOW_QUERY_MS
+# ikut dicatat bersama rencana EXPLAIN-nya
+query_stats = QueryStats(slow_ms=config.SLOW_QUERY_MS)
+
+# Satu pool koneksi per proses worker, dipakai bersama oleh semua route
+mysql = MySQLPool(app, wrapper=lambda conn: InstrumentedConnection(conn, query_stats))
+
+# Endpoint /metrics (format Prometheus), dijumlahkan lintas worker gunicorn
+metrics.init_app(app, pool=mysql.pool, token=config.METRICS_TOKEN)
+
+# Respons HTML/JSON/CSV dikompresi brotli/gzip sebelum dikirim (lihat kompresi.py);
+# aset hasil build yang sudah .br/.gz dilewatkan karena membawa Content-Encoding
+if config.KOMPRESI_AKTIF:
+    app.wsgi_app = KompresiRespons(
+        app.wsgi_app,
+        level_gzip=config.KOMPRESI_LEVEL_GZIP,
+        level_brotli=config.KOMPRESI_LEVEL_BROTLI,
+        min_bytes=config.KOMPRESI_MIN_BYTES,
+    )
 
 # =========================================================
 # KONFIGURASI UPLOAD FOTO
@@ -29,6 +90,60 @@ UPLOAD_FOLDER = 'static/uploads/kematian'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# =========================================================
+# ASET STATIS
+# =========================================================
+# CSS (Tailwind hasil purge + CSS vendor) dan JS vendor dibangun sekali
+# oleh `flask --app app bangun-aset` ke ASET_DIR dengan nama ber-hash isi,
+# lalu template merujuknya lewat aset('app.css'). Karena nama berkas
+# berubah setiap isinya berubah, browser boleh menyimpannya selamanya.
+# Selama belum dibangun, template memakai CDN seperti sebelumnya.
+DIREKTORI_ASET = os.path.join(app.root_path, config.ASET_DIR)
+manifest_aset = ManifestAset(DIREKTORI_ASET)
+
+
+@app.template_global()
+def aset(nama):
+    ber_hash = manifest_aset.ambil(nama)
+    if ber_hash:
+        return url_for('aset_statis', nama=ber_hash)
+    return CDN_CADANGAN.get(nama)
+
+
+@app.template_global()
+def aset_terbangun():
+    return 'app.css' in manifest_aset
+
+
+@app.route('/aset/<path:nama>')
+def aset_statis(nama):
+    """Kirim aset ber-hash; varian .br/.gz hasil build dipakai jika browser menerimanya"""
+    mimetype = mimetypes.guess_type(nama)[0] or 'application/octet-stream'
+    berkas, encoding = nama, None
+    for enc, ext in (('br', '.br'), ('gzip', '.gz')):
+        if enc in request.accept_encodings and os.path.isfile(os.path.join(DIREKTORI_ASET, nama + ext)):
+            berkas, encoding = nama + ext, enc
+            break
+
+    response = send_from_directory(DIREKTORI_ASET, berkas, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@app.cli.command('bangun-aset')
+def bangun_aset_command():
+    """Bangun CSS/JS ber-hash ke ASET_DIR (butuh Tailwind CLI di TAILWIND_BIN dan akses internet)."""
+    manifest = PembangunAset(DIREKTORI_ASET).bangun(
+        config.TAILWIND_BIN,
+        os.path.join(app.root_path, 'tailwind.css'),
+        os.path.join(app.root_path, 'tailwind.config.js')
+    )
+    print(f"{len(manifest)} aset ditulis ke {config.ASET_DIR}.")
+
+
 # =========================================================
 # MIDDLEWARE: PROTEKSI AKSES
 # =========================================================
@@ -52,12 +167,14 @@ def admin_only(f):
 
 
 # =========================================================
-# 0. ROUTE KHUSUS: SETUP AWAL
+# 0. MIGRASI SKEMA DATABASE
 # =========================================================
-@app.route('/setup_admin')
-def setup_admin():
-    cur = mysql.connection.cursor()
+# Skema dikelola lewat migrasi bernomor (lihat migrations.py) yang dijalankan
+# saat deploy dengan `flask --app app migrasi`, bukan di dalam request HTTP.
+# Migrasi hanya maju: perubahan skema berikutnya selalu migrasi bernomor baru.
 
+@migrasi(1, 'skema awal')
+def migrasi_0001_skema_awal(cur):
     cur.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id INT AUTO_INCREMENT PRIMARY KEY,
@@ -75,7 +192,7 @@ def setup_admin():
             berat_kg DECIMAL(10,2),
             ear_tag_id VARCHAR(50),
             jenis_domba VARCHAR(100),
-            lokasi_kandang ENUM('Barat','Timur'),
+            lokasi_kandang VARCHAR(50),
             nomor_kamar INT
         )
     """)
@@ -186,7 +303,7 @@ def setup_admin():
             id INT AUTO_INCREMENT PRIMARY KEY,
             user_id INT,
             tanggal DATE,
-            lokasi_kandang ENUM('Barat','Timur'),
+            lokasi_kandang VARCHAR(50),
             buat_pakan TINYINT(1) DEFAULT 0,
             beri_pakan TINYINT(1) DEFAULT 0,
             sapu_kandang TINYINT(1) DEFAULT 0,
@@ -215,21 +332,88 @@ def setup_admin():
         )
     """)
 
-    # ── AUTO MIGRASI: tambah kolom baru jika belum ada ──
-    migrasi = [
-        "ALTER TABLE penjualan ADD COLUMN IF NOT EXISTS no_struk VARCHAR(50)",
-        "ALTER TABLE penjualan ADD COLUMN IF NOT EXISTS no_hp VARCHAR(20)",
-        "ALTER TABLE penjualan ADD COLUMN IF NOT EXISTS catatan TEXT",
-        "ALTER TABLE penjualan ADD COLUMN IF NOT EXISTS harga_per_ekor DECIMAL(15,2)",
-        "ALTER TABLE penjualan ADD COLUMN IF NOT EXISTS sisa_tagihan DECIMAL(15,2) DEFAULT 0",
-        "ALTER TABLE penjualan ADD COLUMN IF NOT EXISTS keterangan_domba TEXT",
-    ]
-    for sql in migrasi:
-        try:
-            cur.execute(sql)
-            mysql.connection.commit()
-        except Exception:
-            pass
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS kandang (
+            id          INT AUTO_INCREMENT PRIMARY KEY,
+            nama        VARCHAR(50) UNIQUE,
+            keterangan  VARCHAR(255)
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS statistik_domba (
+            id          TINYINT PRIMARY KEY,
+            total       INT NOT NULL DEFAULT 0,
+            jantan      INT NOT NULL DEFAULT 0,
+            betina      INT NOT NULL DEFAULT 0,
+            total_berat DECIMAL(15,2) NOT NULL DEFAULT 0,
+            jumlah_ditimbang INT NOT NULL DEFAULT 0
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS statistik_kamar (
+            lokasi_kandang VARCHAR(50),
+            nomor_kamar    INT,
+            jumlah         INT NOT NULL DEFAULT 0,
+            jantan         INT NOT NULL DEFAULT 0,
+            betina         INT NOT NULL DEFAULT 0,
+            total_berat    DECIMAL(15,2) NOT NULL DEFAULT 0,
+            jumlah_ditimbang INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (lokasi_kandang, nomor_kamar)
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS riwayat_berat (
+            id             INT AUTO_INCREMENT PRIMARY KEY,
+            id_domba       INT,
+            berat_kg       DECIMAL(10,2),
+            lokasi_kandang VARCHAR(50),
+            waktu          DATETIME,
+            INDEX idx_riwayat_domba_waktu (id_domba, waktu)
+        )
+    """)
+
+    for periode in ('mingguan', 'bulanan'):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS rekap_berat_{periode} (
+                periode         DATE,
+                lokasi_kandang  VARCHAR(50),
+                jumlah_timbang  INT NOT NULL DEFAULT 0,
+                total_berat     DECIMAL(15,2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (periode, lokasi_kandang),
+                INDEX idx_rekap_berat_{periode}_lokasi (lokasi_kandang, periode)
+            )
+        """)
+
+    # Kolom yang ditambahkan belakangan pada tabel penjualan lama
+    tambah_kolom(cur, 'penjualan', 'no_struk', 'VARCHAR(50) UNIQUE')
+    tambah_kolom(cur, 'penjualan', 'no_hp', 'VARCHAR(20)')
+    tambah_kolom(cur, 'penjualan', 'catatan', 'TEXT')
+    tambah_kolom(cur, 'penjualan', 'harga_per_ekor', 'DECIMAL(15,2)')
+    tambah_kolom(cur, 'penjualan', 'sisa_tagihan', 'DECIMAL(15,2) DEFAULT 0')
+    tambah_kolom(cur, 'penjualan', 'terbayar', 'DECIMAL(15,2) DEFAULT 0')
+    tambah_kolom(cur, 'penjualan', 'keterangan_domba', 'TEXT')
+
+    # Lokasi kandang bukan lagi ENUM, daftar kandang ada di tabel kandang
+    cur.execute("ALTER TABLE domba MODIFY lokasi_kandang VARCHAR(50)")
+    cur.execute("ALTER TABLE log_kerja MODIFY lokasi_kandang VARCHAR(50)")
+    cur.execute("INSERT IGNORE INTO kandang (nama) VALUES ('Barat'), ('Timur')")
+    cur.execute("""
+        INSERT IGNORE INTO kandang (nama)
+        SELECT DISTINCT lokasi_kandang FROM domba WHERE lokasi_kandang IS NOT NULL
+    """)
+
+    cur.execute("SELECT COUNT(*) FROM riwayat_berat")
+    if cur.fetchone()[0] == 0:
+        # Timbangan awal: berat yang tercatat saat ini menjadi titik pertama riwayat
+        cur.execute("""
+            INSERT INTO riwayat_berat (id_domba, berat_kg, lokasi_kandang, waktu)
+            SELECT id, berat_kg, lokasi_kandang, NOW() FROM domba WHERE berat_kg IS NOT NULL
+        """)
+    rebuild_rekap_berat(cur)
+    rebuild_statistik(cur)
 
     cur.execute("SELECT COUNT(*) FROM referensi_medis")
     if cur.fetchone()[0] == 0:
@@ -246,7 +430,185 @@ def setup_admin():
             ('Mata merah, berair, bengkak, katarak ringan', 'Infeksi Mata', 'OBAT MATA', 'ERLAMECTIN'),
             ('Pencernaan tidak stabil setelah pergantian pakan', 'Optimasi Lambung', 'PREBIOTIK', 'PREBIOTIK')
         """)
-        mysql.connection.commit()
+
+
+@migrasi(2, 'index untuk query yang sering dipakai')
+def migrasi_0002_index(cur):
+    buat_index(cur, 'domba', 'idx_domba_kandang_kamar', 'lokasi_kandang, nomor_kamar, id')
+    buat_index(cur, 'domba', 'idx_domba_nama', 'nama_domba')
+    buat_index(cur, 'rekam_medis', 'idx_rekam_medis_domba', 'id_domba, tanggal_periksa')
+    buat_index(cur, 'rekam_medis', 'idx_rekam_medis_tanggal', 'tanggal_periksa')
+    buat_index(cur, 'log_kerja', 'idx_log_kerja_user_tanggal', 'user_id, tanggal')
+    buat_index(cur, 'log_kerja', 'idx_log_kerja_kandang_tanggal', 'lokasi_kandang, tanggal')
+    buat_index(cur, 'log_kerja', 'idx_log_kerja_tanggal', 'tanggal')
+    buat_index(cur, 'log_populasi', 'idx_log_populasi_tanggal', 'tanggal')
+    buat_index(cur, 'penjualan', 'idx_penjualan_tanggal', 'tanggal, id')
+    buat_index(cur, 'keuangan', 'idx_keuangan_tanggal', 'tanggal')
+    buat_index(cur, 'keuangan_kas', 'idx_keuangan_kas_tanggal', 'tanggal, id')
+    buat_index(cur, 'stok_pakan', 'idx_stok_pakan_tanggal', 'tanggal')
+    buat_index(cur, 'laporan_harian', 'idx_laporan_harian_tanggal', 'tanggal, jam_selesai')
+    buat_index(cur, 'sop', 'idx_sop_waktu', 'waktu')
+    buat_index(cur, 'obat', 'idx_obat_nama', 'nama_obat')
+
+
+@migrasi(3, 'kolom versi baris untuk cache PDF')
+def migrasi_0003_versi_baris(cur):
+    tambah_kolom(cur, 'domba', 'versi', 'INT NOT NULL DEFAULT 1')
+    tambah_kolom(cur, 'keuangan', 'versi', 'INT NOT NULL DEFAULT 1')
+    tambah_kolom(cur, 'penjualan', 'versi', 'INT NOT NULL DEFAULT 1')
+
+
+@migrasi(4, 'tabel nomor urut harian untuk struk & invoice')
+def migrasi_0004_nomor_urut(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS nomor_urut (
+            jenis VARCHAR(20) NOT NULL,
+            tanggal DATE NOT NULL,
+            terakhir INT NOT NULL,
+            PRIMARY KEY (jenis, tanggal)
+        )
+    """)
+
+    # Lanjutkan urutan dari nomor yang sudah terpakai (format AWALAN-YYYYMMDD-NNN)
+    for jenis, (awalan, tabel, kolom) in FORMAT_NOMOR.items():
+        cur.execute(f"""
+            INSERT INTO nomor_urut (jenis, tanggal, terakhir)
+            SELECT '{jenis}',
+                   STR_TO_DATE(SUBSTRING({kolom}, {len(awalan) + 2}, 8), '%Y%m%d'),
+                   MAX(CAST(SUBSTRING_INDEX({kolom}, '-', -1) AS UNSIGNED))
+            FROM {tabel}
+            WHERE {kolom} REGEXP '^{awalan}-[0-9]{{8}}-[0-9]+$'
+            GROUP BY 1, 2
+            ON DUPLICATE KEY UPDATE terakhir = GREATEST(terakhir, VALUES(terakhir))
+        """)
+
+
+@migrasi(5, 'saldo berjalan kas dan rekap saldo bulanan')
+def migrasi_0005_saldo_kas(cur):
+    tambah_kolom(cur, 'keuangan_kas', 'saldo', 'DECIMAL(15,2) NOT NULL DEFAULT 0')
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS saldo_kas_bulanan (
+            periode DATE PRIMARY KEY,
+            masuk DECIMAL(15,2) NOT NULL DEFAULT 0,
+            keluar DECIMAL(15,2) NOT NULL DEFAULT 0,
+            jumlah INT NOT NULL DEFAULT 0,
+            saldo_akhir DECIMAL(15,2) NOT NULL DEFAULT 0
+        )
+    """)
+    rebuild_saldo_kas(cur)
+
+
+@migrasi(6, 'rekap penjualan harian dan bulanan')
+def migrasi_0006_rekap_penjualan(cur):
+    for tabel, kunci in (('rekap_penjualan_harian', 'tanggal'), ('rekap_penjualan_bulanan', 'periode')):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {tabel} (
+                {kunci} DATE PRIMARY KEY,
+                jumlah_transaksi INT NOT NULL DEFAULT 0,
+                ekor INT NOT NULL DEFAULT 0,
+                pendapatan DECIMAL(15,2) NOT NULL DEFAULT 0,
+                terbayar DECIMAL(15,2) NOT NULL DEFAULT 0,
+                sisa_tagihan DECIMAL(15,2) NOT NULL DEFAULT 0,
+                belum_lunas INT NOT NULL DEFAULT 0
+            )
+        """)
+    rebuild_rekap_penjualan(cur)
+
+
+@migrasi(7, 'index FULLTEXT untuk pencarian')
+def migrasi_0007_fulltext(cur):
+    buat_index(cur, 'domba', 'ft_domba', 'nama_domba, ear_tag_id, jenis_domba', 'FULLTEXT INDEX')
+    buat_index(cur, 'rekam_medis', 'ft_rekam_medis', 'diagnosa, obat, catatan', 'FULLTEXT INDEX')
+    buat_index(cur, 'obat', 'ft_obat', 'nama_obat, brand, fungsi', 'FULLTEXT INDEX')
+    buat_index(cur, 'sop', 'ft_sop', 'kegiatan, takaran, instruksi, penanggung_jawab', 'FULLTEXT INDEX')
+
+
+@migrasi(8, 'versi data per tabel')
+def migrasi_0008_versi_tabel(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS versi_tabel (
+            tabel VARCHAR(64) PRIMARY KEY,
+            versi BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+
+
+@migrasi(9, 'antrian tugas latar')
+def migrasi_0009_antrian_tugas(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS antrian_tugas (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            jenis VARCHAR(50) NOT NULL,
+            parameter TEXT,
+            status ENUM('antri', 'berjalan', 'selesai', 'gagal') NOT NULL DEFAULT 'antri',
+            percobaan INT NOT NULL DEFAULT 0,
+            maks_percobaan INT NOT NULL DEFAULT 3,
+            pesan TEXT,
+            nama_berkas VARCHAR(255),
+            mimetype VARCHAR(100),
+            user_id INT,
+            pekerja VARCHAR(100),
+            dibuat DATETIME NOT NULL,
+            jalankan_setelah DATETIME NOT NULL,
+            mulai DATETIME,
+            selesai DATETIME,
+            kedaluwarsa DATETIME,
+            INDEX idx_antrian_siap (status, jalankan_setelah),
+            INDEX idx_antrian_user (user_id, id),
+            INDEX idx_antrian_kedaluwarsa (kedaluwarsa)
+        )
+    """)
+
+
+@migrasi(10, 'saldo stok per bahan pakan')
+def migrasi_0010_stok_bahan(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stok_bahan (
+            nama_bahan VARCHAR(100) PRIMARY KEY,
+            masuk DECIMAL(12,2) NOT NULL DEFAULT 0,
+            keluar DECIMAL(12,2) NOT NULL DEFAULT 0,
+            saldo DECIMAL(12,2) NOT NULL DEFAULT 0,
+            jumlah_mutasi INT NOT NULL DEFAULT 0,
+            mutasi_terakhir DATE
+        )
+    """)
+    buat_index(cur, 'stok_pakan', 'idx_stok_pakan_bahan', 'nama_bahan, tanggal')
+    rebuild_stok_bahan(cur)
+
+
+@migrasi(11, 'detak worker antrian tugas')
+def migrasi_0011_detak_antrian(cur):
+    tambah_kolom(cur, 'antrian_tugas', 'detak', 'DATETIME')
+
+
+@migrasi(12, 'penanda impor massal domba')
+def migrasi_0012_kode_impor(cur):
+    tambah_kolom(cur, 'domba', 'kode_impor', 'CHAR(32)')
+    buat_index(cur, 'domba', 'idx_domba_kode_impor', 'kode_impor')
+
+
+@migrasi(13, 'index ear tag domba untuk pencarian tag')
+def migrasi_0013_index_ear_tag(cur):
+    buat_index(cur, 'domba', 'idx_domba_ear_tag', 'ear_tag_id')
+
+
+@app.cli.command('migrasi')
+def migrasi_command():
+    """Jalankan migrasi skema database yang belum diterapkan."""
+    dijalankan = jalankan_migrasi(mysql.connection)
+    if dijalankan:
+        print(f"Skema diperbarui ke versi {dijalankan[-1]}.")
+    else:
+        print(f"Skema sudah versi terbaru ({versi_terbaru()}).")
+
+
+@app.route('/setup_admin')
+def setup_admin():
+    cur = mysql.connection.cursor()
+
+    if versi_sekarang(cur) < versi_terbaru():
+        cur.close()
+        return "Skema database belum terbaru. Jalankan dulu: flask --app app migrasi"
 
     cur.execute("SELECT * FROM users WHERE username = 'admin'")
     if not cur.fetchone():
@@ -254,52 +616,167 @@ def setup_admin():
         cur.execute("INSERT INTO users (username, password, role) VALUES ('admin', %s, 'admin')", (pw_hash,))
         mysql.connection.commit()
         cur.close()
-        return "Setup Berhasil! Akun: admin | Pass: admin123. Seluruh tabel lengkap berhasil dibuat!"
+        return "Setup Berhasil! Akun: admin | Pass: admin123."
 
     cur.close()
-    return "Setup sudah pernah dilakukan. Semua tabel berhasil dicek/ditambahkan."
+    return "Setup sudah pernah dilakukan. Akun admin sudah tersedia."
+
+
+@app.route('/admin/pool')
+@login_required
+@admin_only
+def status_pool():
+    return jsonify(mysql.pool.stats())
 
 
+@app.route('/admin/query_stats')
+@login_required
+@admin_only
+def admin_query_stats():
+    if request.args.get('reset'):
+        query_stats.reset()
+        flash('Statistik query direset.', 'warning')
+        return redirect(url_for('admin_query_stats'))
+
+    return render_template(
+        'query_stats.html',
+        statements=query_stats.teratas(),
+        lambat=list(query_stats.lambat),
+        slow_ms=query_stats.slow_ms,
+        pid=query_stats.pid
+    )
 
 
 # =========================================================
-# ROUTE MIGRASI DATABASE - Jalankan SEKALI jika ada error kolom
+# STATUS MIGRASI DATABASE
 # =========================================================
 @app.route('/migrasi_db')
+@login_required
+@admin_only
 def migrasi_db():
-    """Tambahkan kolom yang mungkin belum ada di tabel penjualan lama"""
+    """Tampilkan versi skema yang sudah dan belum diterapkan"""
     cur = mysql.connection.cursor()
-    pesan = []
-
-    kolom_baru = [
-        ("no_struk",       "ALTER TABLE penjualan ADD COLUMN no_struk VARCHAR(50) UNIQUE"),
-        ("no_hp",          "ALTER TABLE penjualan ADD COLUMN no_hp VARCHAR(20)"),
-        ("catatan",        "ALTER TABLE penjualan ADD COLUMN catatan TEXT"),
-        ("harga_per_ekor", "ALTER TABLE penjualan ADD COLUMN harga_per_ekor DECIMAL(15,2)"),
-        ("sisa_tagihan",   "ALTER TABLE penjualan ADD COLUMN sisa_tagihan DECIMAL(15,2) DEFAULT 0"),
-        ("terbayar",       "ALTER TABLE penjualan ADD COLUMN terbayar DECIMAL(15,2) DEFAULT 0"),
-        ("keterangan_domba","ALTER TABLE penjualan ADD COLUMN keterangan_domba TEXT"),
-    ]
-
-    for nama_kolom, sql_alter in kolom_baru:
-        try:
-            cur.execute(sql_alter)
-            mysql.connection.commit()
-            pesan.append(f"✅ Kolom '{nama_kolom}' berhasil ditambahkan")
-        except Exception as e:
-            if "Duplicate column" in str(e):
-                pesan.append(f"⏭️  Kolom '{nama_kolom}' sudah ada (skip)")
-            else:
-                pesan.append(f"❌ Kolom '{nama_kolom}' error: {str(e)}")
-
+    versi = versi_sekarang(cur)
+    cur.execute("SELECT versi, deskripsi, dijalankan FROM schema_version ORDER BY versi ASC")
+    riwayat = cur.fetchall()
     cur.close()
+
+    pesan = [f"✅ {v:04d} {desk} ({waktu})" for v, desk, waktu in riwayat]
+    pesan += [f"⏳ {v:04d} {MIGRASI[v][0]} (belum dijalankan)" for v in sorted(MIGRASI) if v > versi]
+
     return "<br>".join([
-        "<h2>Hasil Migrasi Database</h2>",
+        f"<h2>Versi Skema Database: {versi}</h2>",
         *pesan,
-        "<br><b>Selesai! Sekarang kunjungi <a href='/penjualan'>/penjualan</a></b>"
+        "<br><b>Migrasi dijalankan saat deploy: <code>flask --app app migrasi</code></b>"
     ])
 
 
+# =========================================================
+# VERSI DATA PER TABEL
+# =========================================================
+# Penghitung yang dinaikkan di transaksi yang sama dengan perubahan tabel.
+# Cache turunan di proses worker (mis. index gejala) cukup membandingkan
+# versinya lewat satu lookup primary key untuk tahu kapan harus dibangun ulang.
+# Setiap route tulis menaikkan versi tabel yang diubahnya; route baca yang
+# memakai @kondisional menjawab 304 selama versinya belum berubah.
+def naikkan_versi(cur, *tabel):
+    for t in tabel:
+        cur.execute("""
+            INSERT INTO versi_tabel (tabel, versi) VALUES (%s, 1)
+            ON DUPLICATE KEY UPDATE versi = versi + 1
+        """, (t,))
+
+
+def ambil_versi(cur, tabel):
+    cur.execute("SELECT versi FROM versi_tabel WHERE tabel = %s", (tabel,))
+    baris = cur.fetchone()
+    return baris[0] if baris else 0
+
+
+@app.template_global()
+def versi_data(*tabel):
+    """Versi tabel untuk kunci {% cache %}; versi_tabel dibaca sekali per request"""
+    if '_versi_tabel' not in g:
+        cur = mysql.connection.cursor()
+        cur.execute("SELECT tabel, versi FROM versi_tabel")
+        g._versi_tabel = dict(cur.fetchall())
+        cur.close()
+    return tuple(g._versi_tabel.get(t, 0) for t in tabel)
+
+
+def ambil_semua(query, params=None):
+    """Jalankan query dan kembalikan semua barisnya (untuk Tunda)"""
+    cur = mysql.connection.cursor()
+    cur.execute(query, params)
+    baris = cur.fetchall()
+    cur.close()
+    return baris
+
+
+def sidik_template():
+    """Sidik jari berkas template; berubah setiap deploy yang mengubah tampilan"""
+    h = hashlib.sha256()
+    folder = os.path.join(app.root_path, app.template_folder)
+    for akar, _, berkas in sorted(os.walk(folder)):
+        for nama in sorted(berkas):
+            st = os.stat(os.path.join(akar, nama))
+            h.update(f'{nama}:{st.st_mtime_ns}:{st.st_size};'.encode())
+    return h.hexdigest()[:12]
+
+
+SIDIK_TEMPLATE = sidik_template()
+
+
+def kondisional(*tabel, baris=None):
+    """Jawab 304 Not Modified jika data di balik halaman belum berubah.
+
+    ETag disusun dari versi_tabel untuk `tabel`, kolom versi satu baris
+    (`baris` = (tabel, kolom_id) dengan id dari argumen route), pengguna
+    yang login, sidik template dan manifest aset. Jika cocok dengan
+    If-None-Match, route tidak dijalankan sama sekali: tidak ada query ke
+    tabel data dan tidak ada render template. Halaman yang membawa pesan
+    flash selalu dirender dan tidak diberi ETag.
+    """
+    def dekorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            bagian = list(versi_data(*tabel))
+            if baris:
+                nama_tabel, kolom_id = baris
+                cur = mysql.connection.cursor()
+                cur.execute(f"SELECT versi FROM {nama_tabel} WHERE {kolom_id} = %s", (kwargs['id'],))
+                versi = cur.fetchone()
+                cur.close()
+                if versi is None:
+                    # Baris sudah dihapus: biarkan route menangani (redirect/flash)
+                    return f(*args, **kwargs)
+                bagian.append(versi[0])
+            try:
+                mtime_manifest = os.path.getmtime(manifest_aset.path)
+            except OSError:
+                mtime_manifest = 0
+            bagian += [session.get('id'), session.get('username'), session.get('role'),
+                       SIDIK_TEMPLATE, mtime_manifest]
+            etag = hashlib.sha256(
+                f'{request.endpoint}:{bagian}'.encode()
+            ).hexdigest()[:20]
+
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return dekorator
+
+
 # =========================================================
 # 1. SISTEM LOGIN & LOGOUT
 # =========================================================
@@ -335,54 +812,432 @@ def logout():
 # =========================================================
 # 2. DASHBOARD UTAMA
 # =========================================================
-@app.route('/')
-@login_required
-def dashboard():
+
+# Snapshot statistik populasi (satu baris, id = 1) dan agregat per kamar
+# (statistik_kamar). Keduanya diperbarui secara inkremental setiap kali
+# data domba berubah, sehingga dashboard dan halaman kandang cukup membaca
+# beberapa baris lewat primary key, bukan menghitung ulang tabel domba.
+KOLOM_STATISTIK = "total, jantan, betina, total_berat, jumlah_ditimbang"
+KOLOM_KONTRIBUSI = "jenis_kelamin, berat_kg, lokasi_kandang, nomor_kamar"
+
+
+def ambil_kontribusi(cur, id_domba):
+    """Kunci baris domba dan ambil kolom yang mempengaruhi statistik"""
+    cur.execute(f"SELECT {KOLOM_KONTRIBUSI} FROM domba WHERE id = %s FOR UPDATE", (id_domba,))
+    return cur.fetchone()
+
+
+def delta_statistik(domba, arah):
+    jk, berat, lokasi, kamar = domba
+    ditimbang = 1 if berat not in (None, '') else 0
+    return (
+        arah,
+        arah if jk == 'Jantan' else 0,
+        arah if jk == 'Betina' else 0,
+        arah * float(berat) if ditimbang else 0,
+        arah * ditimbang
+    )
+
+
+def perbarui_statistik(cur, domba, arah):
+    """Tambahkan (arah=1) atau kurangi (arah=-1) kontribusi satu domba.
+
+    `domba` berisi (jenis_kelamin, berat_kg, lokasi_kandang, nomor_kamar).
+    """
+    jk, berat, lokasi, kamar = domba
+    delta = delta_statistik(domba, arah)
+    cur.execute("""
+        UPDATE statistik_domba
+        SET total = total + %s,
+            jantan = jantan + %s,
+            betina = betina + %s,
+            total_berat = total_berat + %s,
+            jumlah_ditimbang = jumlah_ditimbang + %s
+        WHERE id = 1
+    """, delta)
+
+    kamar = int(kamar or 0)
+    cur.execute("""
+        INSERT INTO statistik_kamar
+            (lokasi_kandang, nomor_kamar, jumlah, jantan, betina, total_berat, jumlah_ditimbang)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            jumlah = jumlah + VALUES(jumlah),
+            jantan = jantan + VALUES(jantan),
+            betina = betina + VALUES(betina),
+            total_berat = total_berat + VALUES(total_berat),
+            jumlah_ditimbang = jumlah_ditimbang + VALUES(jumlah_ditimbang)
+    """, (lokasi, kamar) + delta)
+    if arah < 0:
+        cur.execute("""
+            DELETE FROM statistik_kamar
+            WHERE lokasi_kandang = %s AND nomor_kamar = %s AND jumlah <= 0
+        """, (lokasi, kamar))
+
+
+def perbarui_statistik_massal(cur, daftar_domba, arah):
+    """Seperti perbarui_statistik untuk banyak domba sekaligus: satu UPDATE
+    snapshot dan satu upsert per kamar, berapa pun jumlah dombanya"""
+    total = [0] * 5
+    per_kamar = {}
+    for domba in daftar_domba:
+        delta = delta_statistik(domba, arah)
+        kunci = (domba[2], int(domba[3] or 0))
+        kamar = per_kamar.setdefault(kunci, [0] * 5)
+        for i, d in enumerate(delta):
+            total[i] += d
+            kamar[i] += d
+    if not per_kamar:
+        return
+
+    cur.execute("""
+        UPDATE statistik_domba
+        SET total = total + %s,
+            jantan = jantan + %s,
+            betina = betina + %s,
+            total_berat = total_berat + %s,
+            jumlah_ditimbang = jumlah_ditimbang + %s
+        WHERE id = 1
+    """, total)
+    cur.executemany("""
+        INSERT INTO statistik_kamar
+            (lokasi_kandang, nomor_kamar, jumlah, jantan, betina, total_berat, jumlah_ditimbang)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            jumlah = jumlah + VALUES(jumlah),
+            jantan = jantan + VALUES(jantan),
+            betina = betina + VALUES(betina),
+            total_berat = total_berat + VALUES(total_berat),
+            jumlah_ditimbang = jumlah_ditimbang + VALUES(jumlah_ditimbang)
+    """, [kunci + tuple(delta) for kunci, delta in per_kamar.items()])
+    if arah < 0:
+        cur.execute("DELETE FROM statistik_kamar WHERE jumlah <= 0")
+
+
+def rebuild_statistik(cur):
+    """Hitung ulang snapshot statistik dan agregat kamar dari tabel domba"""
+    cur.execute(f"""
+        REPLACE INTO statistik_domba (id, {KOLOM_STATISTIK})
+        SELECT 1,
+               COUNT(*),
+               COALESCE(SUM(jenis_kelamin = 'Jantan'), 0),
+               COALESCE(SUM(jenis_kelamin = 'Betina'), 0),
+               COALESCE(SUM(berat_kg), 0),
+               COUNT(berat_kg)
+        FROM domba
+    """)
+    cur.execute("DELETE FROM statistik_kamar")
+    cur.execute("""
+        INSERT INTO statistik_kamar
+            (lokasi_kandang, nomor_kamar, jumlah, jantan, betina, total_berat, jumlah_ditimbang)
+        SELECT lokasi_kandang,
+               COALESCE(nomor_kamar, 0),
+               COUNT(*),
+               SUM(jenis_kelamin = 'Jantan'),
+               SUM(jenis_kelamin = 'Betina'),
+               COALESCE(SUM(berat_kg), 0),
+               COUNT(berat_kg)
+        FROM domba
+        WHERE lokasi_kandang IS NOT NULL
+        GROUP BY 1, 2
+    """)
+
+
+def daftar_kandang(cur):
+    """Semua kandang beserta jumlah penghuninya dari statistik_kamar"""
+    cur.execute("""
+        SELECT k.id, k.nama, COALESCE(SUM(s.jumlah), 0)
+        FROM kandang k
+        LEFT JOIN statistik_kamar s ON s.lokasi_kandang = k.nama
+        GROUP BY k.id, k.nama
+        ORDER BY k.id ASC
+    """)
+    return cur.fetchall()
+
+
+# Gaya tampilan kandang dipilih dari id-nya (urutan dibuat), bukan dari nama,
+# sehingga kandang baru dari tambah_kandang langsung mendapat warna sendiri.
+# Class ditulis lengkap di sini agar ikut terbaca purge Tailwind.
+PALET_KANDANG = (
+    {'ikon': 'fa-arrow-left', 'lencana': 'bg-dombaYellow text-dombaGreen', 'aksen': 'text-dombaYellow',
+     'kartu': 'bg-dombaYellow text-dombaGreen', 'garis': 'border-dombaYellow',
+     'label': 'bg-yellow-100 text-yellow-700', 'tag': 'bg-[#2D5A27] text-yellow-400',
+     'angka': 'text-yellow-500', 'hex': '#0f4c3a'},
+    {'ikon': 'fa-arrow-right', 'lencana': 'bg-blue-500 text-white', 'aksen': 'text-blue-500',
+     'kartu': 'bg-blue-600 text-white', 'garis': 'border-blue-500',
+     'label': 'bg-blue-100 text-blue-700', 'tag': 'bg-blue-600 text-white',
+     'angka': 'text-blue-500', 'hex': '#1d4ed8'},
+    {'ikon': 'fa-warehouse', 'lencana': 'bg-emerald-500 text-white', 'aksen': 'text-emerald-500',
+     'kartu': 'bg-emerald-600 text-white', 'garis': 'border-emerald-500',
+     'label': 'bg-emerald-100 text-emerald-700', 'tag': 'bg-emerald-600 text-white',
+     'angka': 'text-emerald-500', 'hex': '#047857'},
+    {'ikon': 'fa-warehouse', 'lencana': 'bg-purple-500 text-white', 'aksen': 'text-purple-500',
+     'kartu': 'bg-purple-600 text-white', 'garis': 'border-purple-500',
+     'label': 'bg-purple-100 text-purple-700', 'tag': 'bg-purple-600 text-white',
+     'angka': 'text-purple-500', 'hex': '#7e22ce'},
+    {'ikon': 'fa-warehouse', 'lencana': 'bg-rose-500 text-white', 'aksen': 'text-rose-500',
+     'kartu': 'bg-rose-600 text-white', 'garis': 'border-rose-500',
+     'label': 'bg-rose-100 text-rose-700', 'tag': 'bg-rose-600 text-white',
+     'angka': 'text-rose-500', 'hex': '#be123c'},
+)
+# Lokasi yang tidak (lagi) terdaftar di tabel kandang
+GAYA_KANDANG_LAIN = {
+    'ikon': 'fa-warehouse', 'lencana': 'bg-gray-500 text-white', 'aksen': 'text-gray-500',
+    'kartu': 'bg-gray-600 text-white', 'garis': 'border-gray-400',
+    'label': 'bg-gray-100 text-gray-600', 'tag': 'bg-gray-500 text-white',
+    'angka': 'text-gray-500', 'hex': '#4b5563',
+}
+
+
+@app.template_global()
+def gaya_kandang(nama):
+    """Gaya tampilan kandang `nama`; id semua kandang dibaca sekali per request"""
+    if '_id_kandang' not in g:
+        cur = mysql.connection.cursor()
+        cur.execute("SELECT nama, id FROM kandang")
+        g._id_kandang = dict(cur.fetchall())
+        cur.close()
+    id = g._id_kandang.get(nama)
+    if id is None:
+        return GAYA_KANDANG_LAIN
+    return PALET_KANDANG[(id - 1) % len(PALET_KANDANG)]
+
+
+@app.cli.command('rebuild-statistik')
+def rebuild_statistik_command():
+    """Hitung ulang snapshot statistik populasi dan agregat kamar dari awal."""
     cur = mysql.connection.cursor()
+    rebuild_statistik(cur)
+    mysql.connection.commit()
+    cur.close()
+    print("Snapshot statistik populasi berhasil dihitung ulang.")
 
-    cur.execute("SELECT * FROM domba ORDER BY lokasi_kandang ASC, nomor_kamar ASC")
-    data_domba = cur.fetchall()
 
-    cur.execute("SELECT COUNT(*) FROM domba")
-    total_domba = cur.fetchone()[0]
+# Riwayat timbangan. Setiap pembacaan berat disimpan di riwayat_berat dan
+# sekaligus diakumulasikan ke rekap mingguan/bulanan per kandang, sehingga
+# grafik tren cukup membaca beberapa baris rekap tanpa memindai riwayat.
+PERIODE_REKAP_BERAT = ('mingguan', 'bulanan')
+
+
+def awal_periode(waktu, periode):
+    """Tanggal awal minggu (Senin) atau awal bulan dari sebuah waktu"""
+    tgl = waktu.date() if isinstance(waktu, datetime) else waktu
+    if periode == 'mingguan':
+        return tgl - timedelta(days=tgl.weekday())
+    return tgl.replace(day=1)
+
+
+def catat_berat(cur, id_domba, berat, lokasi, waktu=None):
+    """Simpan satu pembacaan berat dan perbarui rekap mingguan/bulanan"""
+    if berat in (None, ''):
+        return
+    waktu = waktu or datetime.now()
+    cur.execute("""
+        INSERT INTO riwayat_berat (id_domba, berat_kg, lokasi_kandang, waktu)
+        VALUES (%s, %s, %s, %s)
+    """, (id_domba, berat, lokasi, waktu))
+    for periode in PERIODE_REKAP_BERAT:
+        cur.execute(f"""
+            INSERT INTO rekap_berat_{periode} (periode, lokasi_kandang, jumlah_timbang, total_berat)
+            VALUES (%s, %s, 1, %s)
+            ON DUPLICATE KEY UPDATE
+                jumlah_timbang = jumlah_timbang + 1,
+                total_berat = total_berat + VALUES(total_berat)
+        """, (awal_periode(waktu, periode), lokasi, berat))
+
+
+def catat_berat_massal(cur, bacaan, waktu=None):
+    """Versi massal catat_berat. `bacaan` berisi (id_domba, berat, lokasi);
+    riwayat ditulis dengan executemany dan rekap diakumulasikan per
+    (periode, kandang) sebelum di-upsert"""
+    bacaan = [b for b in bacaan if b[1] not in (None, '')]
+    if not bacaan:
+        return
+    waktu = waktu or datetime.now()
+    cur.executemany("""
+        INSERT INTO riwayat_berat (id_domba, berat_kg, lokasi_kandang, waktu)
+        VALUES (%s, %s, %s, %s)
+    """, [(id_domba, berat, lokasi, waktu) for id_domba, berat, lokasi in bacaan])
+
+    for periode in PERIODE_REKAP_BERAT:
+        awal = awal_periode(waktu, periode)
+        rekap = {}
+        for _, berat, lokasi in bacaan:
+            jumlah, total = rekap.get(lokasi, (0, 0.0))
+            rekap[lokasi] = (jumlah + 1, total + float(berat))
+        cur.executemany(f"""
+            INSERT INTO rekap_berat_{periode} (periode, lokasi_kandang, jumlah_timbang, total_berat)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                jumlah_timbang = jumlah_timbang + VALUES(jumlah_timbang),
+                total_berat = total_berat + VALUES(total_berat)
+        """, [(awal, lokasi, jumlah, total) for lokasi, (jumlah, total) in rekap.items()])
+
+
+def rebuild_rekap_berat(cur):
+    """Hitung ulang rekap mingguan dan bulanan dari seluruh riwayat_berat"""
+    awal = {
+        'mingguan': "DATE_SUB(DATE(waktu), INTERVAL WEEKDAY(waktu) DAY)",
+        'bulanan': "DATE_SUB(DATE(waktu), INTERVAL DAYOFMONTH(waktu) - 1 DAY)",
+    }
+    for periode in PERIODE_REKAP_BERAT:
+        cur.execute(f"DELETE FROM rekap_berat_{periode}")
+        cur.execute(f"""
+            INSERT INTO rekap_berat_{periode} (periode, lokasi_kandang, jumlah_timbang, total_berat)
+            SELECT {awal[periode]}, lokasi_kandang, COUNT(*), SUM(berat_kg)
+            FROM riwayat_berat
+            WHERE berat_kg IS NOT NULL
+            GROUP BY 1, 2
+        """)
+
+
+def tren_berat(cur, periode, lokasi=None, jumlah=8):
+    """Label dan rata-rata berat untuk `jumlah` periode terakhir"""
+    query = f"""
+        SELECT periode, SUM(total_berat) / SUM(jumlah_timbang)
+        FROM rekap_berat_{periode}
+    """
+    params = []
+    if lokasi:
+        query += " WHERE lokasi_kandang = %s"
+        params.append(lokasi)
+    query += " GROUP BY periode ORDER BY periode DESC LIMIT %s"
+    params.append(jumlah)
+
+    cur.execute(query, params)
+    rows = list(reversed(cur.fetchall()))
+    format_label = '%d/%m' if periode == 'mingguan' else '%b %Y'
+    return (
+        [r[0].strftime(format_label) for r in rows],
+        [round(float(r[1]), 2) for r in rows]
+    )
+
+
+@app.cli.command('rebuild-rekap-berat')
+def rebuild_rekap_berat_command():
+    """Hitung ulang rekap berat mingguan dan bulanan dari riwayat timbangan."""
+    cur = mysql.connection.cursor()
+    rebuild_rekap_berat(cur)
+    mysql.connection.commit()
+    cur.close()
+    print("Rekap berat mingguan dan bulanan berhasil dihitung ulang.")
 
-    cur.execute("SELECT COUNT(*) FROM domba WHERE jenis_kelamin = 'Jantan'")
-    total_jantan = cur.fetchone()[0]
 
-    cur.execute("SELECT COUNT(*) FROM domba WHERE jenis_kelamin = 'Betina'")
-    total_betina = cur.fetchone()[0]
+@app.route('/')
+@login_required
+def dashboard():
+    cur = mysql.connection.cursor()
 
-    cur.execute("SELECT COUNT(*) FROM domba WHERE lokasi_kandang = 'Barat'")
-    total_barat = cur.fetchone()[0]
+    cur.execute(f"SELECT {KOLOM_STATISTIK} FROM statistik_domba WHERE id = 1")
+    statistik = cur.fetchone()
+    if not statistik:
+        rebuild_statistik(cur)
+        mysql.connection.commit()
+        cur.execute(f"SELECT {KOLOM_STATISTIK} FROM statistik_domba WHERE id = 1")
+        statistik = cur.fetchone()
 
-    cur.execute("SELECT COUNT(*) FROM domba WHERE lokasi_kandang = 'Timur'")
-    total_timur = cur.fetchone()[0]
+    total_domba, total_jantan, total_betina, total_berat, ditimbang = statistik
+    avg_berat = total_berat / ditimbang if ditimbang else 0
 
-    cur.execute("SELECT AVG(berat_kg) FROM domba")
-    avg_berat_val = cur.fetchone()[0]
-    avg_berat = avg_berat_val if avg_berat_val else 0
+    kandang_list = daftar_kandang(cur)
 
-    labels = ["Minggu 1", "Minggu 2", "Minggu 3", "Minggu 4"]
-    weights = [
-        float(avg_berat) * 0.85,
-        float(avg_berat) * 0.90,
-        float(avg_berat) * 0.95,
-        float(avg_berat)
-    ]
+    labels, weights = tren_berat(cur, 'mingguan')
+    labels_bulanan, weights_bulanan = tren_berat(cur, 'bulanan', jumlah=12)
 
     cur.close()
 
     return render_template(
         'index.html',
-        domba_list=data_domba,
         total=total_domba,
         jantan=total_jantan,
         betina=total_betina,
-        barat=total_barat,
-        timur=total_timur,
+        kandang_list=kandang_list,
+        terpadat=max(kandang_list, key=lambda k: k[2]) if kandang_list else None,
         rata_rata=round(avg_berat, 2),
         chart_labels=labels,
-        chart_data=weights
+        chart_data=weights,
+        chart_labels_bulanan=labels_bulanan,
+        chart_data_bulanan=weights_bulanan
+    )
+
+
+# Tabel inventaris di dashboard dimuat bertahap lewat endpoint JSON ini
+# memakai keyset pagination pada (lokasi_kandang, nomor_kamar, id) yang
+# didukung index idx_domba_kandang_kamar, sehingga halaman berikutnya
+# tidak perlu OFFSET dan biayanya tetap walau populasi bertambah.
+KEYSET_DOMBA = ("lokasi_kandang", "nomor_kamar", "id")
+BATAS_HALAMAN_DOMBA = 50
+
+
+def encode_cursor(nilai):
+    return base64.urlsafe_b64encode(json.dumps(nilai).encode()).decode()
+
+
+def decode_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+
+def kondisi_keyset(kolom, nilai):
+    """Bangun klausa WHERE "baris sesudah `nilai`" untuk urutan ASC.
+
+    NULL diperlakukan paling awal, sama seperti ORDER BY ASC di MySQL.
+    """
+    sql, params = None, []
+    for k, v in reversed(list(zip(kolom, nilai))):
+        if v is None:
+            lebih, sama, p = f"{k} IS NOT NULL", f"{k} IS NULL", []
+        else:
+            lebih, sama, p = f"{k} > %s", f"{k} = %s", [v]
+        if sql is None:
+            sql, params = lebih, p
+        else:
+            sql, params = f"({lebih} OR ({sama} AND {sql}))", p + p + params
+    return sql, params
+
+
+@app.route('/api/domba')
+@login_required
+def api_domba():
+    limit = max(1, min(request.args.get('limit', BATAS_HALAMAN_DOMBA, type=int), 200))
+    cursor = request.args.get('cursor')
+
+    query = """
+        SELECT id, nama_domba, jenis_kelamin, berat_kg, ear_tag_id, jenis_domba, lokasi_kandang, nomor_kamar
+        FROM domba
+    """
+    params = []
+    if cursor:
+        try:
+            kondisi, params = kondisi_keyset(KEYSET_DOMBA, decode_cursor(cursor))
+        except (ValueError, TypeError):
+            return jsonify(error='cursor tidak valid'), 400
+        query += f" WHERE {kondisi}"
+    query += " ORDER BY lokasi_kandang ASC, nomor_kamar ASC, id ASC LIMIT %s"
+    params.append(limit + 1)
+
+    cur = mysql.connection.cursor()
+    cur.execute(query, params)
+    rows = cur.fetchall()
+    cur.close()
+
+    berikutnya = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        terakhir = rows[-1]
+        berikutnya = encode_cursor([terakhir[6], terakhir[7], terakhir[0]])
+
+    return jsonify(
+        data=[{
+            'id': d[0],
+            'nama_domba': d[1],
+            'jenis_kelamin': d[2],
+            'berat_kg': float(d[3]) if d[3] is not None else None,
+            'ear_tag_id': d[4],
+            'jenis_domba': d[5],
+            'lokasi_kandang': d[6],
+            'nomor_kamar': d[7],
+        } for d in rows],
+        next=berikutnya
     )
 
 
@@ -416,6 +1271,7 @@ def register():
                 "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
                 (username, password, role)
             )
+            naikkan_versi(cur, 'users')
             mysql.connection.commit()
             flash(f'User {username} berhasil didaftarkan!', 'success')
             return redirect(url_for('list_users'))
@@ -436,6 +1292,7 @@ def hapus_user(id):
     else:
         cur = mysql.connection.cursor()
         cur.execute("DELETE FROM users WHERE id = %s", (id,))
+        naikkan_versi(cur, 'users')
         mysql.connection.commit()
         cur.close()
         flash('Akun karyawan berhasil dihapus.', 'warning')
@@ -464,7 +1321,7 @@ def tugas():
         catatan = request.form.get('catatan', '')
 
         if not lokasi:
-            flash('Gagal! Harap pilih lokasi kandang (Barat/Timur).', 'danger')
+            flash('Gagal! Harap pilih lokasi kandang.', 'danger')
             return redirect(url_for('tugas'))
 
         try:
@@ -475,6 +1332,7 @@ def tugas():
                 )
                 VALUES (%s, CURDATE(), %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """, (session['id'], lokasi, buat, beri, sapu, cukur, disin, tandon, garam, catatan))
+            naikkan_versi(cur, 'log_kerja')
             mysql.connection.commit()
             flash(f'Laporan tugas untuk Kandang {lokasi} berhasil dikirim!', 'success')
         except Exception as e:
@@ -496,8 +1354,9 @@ def tugas():
         """, (session['id'],))
 
     logs = cur.fetchall()
+    kandang_list = daftar_kandang(cur)
     cur.close()
-    return render_template('tugas.html', logs=logs)
+    return render_template('tugas.html', logs=logs, kandang_list=kandang_list)
 
 
 # =========================================================
@@ -529,92 +1388,267 @@ def laporan_tugas():
         """, (session['id'],))
 
     logs = cur.fetchall()
+    kandang_list = daftar_kandang(cur)
     cur.close()
-    return render_template('laporan_tugas.html', logs=logs)
+    return render_template('laporan_tugas.html', logs=logs, kandang_list=kandang_list)
 
 
 # =========================================================
 # 5. HALAMAN KANDANG DETAIL
 # =========================================================
-@app.route('/kandang/barat')
+@app.route('/kandang/<int:id>')
 @login_required
-def kandang_barat():
+def kandang_detail(id):
     cur = mysql.connection.cursor()
 
-    cur.execute("SELECT * FROM domba WHERE lokasi_kandang = 'Barat' ORDER BY nomor_kamar ASC")
+    cur.execute("""
+        SELECT k.nama, s.nomor_kamar, s.jumlah, s.jantan, s.betina, s.total_berat, s.jumlah_ditimbang
+        FROM kandang k
+        LEFT JOIN statistik_kamar s ON s.lokasi_kandang = k.nama
+        WHERE k.id = %s
+        ORDER BY s.nomor_kamar ASC
+    """, (id,))
+    stats = cur.fetchall()
+
+    if not stats:
+        cur.close()
+        flash('Kandang tidak ditemukan!', 'danger')
+        return redirect(url_for('dashboard'))
+
+    lokasi = stats[0][0]
+    kamar = [{
+        'nomor': s[1],
+        'jumlah': s[2],
+        'jantan': s[3],
+        'betina': s[4],
+        'rata_rata': round(float(s[5]) / s[6], 2) if s[6] else 0,
+    } for s in stats if s[1] is not None]
+
+    cur.execute("SELECT * FROM domba WHERE lokasi_kandang = %s ORDER BY nomor_kamar ASC", (lokasi,))
     data_domba = cur.fetchall()
 
     cur.execute("""
         SELECT l.*, u.username FROM log_kerja l 
         JOIN users u ON l.user_id = u.id 
-        WHERE l.lokasi_kandang = 'Barat' ORDER BY l.tanggal DESC LIMIT 5
-    """)
+        WHERE l.lokasi_kandang = %s ORDER BY l.tanggal DESC LIMIT 5
+    """, (lokasi,))
     logs_kandang = cur.fetchall()
 
-    cur.execute("SELECT COUNT(*) FROM domba WHERE lokasi_kandang = 'Barat'")
-    total = cur.fetchone()[0]
-
-    cur.execute("""
-        SELECT nomor_kamar, AVG(berat_kg) 
-        FROM domba 
-        WHERE lokasi_kandang = 'Barat' 
-        GROUP BY nomor_kamar
-    """)
-    stats = cur.fetchall()
+    tren_labels, tren_data = tren_berat(cur, 'mingguan', lokasi=lokasi)
     cur.close()
 
+    terberat = max(kamar, key=lambda k: k['rata_rata']) if kamar else None
+
     return render_template(
         'kandang_detail.html',
         domba_list=data_domba,
         logs_kandang=logs_kandang,
-        lokasi="Barat",
-        total=total,
-        kamar_labels=[str(s[0]) for s in stats],
-        kamar_weights=[float(s[1]) for s in stats]
+        lokasi=lokasi,
+        total=sum(k['jumlah'] for k in kamar),
+        kamar_list=kamar,
+        kamar_terberat=terberat,
+        kamar_labels=[str(k['nomor']) for k in kamar],
+        kamar_weights=[k['rata_rata'] for k in kamar],
+        tren_labels=tren_labels,
+        tren_data=tren_data,
+        kandang_id=id
     )
 
 
-@app.route('/kandang/timur')
+@app.route('/kandang/<nama>')
 @login_required
-def kandang_timur():
+def kandang_by_nama(nama):
+    """Alias URL lama /kandang/barat dan /kandang/timur"""
     cur = mysql.connection.cursor()
+    cur.execute("SELECT id FROM kandang WHERE nama = %s", (nama,))
+    kandang = cur.fetchone()
+    cur.close()
 
-    cur.execute("SELECT * FROM domba WHERE lokasi_kandang = 'Timur' ORDER BY nomor_kamar ASC")
-    data_domba = cur.fetchall()
+    if not kandang:
+        flash('Kandang tidak ditemukan!', 'danger')
+        return redirect(url_for('dashboard'))
+    return redirect(url_for('kandang_detail', id=kandang[0]))
 
-    cur.execute("""
-        SELECT l.*, u.username FROM log_kerja l 
-        JOIN users u ON l.user_id = u.id 
-        WHERE l.lokasi_kandang = 'Timur' ORDER BY l.tanggal DESC LIMIT 5
-    """)
-    logs_kandang = cur.fetchall()
 
-    cur.execute("SELECT COUNT(*) FROM domba WHERE lokasi_kandang = 'Timur'")
-    total = cur.fetchone()[0]
+@app.route('/tambah_kandang', methods=['POST'])
+@login_required
+@admin_only
+def tambah_kandang():
+    nama = request.form.get('nama', '').strip()
+    if not nama:
+        flash('Nama kandang wajib diisi!', 'danger')
+        return redirect(url_for('dashboard'))
 
-    cur.execute("""
-        SELECT nomor_kamar, AVG(berat_kg) 
-        FROM domba 
-        WHERE lokasi_kandang = 'Timur' 
-        GROUP BY nomor_kamar
-    """)
-    stats = cur.fetchall()
-    cur.close()
+    cur = mysql.connection.cursor()
+    try:
+        cur.execute(
+            "INSERT INTO kandang (nama, keterangan) VALUES (%s, %s)",
+            (nama, request.form.get('keterangan', '').strip())
+        )
+        naikkan_versi(cur, 'kandang')
+        mysql.connection.commit()
+        flash(f'Kandang {nama} berhasil ditambahkan!', 'success')
+    except Exception:
+        flash('Nama kandang sudah digunakan!', 'danger')
+    finally:
+        cur.close()
 
-    return render_template(
-        'kandang_detail.html',
-        domba_list=data_domba,
-        logs_kandang=logs_kandang,
-        lokasi="Timur",
-        total=total,
-        kamar_labels=[str(s[0]) for s in stats],
-        kamar_weights=[float(s[1]) for s in stats]
-    )
+    return redirect(url_for('dashboard'))
+
+
+# Hari timbang: seluruh isi kandang ditimbang lalu dikirim sekaligus.
+# Semua bacaan diterapkan dalam satu transaksi (satu UPDATE ... CASE per
+# batch), dicatat ke riwayat_berat, dan pertambahan berat dihitung dari
+# timbangan sebelumnya di riwayat.
+BATCH_TIMBANG = 200
+
+
+def timbangan_terakhir(cur, ids):
+    """{id_domba: (berat_kg, waktu)} timbangan terakhir setiap domba (index id_domba, waktu)"""
+    hasil = {}
+    for i in range(0, len(ids), BATCH_TIMBANG):
+        potongan = ids[i:i + BATCH_TIMBANG]
+        penanda = ", ".join(["%s"] * len(potongan))
+        cur.execute(f"""
+            SELECT r.id_domba, r.berat_kg, r.waktu
+            FROM riwayat_berat r
+            JOIN (
+                SELECT id_domba, MAX(waktu) AS waktu FROM riwayat_berat
+                WHERE id_domba IN ({penanda})
+                GROUP BY id_domba
+            ) t ON t.id_domba = r.id_domba AND t.waktu = r.waktu
+        """, potongan)
+        hasil.update((r[0], (r[1], r[2])) for r in cur.fetchall())
+    return hasil
+
+
+@app.route('/kandang/<int:id>/timbang')
+@login_required
+@admin_only
+def timbang_kandang(id):
+    cur = mysql.connection.cursor()
+    cur.execute("SELECT nama FROM kandang WHERE id = %s", (id,))
+    kandang = cur.fetchone()
+    if not kandang:
+        cur.close()
+        flash('Kandang tidak ditemukan!', 'danger')
+        return redirect(url_for('dashboard'))
+
+    cur.execute("""
+        SELECT id, nama_domba, ear_tag_id, nomor_kamar, berat_kg
+        FROM domba WHERE lokasi_kandang = %s
+        ORDER BY nomor_kamar ASC, nama_domba ASC
+    """, (kandang[0],))
+    domba_list = cur.fetchall()
+    terakhir = timbangan_terakhir(cur, [d[0] for d in domba_list])
+    cur.close()
+
+    return render_template(
+        'timbang.html',
+        kandang_id=id,
+        lokasi=kandang[0],
+        domba_list=domba_list,
+        terakhir=terakhir
+    )
+
+
+@app.route('/api/kandang/<int:id>/timbang', methods=['POST'])
+@login_required
+@admin_only
+def api_timbang_kandang(id):
+    """Terima {"bacaan": [{"id" | "ear_tag": ..., "berat": ...}, ...]} untuk satu kandang"""
+    data = request.get_json(silent=True)
+    bacaan = data.get('bacaan') if isinstance(data, dict) else None
+    if not isinstance(bacaan, list):
+        return jsonify({'error': 'Format tidak valid, harap kirim {"bacaan": [...]}'}), 400
+    if not bacaan:
+        return jsonify({'error': 'Tidak ada bacaan timbangan'}), 400
+
+    cur = mysql.connection.cursor()
+    try:
+        cur.execute("SELECT nama FROM kandang WHERE id = %s", (id,))
+        kandang = cur.fetchone()
+        if not kandang:
+            return jsonify({'error': 'Kandang tidak ditemukan'}), 404
+        lokasi = kandang[0]
+
+        # Kunci seluruh domba di kandang ini selama transaksi
+        cur.execute(f"""
+            SELECT id, nama_domba, ear_tag_id, {KOLOM_KONTRIBUSI}
+            FROM domba WHERE lokasi_kandang = %s FOR UPDATE
+        """, (lokasi,))
+        domba = {r[0]: r for r in cur.fetchall()}
+        per_ear_tag = {r[2]: r[0] for r in domba.values() if r[2] and r[2] != '-'}
+
+        baru, galat = {}, []
+        for i, b in enumerate(bacaan):
+            if not isinstance(b, dict):
+                galat.append({'baris': i, 'pesan': 'bacaan harus berupa objek'})
+                continue
+            id_domba = b.get('id') or per_ear_tag.get(str(b.get('ear_tag', '')).strip())
+            try:
+                id_domba = int(id_domba)
+                berat = round(float(str(b.get('berat')).replace(',', '.')), 2)
+            except (TypeError, ValueError):
+                galat.append({'baris': i, 'pesan': 'domba atau berat tidak valid'})
+                continue
+            if id_domba not in domba:
+                galat.append({'baris': i, 'pesan': f'domba {id_domba} tidak ada di kandang {lokasi}'})
+            elif not 0 < berat < 500:
+                galat.append({'baris': i, 'pesan': f'berat {berat} di luar rentang wajar'})
+            else:
+                baru[id_domba] = berat
+        if galat:
+            return jsonify({'error': 'Sebagian bacaan tidak valid, tidak ada yang disimpan', 'galat': galat}), 400
+
+        ids = list(baru)
+        sebelumnya = timbangan_terakhir(cur, ids)
+        for i in range(0, len(ids), BATCH_TIMBANG):
+            potongan = ids[i:i + BATCH_TIMBANG]
+            kasus = " ".join(["WHEN %s THEN %s"] * len(potongan))
+            cur.execute(f"""
+                UPDATE domba
+                SET berat_kg = CASE id {kasus} END,
+                    versi = versi + 1
+                WHERE id IN ({", ".join(["%s"] * len(potongan))})
+            """, [v for id_domba in potongan for v in (id_domba, baru[id_domba])] + potongan)
+
+        # Kontribusi lama dikurangi, kontribusi dengan berat baru ditambahkan
+        perbarui_statistik_massal(cur, [domba[i][3:] for i in ids], -1)
+        perbarui_statistik_massal(cur, [(domba[i][3], baru[i], domba[i][5], domba[i][6]) for i in ids], 1)
+
+        waktu = datetime.now()
+        catat_berat_massal(cur, [(i, baru[i], lokasi) for i in ids], waktu)
+        naikkan_versi(cur, 'domba', 'riwayat_berat')
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cur.close()
+
+    hasil = []
+    for i in ids:
+        berat_lama, waktu_lama = sebelumnya.get(i, (None, None))
+        pertambahan = round(baru[i] - float(berat_lama), 2) if berat_lama is not None else None
+        hari = (waktu - waktu_lama).total_seconds() / 86400 if waktu_lama else None
+        hasil.append({
+            'id': i,
+            'nama': domba[i][1],
+            'ear_tag': domba[i][2],
+            'berat': baru[i],
+            'berat_sebelumnya': float(berat_lama) if berat_lama is not None else None,
+            'pertambahan': pertambahan,
+            'hari': round(hari, 1) if hari is not None else None,
+            'adg_gram': round(pertambahan * 1000 / hari) if pertambahan is not None and hari and hari >= 1 else None,
+        })
+
+    return jsonify({'kandang': lokasi, 'jumlah': len(hasil), 'data': hasil})
 
 
 # =========================================================
-# 6. CRUD DOMBA
-# =========================================================
+# 6. CRUD DOMBA
+# =========================================================
 @app.route('/tambah', methods=['GET', 'POST'])
 @login_required
 @admin_only
@@ -639,13 +1673,112 @@ def tambah_ternak():
             INSERT INTO log_populasi (id_domba, tipe_mutasi, alasan, tanggal) 
             VALUES (%s, 'Masuk', 'Pembelian/Kelahiran', CURDATE())
         """, (new_id,))
+        perbarui_statistik(
+            cur, (request.form['jk'], request.form['berat'], request.form['lokasi'], request.form['kamar']), 1
+        )
+        catat_berat(cur, new_id, request.form['berat'], request.form['lokasi'])
 
+        naikkan_versi(cur, 'domba', 'log_populasi', 'riwayat_berat')
         mysql.connection.commit()
         cur.close()
         flash('Data Domba berhasil ditambahkan!', 'success')
         return redirect(url_for('dashboard'))
 
-    return render_template('tambah.html')
+    cur = mysql.connection.cursor()
+    kandang_list = daftar_kandang(cur)
+    cur.close()
+    return render_template('tambah.html', kandang_list=kandang_list)
+
+
+# Impor massal: semua baris divalidasi dulu; jika ada satu saja yang salah
+# tidak ada yang disimpan. Baris valid di-INSERT per batch lewat executemany
+# (satu statement INSERT multi-baris per batch) dalam satu transaksi.
+BATCH_IMPOR = 200
+
+
+def sisipkan_domba_massal(cur, data):
+    """INSERT domba per batch lewat executemany dan kembalikan id baru sesuai urutan `data`.
+
+    Auto-increment satu INSERT multi-baris tidak dijamin berurutan
+    (innodb_autoinc_lock_mode=2) dan executemany bisa dipecah MySQLdb
+    menjadi beberapa statement, jadi id tidak dihitung dari lastrowid.
+    Setiap baris impor ditandai kode_impor yang sama lalu id-nya dibaca
+    kembali urut id: di dalam satu statement, dan antar-statement
+    berikutnya, id selalu naik sesuai urutan baris.
+    """
+    kode = uuid.uuid4().hex
+    for i in range(0, len(data), BATCH_IMPOR):
+        batch = data[i:i + BATCH_IMPOR]
+        cur.executemany("""
+            INSERT INTO domba (nama_domba, jenis_kelamin, berat_kg, ear_tag_id, jenis_domba, lokasi_kandang, nomor_kamar, kode_impor)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, [(*d[:7], kode) for d in batch])
+
+    cur.execute("SELECT id FROM domba WHERE kode_impor = %s ORDER BY id", (kode,))
+    ids = [r[0] for r in cur.fetchall()]
+    if len(ids) != len(data):
+        raise RuntimeError(f"Impor domba: {len(data)} baris disisipkan, {len(ids)} id terbaca")
+    return ids
+
+
+@app.route('/impor_domba', methods=['GET', 'POST'])
+@login_required
+@admin_only
+def impor_domba():
+    galat, jumlah_baris = [], 0
+
+    if request.method == 'POST':
+        berkas = request.files.get('berkas')
+        if not berkas or not berkas.filename:
+            flash('Pilih berkas CSV atau XLSX terlebih dahulu!', 'danger')
+            return redirect(url_for('impor_domba'))
+
+        cur = mysql.connection.cursor()
+        try:
+            cur.execute("SELECT nama FROM kandang")
+            kandang_valid = {r[0] for r in cur.fetchall()}
+            data, galat = validasi_domba(baca_tabel(berkas.filename, berkas.stream), kandang_valid)
+            jumlah_baris = len(data) + len(galat)
+
+            ear_tag = [d[3] for d in data if d[3] != '-']
+            for i in range(0, len(ear_tag), BATCH_IMPOR):
+                potongan = ear_tag[i:i + BATCH_IMPOR]
+                cur.execute(
+                    "SELECT ear_tag_id FROM domba WHERE ear_tag_id IN (" + ", ".join(["%s"] * len(potongan)) + ")",
+                    potongan
+                )
+                terdaftar = {r[0] for r in cur.fetchall()}
+                galat.extend(
+                    (d[7], f'ear tag {d[3]} sudah terdaftar') for d in data if d[3] in terdaftar
+                )
+
+            if not data and not galat:
+                flash('Berkas tidak berisi data domba.', 'warning')
+            elif galat:
+                galat.sort()
+                flash(f'{len(galat)} baris tidak valid. Tidak ada data yang disimpan.', 'danger')
+            else:
+                ids = sisipkan_domba_massal(cur, data)
+                cur.executemany("""
+                    INSERT INTO log_populasi (id_domba, tipe_mutasi, alasan, tanggal)
+                    VALUES (%s, 'Masuk', 'Pembelian/Kelahiran', CURDATE())
+                """, [(id_domba,) for id_domba in ids])
+                perbarui_statistik_massal(cur, [(d[1], d[2], d[5], d[6]) for d in data], 1)
+                catat_berat_massal(cur, [(id_domba, d[2], d[5]) for id_domba, d in zip(ids, data)])
+                naikkan_versi(cur, 'domba', 'log_populasi', 'riwayat_berat')
+                mysql.connection.commit()
+
+                flash(f'{len(ids)} domba berhasil diimpor!', 'success')
+                return redirect(url_for('dashboard'))
+        except BerkasTidakValid as e:
+            flash(str(e), 'danger')
+        except Exception as e:
+            mysql.connection.rollback()
+            flash(f'Impor gagal: {e}', 'danger')
+        finally:
+            cur.close()
+
+    return render_template('impor_domba.html', galat=galat, jumlah_baris=jumlah_baris)
 
 
 @app.route('/tambah_domba', methods=['GET', 'POST'])
@@ -657,6 +1790,7 @@ def tambah():
 
 @app.route('/domba/<int:id>')
 @login_required
+@kondisional(baris=('domba', 'id'))
 def detail_domba(id):
     cur = mysql.connection.cursor()
     cur.execute("SELECT * FROM domba WHERE id = %s", (id,))
@@ -690,18 +1824,29 @@ def edit(id):
         kamar = request.form.get('kamar')
 
         try:
+            lama = ambil_kontribusi(cur, id)
+
             cur.execute("""
                 UPDATE domba 
                 SET nama_domba=%s, jenis_kelamin=%s, berat_kg=%s, 
-                    ear_tag_id=%s, jenis_domba=%s, lokasi_kandang=%s, nomor_kamar=%s 
+                    ear_tag_id=%s, jenis_domba=%s, lokasi_kandang=%s, nomor_kamar=%s,
+                    versi = versi + 1
                 WHERE id=%s
             """, (nama, jk, berat, ear_tag, jenis, lokasi, kamar, id))
 
+            if lama:
+                perbarui_statistik(cur, lama, -1)
+                perbarui_statistik(cur, (jk, berat, lokasi, kamar), 1)
+                if berat and (lama[1] is None or float(lama[1]) != float(berat)):
+                    catat_berat(cur, id, berat, lokasi)
+
+            naikkan_versi(cur, 'domba', 'riwayat_berat')
             mysql.connection.commit()
             flash('Perubahan data berhasil disimpan!', 'success')
             return redirect(url_for('detail_domba', id=id))
 
         except Exception as e:
+            mysql.connection.rollback()
             flash(f'Gagal menyimpan data: {str(e)}', 'danger')
 
         finally:
@@ -709,9 +1854,10 @@ def edit(id):
 
     cur.execute("SELECT * FROM domba WHERE id = %s", (id,))
     domba = cur.fetchone()
+    kandang_list = daftar_kandang(cur)
     cur.close()
 
-    return render_template('edit_domba.html', domba=domba)
+    return render_template('edit_domba.html', domba=domba, kandang_list=kandang_list)
 
 
 @app.route('/hapus/<int:id>')
@@ -719,9 +1865,14 @@ def edit(id):
 @admin_only
 def hapus(id):
     cur = mysql.connection.cursor()
+    lama = ambil_kontribusi(cur, id)
     cur.execute("DELETE FROM domba WHERE id = %s", (id,))
+    if lama:
+        perbarui_statistik(cur, lama, -1)
+    naikkan_versi(cur, 'domba')
     mysql.connection.commit()
     cur.close()
+    pdf_cache.hapus('laporan_kesehatan', id)
     flash('Data Domba telah dihapus!', 'danger')
     return redirect(url_for('dashboard'))
 
@@ -729,29 +1880,197 @@ def hapus(id):
 # =========================================================
 # 7. INVENTARIS + MUTASI POPULASI
 # =========================================================
+# Saldo stok per bahan pakan disimpan di stok_bahan dan diperbarui dengan
+# satu upsert di transaksi yang sama dengan INSERT mutasinya, jadi halaman
+# inventaris cukup membaca satu baris per bahan. Riwayat mutasi dibaca per
+# halaman dengan keyset (tanggal, id) dari yang terbaru, bukan seluruh log.
+BATAS_RIWAYAT_PAKAN = 30
+MAKS_JUMLAH_PAKAN = Decimal('100000000')
+
+
+def perbarui_stok_bahan(cur, nama, jenis, jumlah, tanggal):
+    """Tambahkan satu mutasi ke saldo bahannya dan kembalikan saldo barunya"""
+    masuk = jumlah if jenis == 'Masuk' else 0
+    keluar = jumlah if jenis == 'Keluar' else 0
+    cur.execute("""
+        INSERT INTO stok_bahan (nama_bahan, masuk, keluar, saldo, jumlah_mutasi, mutasi_terakhir)
+        VALUES (%s, %s, %s, %s, 1, %s)
+        ON DUPLICATE KEY UPDATE
+            masuk = masuk + VALUES(masuk),
+            keluar = keluar + VALUES(keluar),
+            saldo = saldo + VALUES(saldo),
+            jumlah_mutasi = jumlah_mutasi + 1,
+            mutasi_terakhir = GREATEST(COALESCE(mutasi_terakhir, VALUES(mutasi_terakhir)), VALUES(mutasi_terakhir))
+    """, (nama, masuk, keluar, masuk - keluar, tanggal))
+    cur.execute("SELECT saldo FROM stok_bahan WHERE nama_bahan = %s", (nama,))
+    return cur.fetchone()[0]
+
+
+def rebuild_stok_bahan(cur):
+    """Hitung ulang saldo semua bahan dari seluruh mutasi stok_pakan"""
+    cur.execute("DELETE FROM stok_bahan")
+    cur.execute("""
+        INSERT INTO stok_bahan (nama_bahan, masuk, keluar, saldo, jumlah_mutasi, mutasi_terakhir)
+        SELECT TRIM(nama_bahan),
+               SUM(IF(jenis_mutasi = 'Masuk', jumlah, 0)),
+               SUM(IF(jenis_mutasi = 'Keluar', jumlah, 0)),
+               SUM(CASE jenis_mutasi WHEN 'Masuk' THEN jumlah WHEN 'Keluar' THEN -jumlah ELSE 0 END),
+               COUNT(*),
+               MAX(tanggal)
+        FROM stok_pakan
+        WHERE TRIM(nama_bahan) <> '' AND jumlah IS NOT NULL
+        GROUP BY TRIM(nama_bahan)
+    """)
+
+
+@app.cli.command('rebuild-stok-bahan')
+def rebuild_stok_bahan_command():
+    """Hitung ulang saldo stok per bahan pakan dari riwayat mutasi."""
+    cur = mysql.connection.cursor()
+    rebuild_stok_bahan(cur)
+    mysql.connection.commit()
+    cur.close()
+    print("Saldo stok bahan pakan berhasil dihitung ulang.")
+
+
+def riwayat_pakan(cur, bahan=None, sebelum=None, limit=BATAS_RIWAYAT_PAKAN):
+    """Satu halaman mutasi pakan terbaru; `sebelum` = cursor (tanggal, id) baris terakhir halaman lalu"""
+    kondisi, params = [], []
+    if bahan:
+        kondisi.append("nama_bahan = %s")
+        params.append(bahan)
+    if sebelum:
+        tanggal, id = sebelum
+        kondisi.append("(tanggal < %s OR (tanggal = %s AND id < %s))")
+        params += [tanggal, tanggal, id]
+
+    where = f"WHERE {' AND '.join(kondisi)}" if kondisi else ""
+    cur.execute(f"""
+        SELECT id, nama_bahan, jenis_mutasi, jumlah, tanggal, keterangan
+        FROM stok_pakan {where}
+        ORDER BY tanggal DESC, id DESC
+        LIMIT %s
+    """, params + [limit + 1])
+    rows = cur.fetchall()
+
+    berikutnya = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        berikutnya = encode_cursor([rows[-1][4].isoformat(), rows[-1][0]])
+    return rows, berikutnya
+
+
+# Perkiraan kapan stok tiap bahan habis, dari pemakaian (mutasi Keluar)
+# JENDELA_HARI terakhir. Pemakaian dibagi ke kandang menurut biomassa
+# (ekor x rata-rata berat dari statistik_kamar) dan seberapa sering kandang
+# itu diberi pakan menurut log_kerja. Perhitungannya ada di prakiraan.py.
+def prakiraan_pakan(cur, stok=None, hari_ini=None):
+    hari_ini = hari_ini or date.today()
+    awal = hari_ini - timedelta(days=JENDELA_HARI - 1)
+
+    if stok is None:
+        cur.execute("SELECT nama_bahan, saldo FROM stok_bahan ORDER BY nama_bahan ASC")
+        stok = cur.fetchall()
+
+    cur.execute("""
+        SELECT nama_bahan, tanggal, SUM(jumlah)
+        FROM stok_pakan
+        WHERE jenis_mutasi = 'Keluar' AND tanggal BETWEEN %s AND %s
+        GROUP BY nama_bahan, tanggal
+    """, (awal, hari_ini))
+    mutasi = cur.fetchall()
+
+    cur.execute("""
+        SELECT k.nama, COALESCE(SUM(s.jumlah), 0), SUM(s.total_berat) / NULLIF(SUM(s.jumlah_ditimbang), 0)
+        FROM kandang k
+        LEFT JOIN statistik_kamar s ON s.lokasi_kandang = k.nama
+        GROUP BY k.id, k.nama
+        ORDER BY k.id ASC
+    """)
+    populasi = cur.fetchall()
+
+    cur.execute("""
+        SELECT lokasi_kandang, COUNT(DISTINCT tanggal)
+        FROM log_kerja
+        WHERE beri_pakan = 1 AND tanggal BETWEEN %s AND %s
+        GROUP BY lokasi_kandang
+    """, (awal, hari_ini))
+    hari_beri = dict(cur.fetchall())
+
+    kandang = [(nama, int(ekor), berat, hari_beri.get(nama, 0)) for nama, ekor, berat in populasi]
+    return proyeksi_pakan([s[0] for s in stok], [s[1] for s in stok], mutasi, kandang, hari_ini)
+
+
+@app.route('/api/prakiraan_pakan')
+@login_required
+def api_prakiraan_pakan():
+    cur = mysql.connection.cursor()
+    per_bahan, per_kandang = prakiraan_pakan(cur)
+    cur.close()
+
+    for b in per_bahan:
+        b['tanggal_habis'] = b['tanggal_habis'].isoformat() if b['tanggal_habis'] else None
+    return jsonify(jendela_hari=JENDELA_HARI, bahan=per_bahan, kandang=per_kandang)
+
+
 @app.route('/inventaris', methods=['GET', 'POST'])
 @login_required
 def inventaris():
     cur = mysql.connection.cursor()
 
     if request.method == 'POST':
-        nama = request.form.get('nama_bahan')
+        nama = (request.form.get('nama_bahan') or '').strip()
         jenis = request.form.get('jenis_mutasi')
-        jumlah = request.form.get('jumlah')
         tgl = request.form.get('tanggal')
         ket = request.form.get('keterangan')
+        try:
+            jumlah = Decimal(request.form.get('jumlah', ''))
+        except ArithmeticError:
+            jumlah = None
+        # NaN/Infinity lolos Decimal(); batas atas mengikuti kolom DECIMAL(10,2)
+        if jumlah is not None and (not jumlah.is_finite() or jumlah >= MAKS_JUMLAH_PAKAN):
+            jumlah = None
+
+        if not nama or jenis not in ('Masuk', 'Keluar') or jumlah is None or jumlah <= 0:
+            cur.close()
+            flash('Nama bahan, jenis mutasi dan jumlah (> 0) wajib diisi dengan benar!', 'danger')
+            return redirect(url_for('inventaris'))
 
         cur.execute("""
             INSERT INTO stok_pakan (nama_bahan, jenis_mutasi, jumlah, tanggal, keterangan) 
             VALUES (%s, %s, %s, %s, %s)
         """, (nama, jenis, jumlah, tgl, ket))
+        saldo = perbarui_stok_bahan(cur, nama, jenis, jumlah, tgl)
 
+        naikkan_versi(cur, 'stok_pakan', 'stok_bahan')
         mysql.connection.commit()
-        flash('Data stok pakan berhasil diperbarui!', 'success')
+        cur.close()
+        if saldo < 0:
+            flash(f'Mutasi tersimpan, tetapi stok {nama} kini minus ({saldo} Kg). Periksa catatan barang masuk.', 'warning')
+        else:
+            flash(f'Data stok pakan berhasil diperbarui! Sisa {nama}: {saldo} Kg.', 'success')
         return redirect(url_for('inventaris'))
 
-    cur.execute("SELECT * FROM stok_pakan ORDER BY tanggal DESC")
-    pakan = cur.fetchall()
+    cur.execute("""
+        SELECT nama_bahan, masuk, keluar, saldo, mutasi_terakhir
+        FROM stok_bahan ORDER BY nama_bahan ASC
+    """)
+    stok = cur.fetchall()
+    per_bahan, per_kandang = prakiraan_pakan(cur, [(s[0], s[3]) for s in stok])
+
+    bahan = request.args.get('bahan') or None
+    sebelum = request.args.get('sebelum')
+    try:
+        sebelum = decode_cursor(sebelum) if sebelum else None
+        if sebelum is not None:
+            # Cursor harus [tanggal ISO, id]; bentuk lain dianggap halaman pertama
+            tanggal, id = sebelum
+            if not isinstance(id, int) or isinstance(id, bool):
+                raise TypeError
+            sebelum = (date.fromisoformat(tanggal).isoformat(), id)
+    except (ValueError, TypeError):
+        sebelum = None
+    pakan, berikutnya = riwayat_pakan(cur, bahan, sebelum)
 
     cur.execute("SELECT id, nama_domba, ear_tag_id FROM domba")
     domba_list = cur.fetchall()
@@ -766,7 +2085,12 @@ def inventaris():
 
     cur.close()
 
-    return render_template('inventaris.html', pakan=pakan, domba_list=domba_list, mutasi_domba=mutasi_domba)
+    return render_template(
+        'inventaris.html',
+        pakan=pakan, stok=stok, bahan=bahan, berikutnya=berikutnya, halaman_lanjut=sebelum is not None,
+        prakiraan={p['bahan']: p for p in per_bahan}, prakiraan_kandang=per_kandang, jendela_hari=JENDELA_HARI,
+        domba_list=domba_list, mutasi_domba=mutasi_domba
+    )
 
 
 @app.route('/lapor_kematian', methods=['POST'])
@@ -789,15 +2113,61 @@ def lapor_kematian():
         VALUES (%s, 'Keluar', 'Kematian', %s, %s, %s)
     """, (id_domba, tgl, ket, filename))
 
+    lama = ambil_kontribusi(cur, id_domba)
     cur.execute("DELETE FROM domba WHERE id = %s", (id_domba,))
+    if lama:
+        perbarui_statistik(cur, lama, -1)
 
+    naikkan_versi(cur, 'domba', 'log_populasi')
     mysql.connection.commit()
     cur.close()
+    pdf_cache.hapus('laporan_kesehatan', id_domba)
 
     flash('Laporan kematian tersimpan. Data domba telah dihapus dari daftar aktif.', 'warning')
     return redirect(url_for('inventaris'))
 
 
+# =========================================================
+# DOKUMEN PDF
+# =========================================================
+# PDF yang sudah dirender disimpan di disk dengan kunci (jenis, id, versi).
+# Kolom `versi` pada domba/keuangan/penjualan dinaikkan setiap kali data
+# sumbernya berubah, sehingga unduhan ulang cukup mengirim berkas cache
+# (atau 304 lewat ETag) tanpa menyentuh FPDF sama sekali.
+pdf_cache = PdfCache(config.PDF_CACHE_DIR)
+
+
+def render_pdf(jenis, gambar, *data):
+    """Buat dokumen PDF baru lewat fungsi `gambar(pdf, *data)` dan kembalikan isinya"""
+    mulai = time.perf_counter()
+    pdf = FPDF()
+    gambar(pdf, *data)
+    isi = pdf.output(dest='S')
+    isi = isi.encode('latin-1') if isinstance(isi, str) else bytes(isi)
+    metrics.catat_pdf(jenis, mulai)
+    return isi
+
+
+def kirim_pdf(jenis, id, versi, nama_berkas, buat):
+    """Kirim PDF dari cache; `buat()` hanya dipanggil jika versi ini belum ada"""
+    etag = pdf_cache.etag(jenis, id, versi)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        path = pdf_cache.ambil(jenis, id, versi) or pdf_cache.simpan(jenis, id, versi, buat())
+        response = send_file(
+            path,
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name=nama_berkas,
+            conditional=False,
+            etag=False
+        )
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 # =========================================================
 # 8. REKAM MEDIS
 # =========================================================
@@ -838,6 +2208,9 @@ def tambah_medis():
         request.form['catatan']
     ))
 
+    cur.execute("UPDATE domba SET versi = versi + 1 WHERE id = %s", (request.form['id_domba'],))
+
+    naikkan_versi(cur, 'rekam_medis')
     mysql.connection.commit()
     cur.close()
 
@@ -845,24 +2218,7 @@ def tambah_medis():
     return redirect(url_for('list_rekam_medis'))
 
 
-@app.route('/cetak_pdf/<int:id>')
-@login_required
-def cetak_pdf(id):
-    cur = mysql.connection.cursor()
-    cur.execute("SELECT * FROM domba WHERE id = %s", (id,))
-    domba = cur.fetchone()
-
-    cur.execute("""
-        SELECT tanggal_periksa, diagnosa, obat, catatan 
-        FROM rekam_medis 
-        WHERE id_domba = %s
-        ORDER BY tanggal_periksa DESC
-    """, (id,))
-    riwayat = cur.fetchall()
-
-    cur.close()
-
-    pdf = FPDF()
+def gambar_laporan_kesehatan(pdf, domba, riwayat):
     pdf.add_page()
     pdf.set_font("Arial", 'B', 16)
     pdf.cell(190, 10, f"LAPORAN KESEHATAN: {domba[1]}", ln=True, align='C')
@@ -883,10 +2239,45 @@ def cetak_pdf(id):
         pdf.cell(50, 10, str(r[2]), 1)
         pdf.cell(50, 10, str(r[3]), 1, 1)
 
-    response = make_response(pdf.output(dest='S').encode('latin-1'))
-    response.headers.set('Content-Disposition', 'attachment', filename=f'Laporan_{domba[1]}.pdf')
-    response.headers.set('Content-Type', 'application/pdf')
-    return response
+
+def buat_laporan_kesehatan(id):
+    cur = mysql.connection.cursor()
+    cur.execute("SELECT * FROM domba WHERE id = %s", (id,))
+    data_domba = cur.fetchone()
+    cur.execute("""
+        SELECT tanggal_periksa, diagnosa, obat, catatan 
+        FROM rekam_medis 
+        WHERE id_domba = %s
+        ORDER BY tanggal_periksa DESC
+    """, (id,))
+    riwayat = cur.fetchall()
+    cur.close()
+    return render_pdf('laporan_kesehatan', gambar_laporan_kesehatan, data_domba, riwayat)
+
+
+@app.route('/cetak_pdf/<int:id>')
+@login_required
+def cetak_pdf(id):
+    cur = mysql.connection.cursor()
+    cur.execute("SELECT nama_domba, versi FROM domba WHERE id = %s", (id,))
+    domba = cur.fetchone()
+
+    if not domba:
+        cur.close()
+        flash('Data domba tidak ditemukan!', 'danger')
+        return redirect(url_for('dashboard'))
+
+    # ?antri=1: jika versi ini belum pernah dirender, serahkan ke worker
+    if request.args.get('antri') and not pdf_cache.ambil('laporan_kesehatan', id, domba[1]):
+        id_tugas = antrian.masukkan(cur, 'laporan_kesehatan', {'id': id}, session['id'])
+        mysql.connection.commit()
+        cur.close()
+        flash('Laporan kesehatan sedang dibuat di latar belakang.', 'success')
+        return redirect(url_for('list_antrian', sorot=id_tugas))
+    cur.close()
+
+    return kirim_pdf('laporan_kesehatan', id, domba[1], f'Laporan_{domba[0]}.pdf',
+                     lambda: buat_laporan_kesehatan(id))
 
 
 # =========================================================
@@ -894,11 +2285,11 @@ def cetak_pdf(id):
 # =========================================================
 @app.route('/sop')
 @login_required
+@kondisional('sop')
 def list_sop():
-    cur = mysql.connection.cursor()
-    cur.execute("SELECT id, kegiatan, waktu, takaran, penanggung_jawab, instruksi FROM sop ORDER BY waktu ASC")
-    sops = cur.fetchall()
-    cur.close()
+    sops = Tunda(lambda: ambil_semua(
+        "SELECT id, kegiatan, waktu, takaran, penanggung_jawab, instruksi FROM sop ORDER BY waktu ASC"
+    ))
     return render_template('list_sop.html', sops=sops)
 
 
@@ -918,6 +2309,7 @@ def tambah_sop():
             request.form['instruksi'],
             request.form['penanggung_jawab']
         ))
+        naikkan_versi(cur, 'sop')
         mysql.connection.commit()
         cur.close()
         flash('Jadwal SOP baru berhasil ditambahkan!', 'success')
@@ -945,6 +2337,7 @@ def edit_sop(id):
             request.form['penanggung_jawab'],
             id
         ))
+        naikkan_versi(cur, 'sop')
         mysql.connection.commit()
         cur.close()
         flash('SOP berhasil diperbarui!', 'success')
@@ -963,6 +2356,7 @@ def edit_sop(id):
 def hapus_sop(id):
     cur = mysql.connection.cursor()
     cur.execute("DELETE FROM sop WHERE id = %s", [id])
+    naikkan_versi(cur, 'sop')
     mysql.connection.commit()
     cur.close()
     flash("SOP berhasil dihapus.", "warning")
@@ -980,6 +2374,7 @@ def lapor_tugas():
         INSERT INTO laporan_harian (sop_id, nama_karyawan, tanggal, jam_selesai)
         VALUES (%s, %s, CURDATE(), CURTIME())
     """, (sop_id, nama_karyawan))
+    naikkan_versi(cur, 'laporan_harian')
     mysql.connection.commit()
     cur.close()
 
@@ -1019,29 +2414,101 @@ def rekap_tugas():
 # =========================================================
 # 10. KATALOG OBAT + REFERENSI MEDIS
 # =========================================================
-@app.route('/obat')
+# Index TF-IDF gejala referensi_medis disimpan per proses worker dan
+# dibangun ulang hanya ketika versi tabel referensi_medis berubah.
+_indeks_gejala = {'versi': None, 'indeks': None}
+_kunci_indeks_gejala = threading.Lock()
+
+
+def indeks_gejala(cur):
+    versi = ambil_versi(cur, 'referensi_medis')
+    if _indeks_gejala['versi'] != versi:
+        with _kunci_indeks_gejala:
+            if _indeks_gejala['versi'] != versi:
+                cur.execute("""
+                    SELECT id, gejala, diagnosa_prediksi, kategori_obat, nama_obat_rekomendasi
+                    FROM referensi_medis
+                """)
+                _indeks_gejala['indeks'] = IndeksGejala(cur.fetchall())
+                _indeks_gejala['versi'] = versi
+    return _indeks_gejala['indeks']
+
+
+@app.route('/api/gejala')
 @login_required
-def list_obat():
+def cocokkan_gejala():
+    teks = request.args.get('q', '').strip()
+    jumlah = max(1, min(request.args.get('jumlah', 5, type=int), 20))
+
+    cur = mysql.connection.cursor()
+    indeks = indeks_gejala(cur)
+    cur.close()
+
+    return jsonify({
+        'data': [
+            {
+                'id': r[0],
+                'gejala': r[1],
+                'diagnosa': r[2],
+                'kategori_obat': r[3],
+                'obat': r[4],
+                'skor': skor,
+            }
+            for skor, r in indeks.cari(teks, jumlah)
+        ]
+    })
+
+
+@app.route('/tambah_referensi', methods=['POST'])
+@login_required
+@admin_only
+def tambah_referensi():
     cur = mysql.connection.cursor()
+    cur.execute("""
+        INSERT INTO referensi_medis (gejala, diagnosa_prediksi, kategori_obat, nama_obat_rekomendasi)
+        VALUES (%s, %s, %s, %s)
+    """, (
+        request.form['gejala'],
+        request.form['diagnosa_prediksi'],
+        request.form.get('kategori_obat'),
+        request.form.get('nama_obat_rekomendasi')
+    ))
+    naikkan_versi(cur, 'referensi_medis')
+    mysql.connection.commit()
+    cur.close()
 
-    cur.execute("SELECT * FROM obat ORDER BY nama_obat ASC")
-    data_obat = cur.fetchall()
+    flash('Referensi gejala berhasil ditambahkan.', 'success')
+    return redirect(url_for('list_obat'))
 
-    cur.execute("SELECT * FROM referensi_medis")
-    panduan_medis = cur.fetchall()
 
+@app.route('/hapus_referensi/<int:id>')
+@login_required
+@admin_only
+def hapus_referensi(id):
+    cur = mysql.connection.cursor()
+    cur.execute("DELETE FROM referensi_medis WHERE id = %s", (id,))
+    naikkan_versi(cur, 'referensi_medis')
+    mysql.connection.commit()
     cur.close()
 
+    flash('Referensi gejala berhasil dihapus.', 'warning')
+    return redirect(url_for('list_obat'))
+
+
+@app.route('/obat')
+@login_required
+@kondisional('obat', 'referensi_medis')
+def list_obat():
+    data_obat = Tunda(lambda: ambil_semua("SELECT * FROM obat ORDER BY nama_obat ASC"))
+    panduan_medis = Tunda(lambda: ambil_semua("SELECT * FROM referensi_medis"))
     return render_template('obat.html', obat_list=data_obat, panduan=panduan_medis)
 
 
 @app.route('/katalog_obat')
 @login_required
+@kondisional('obat')
 def katalog_obat():
-    cur = mysql.connection.cursor()
-    cur.execute("SELECT * FROM obat ORDER BY nama_obat ASC")
-    data_obat = cur.fetchall()
-    cur.close()
+    data_obat = Tunda(lambda: ambil_semua("SELECT * FROM obat ORDER BY nama_obat ASC"))
     return render_template('katalog_obat.html', obat_list=data_obat)
 
 
@@ -1059,6 +2526,7 @@ def tambah_obat():
             request.form['brand'],
             request.form['fungsi']
         ))
+        naikkan_versi(cur, 'obat')
         mysql.connection.commit()
         cur.close()
 
@@ -1074,6 +2542,7 @@ def tambah_obat():
 def hapus_obat(id):
     cur = mysql.connection.cursor()
     cur.execute("DELETE FROM obat WHERE id = %s", (id,))
+    naikkan_versi(cur, 'obat')
     mysql.connection.commit()
     cur.close()
 
@@ -1081,6 +2550,65 @@ def hapus_obat(id):
     return redirect(url_for('katalog_obat'))
 
 
+# =========================================================
+# NOMOR DOKUMEN OTOMATIS
+# =========================================================
+# Nomor struk/invoice berformat AWALAN-YYYYMMDD-NNN. Urutan per hari
+# disimpan di tabel nomor_urut dan dinaikkan dengan satu upsert di dalam
+# transaksi INSERT dokumennya: baris (jenis, tanggal) terkunci sampai
+# commit, jadi dua transaksi bersamaan tidak pernah mendapat nomor yang
+# sama, dan rollback ikut membatalkan kenaikan nomornya.
+FORMAT_NOMOR = {
+    # jenis: (awalan, tabel, kolom)
+    'struk': ('JL', 'penjualan', 'no_struk'),
+    'invoice': ('INV', 'keuangan', 'no_invoice'),
+}
+
+
+def format_nomor(jenis, tanggal, urutan):
+    return f"{FORMAT_NOMOR[jenis][0]}-{tanggal.strftime('%Y%m%d')}-{urutan:03d}"
+
+
+def nomor_berikutnya(cur, jenis):
+    """Alokasikan nomor dokumen berikutnya untuk hari ini (panggil di dalam transaksi INSERT)"""
+    hari_ini = date.today()
+    cur.execute("""
+        INSERT INTO nomor_urut (jenis, tanggal, terakhir)
+        VALUES (%s, %s, LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE terakhir = LAST_INSERT_ID(terakhir + 1)
+    """, (jenis, hari_ini))
+    cur.execute("SELECT LAST_INSERT_ID()")
+    return format_nomor(jenis, hari_ini, cur.fetchone()[0])
+
+
+def catat_nomor_manual(cur, jenis, nomor):
+    """Majukan nomor_urut jika nomor yang diketik manual berformat nomor otomatis.
+
+    Tanpa ini nomor otomatis berikutnya bisa sama dengan nomor manual tadi
+    dan ditolak UNIQUE no_struk/no_invoice.
+    """
+    m = re.fullmatch(rf"{FORMAT_NOMOR[jenis][0]}-(\d{{8}})-(\d+)", nomor)
+    if not m:
+        return
+    try:
+        tanggal = datetime.strptime(m.group(1), '%Y%m%d').date()
+    except ValueError:
+        return
+    cur.execute("""
+        INSERT INTO nomor_urut (jenis, tanggal, terakhir)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE terakhir = GREATEST(terakhir, VALUES(terakhir))
+    """, (jenis, tanggal, int(m.group(2))))
+
+
+def intip_nomor_berikutnya(cur, jenis):
+    """Perkiraan nomor berikutnya untuk ditampilkan di form (tidak mengalokasikan)"""
+    hari_ini = date.today()
+    cur.execute("SELECT terakhir FROM nomor_urut WHERE jenis = %s AND tanggal = %s", (jenis, hari_ini))
+    baris = cur.fetchone()
+    return format_nomor(jenis, hari_ini, (baris[0] if baris else 0) + 1)
+
+
 # =========================================================
 # 11. KEUANGAN INVOICE
 # =========================================================
@@ -1091,15 +2619,16 @@ def list_keuangan_invoice():
     cur = mysql.connection.cursor()
     cur.execute("SELECT * FROM keuangan ORDER BY tanggal DESC")
     transaksi = cur.fetchall()
+    no_invoice_auto = intip_nomor_berikutnya(cur, 'invoice')
     cur.close()
-    return render_template('keuangan.html', transaksi=transaksi)
+    return render_template('keuangan.html', transaksi=transaksi, no_invoice_auto=no_invoice_auto)
 
 
 @app.route('/tambah_transaksi', methods=['POST'])
 @login_required
 @admin_only
 def tambah_transaksi():
-    no_inv = request.form['no_invoice']
+    no_inv = request.form.get('no_invoice', '').strip()
     pelanggan = request.form['pelanggan']
     produk = request.form['produk']
     qty = int(request.form['jumlah'])
@@ -1109,14 +2638,24 @@ def tambah_transaksi():
     tgl = request.form['tanggal']
 
     cur = mysql.connection.cursor()
-    cur.execute("""
-        INSERT INTO keuangan (no_invoice, pelanggan, produk, jumlah, total_harga, terbayar, sisa_tagihan, tanggal)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-    """, (no_inv, pelanggan, produk, qty, total, bayar, sisa, tgl))
-    mysql.connection.commit()
-    cur.close()
+    try:
+        if no_inv:
+            catat_nomor_manual(cur, 'invoice', no_inv)
+        else:
+            no_inv = nomor_berikutnya(cur, 'invoice')
+        cur.execute("""
+            INSERT INTO keuangan (no_invoice, pelanggan, produk, jumlah, total_harga, terbayar, sisa_tagihan, tanggal)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """, (no_inv, pelanggan, produk, qty, total, bayar, sisa, tgl))
+        naikkan_versi(cur, 'keuangan')
+        mysql.connection.commit()
+        flash('Transaksi Berhasil Dicatat!', 'success')
+    except Exception as e:
+        mysql.connection.rollback()
+        flash(f'Gagal menyimpan transaksi: {str(e)}', 'danger')
+    finally:
+        cur.close()
 
-    flash('Transaksi Berhasil Dicatat!', 'success')
     return redirect(url_for('list_keuangan_invoice'))
 
 
@@ -1126,8 +2665,10 @@ def tambah_transaksi():
 def hapus_transaksi(id):
     cur = mysql.connection.cursor()
     cur.execute("DELETE FROM keuangan WHERE id_transaksi = %s", (id,))
+    naikkan_versi(cur, 'keuangan')
     mysql.connection.commit()
     cur.close()
+    pdf_cache.hapus('invoice', id)
 
     flash('Transaksi berhasil dihapus!', 'warning')
     return redirect(url_for('list_keuangan_invoice'))
@@ -1136,6 +2677,7 @@ def hapus_transaksi(id):
 @app.route('/struk_invoice/<int:id>')
 @login_required
 @admin_only
+@kondisional(baris=('keuangan', 'id_transaksi'))
 def struk_invoice(id):
     cur = mysql.connection.cursor()
     cur.execute("SELECT * FROM keuangan WHERE id_transaksi = %s", (id,))
@@ -1144,16 +2686,7 @@ def struk_invoice(id):
     return render_template('struk_invoice.html', transaksi=t)
 
 
-@app.route('/cetak_invoice/<int:id>')
-@login_required
-@admin_only
-def cetak_invoice(id):
-    cur = mysql.connection.cursor()
-    cur.execute("SELECT * FROM keuangan WHERE id_transaksi = %s", (id,))
-    t = cur.fetchone()
-    cur.close()
-
-    pdf = FPDF()
+def gambar_invoice(pdf, t):
     pdf.add_page()
     pdf.set_font("Arial", 'B', 20)
     pdf.set_text_color(15, 76, 58)
@@ -1211,34 +2744,193 @@ def cetak_invoice(id):
     pdf.cell(30, 7, "Sisa Tagihan", 0, 0)
     pdf.cell(40, 7, f"Rp {t[7]:,.0f}", 0, 1, 'R')
 
-    response = make_response(pdf.output(dest='S').encode('latin-1'))
-    response.headers.set('Content-Disposition', 'attachment', filename=f'Invoice_{t[1]}.pdf')
-    response.headers.set('Content-Type', 'application/pdf')
-    return response
+
+@app.route('/cetak_invoice/<int:id>')
+@login_required
+@admin_only
+def cetak_invoice(id):
+    cur = mysql.connection.cursor()
+    cur.execute("SELECT no_invoice, versi FROM keuangan WHERE id_transaksi = %s", (id,))
+    t = cur.fetchone()
+    cur.close()
+
+    if not t:
+        flash('Data transaksi tidak ditemukan!', 'danger')
+        return redirect(url_for('list_keuangan_invoice'))
+
+    def buat():
+        cur = mysql.connection.cursor()
+        cur.execute("SELECT * FROM keuangan WHERE id_transaksi = %s", (id,))
+        transaksi = cur.fetchone()
+        cur.close()
+        return render_pdf('invoice', gambar_invoice, transaksi)
+
+    return kirim_pdf('invoice', id, t[1], f'Invoice_{t[0]}.pdf', buat)
 
 
 # =========================================================
 # 12. KEUANGAN KAS
 # =========================================================
+# Setiap baris kas menyimpan saldo berjalan (urut tanggal, id) dan setiap
+# bulan punya baris rekap (masuk, keluar, jumlah, saldo_akhir). Keduanya
+# diperbarui di transaksi yang sama dengan INSERT/DELETE, jadi halaman kas
+# dan laporan periode cukup membaca beberapa baris lewat index.
+AWAL_BULAN_KAS = "DATE_SUB(tanggal, INTERVAL DAYOFMONTH(tanggal) - 1 DAY)"
+NILAI_KAS = "CASE WHEN tipe = 'Masuk' THEN COALESCE(nominal, 0) ELSE -COALESCE(nominal, 0) END"
+
+
+def awal_bulan_berikutnya(periode):
+    return (periode.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def kunci_kas(cur):
+    """Kunci baris kas terakhir agar penulis kas berjalan bergiliran.
+
+    Saldo baris baru dihitung dari saldo baris sebelumnya, jadi dua
+    transaksi kas tidak boleh menghitungnya bersamaan.
+    """
+    cur.execute("SELECT id FROM keuangan_kas ORDER BY tanggal DESC, id DESC LIMIT 1 FOR UPDATE")
+    cur.fetchall()
+
+
+def saldo_sebelum(cur, tanggal, id=None):
+    """Saldo berjalan baris terakhir sebelum posisi (tanggal, id)"""
+    if id is None:
+        cur.execute("""
+            SELECT saldo FROM keuangan_kas WHERE tanggal < %s
+            ORDER BY tanggal DESC, id DESC LIMIT 1
+        """, (tanggal,))
+    else:
+        cur.execute("""
+            SELECT saldo FROM keuangan_kas WHERE tanggal < %s OR (tanggal = %s AND id < %s)
+            ORDER BY tanggal DESC, id DESC LIMIT 1
+        """, (tanggal, tanggal, id))
+    baris = cur.fetchone()
+    return baris[0] if baris else Decimal(0)
+
+
+def perbarui_saldo_kas(cur, id, tanggal, tipe, nominal, arah):
+    """Sesuaikan saldo berjalan dan rekap bulanan untuk satu baris kas.
+
+    arah=+1 dipanggil setelah baris `id` di-INSERT, arah=-1 setelah di-DELETE.
+    Hanya baris sesudah (tanggal, id) yang berubah; transaksi dengan tanggal
+    hari ini cukup menyentuh barisnya sendiri.
+    """
+    if isinstance(tanggal, str):
+        tanggal = date.fromisoformat(tanggal)
+    nominal = Decimal(str(nominal or 0))
+    delta = (nominal if tipe == 'Masuk' else -nominal) * arah
+    periode = tanggal.replace(day=1)
+
+    cur.execute("""
+        UPDATE keuangan_kas SET saldo = saldo + %s
+        WHERE tanggal > %s OR (tanggal = %s AND id > %s)
+    """, (delta, tanggal, tanggal, id))
+    if arah > 0:
+        cur.execute("UPDATE keuangan_kas SET saldo = %s WHERE id = %s",
+                    (saldo_sebelum(cur, tanggal, id) + delta, id))
+
+    cur.execute("""
+        INSERT INTO saldo_kas_bulanan (periode, masuk, keluar, jumlah, saldo_akhir)
+        VALUES (%s, %s, %s, %s, 0)
+        ON DUPLICATE KEY UPDATE
+            masuk = masuk + VALUES(masuk),
+            keluar = keluar + VALUES(keluar),
+            jumlah = jumlah + VALUES(jumlah)
+    """, (periode,
+          nominal * arah if tipe == 'Masuk' else 0,
+          nominal * arah if tipe != 'Masuk' else 0,
+          arah))
+    cur.execute("UPDATE saldo_kas_bulanan SET saldo_akhir = saldo_akhir + %s WHERE periode > %s",
+                (delta, periode))
+    cur.execute("UPDATE saldo_kas_bulanan SET saldo_akhir = %s WHERE periode = %s",
+                (saldo_sebelum(cur, awal_bulan_berikutnya(periode)), periode))
+    cur.execute("DELETE FROM saldo_kas_bulanan WHERE periode = %s AND jumlah <= 0", (periode,))
+
+
+def rebuild_saldo_kas(cur):
+    """Hitung ulang saldo berjalan semua baris kas dan rekap bulanan dari awal"""
+    cur.execute(f"""
+        UPDATE keuangan_kas k
+        JOIN (
+            SELECT id, SUM({NILAI_KAS}) OVER (ORDER BY tanggal, id) AS saldo
+            FROM keuangan_kas
+        ) s ON s.id = k.id
+        SET k.saldo = s.saldo
+    """)
+    cur.execute("DELETE FROM saldo_kas_bulanan")
+    cur.execute(f"""
+        INSERT INTO saldo_kas_bulanan (periode, masuk, keluar, jumlah, saldo_akhir)
+        SELECT {AWAL_BULAN_KAS},
+               SUM(CASE WHEN tipe = 'Masuk' THEN COALESCE(nominal, 0) ELSE 0 END),
+               SUM(CASE WHEN tipe = 'Masuk' THEN 0 ELSE COALESCE(nominal, 0) END),
+               COUNT(*), 0
+        FROM keuangan_kas
+        WHERE tanggal IS NOT NULL
+        GROUP BY 1
+    """)
+    cur.execute("""
+        UPDATE saldo_kas_bulanan b
+        JOIN (
+            SELECT periode, SUM(masuk - keluar) OVER (ORDER BY periode) AS saldo
+            FROM saldo_kas_bulanan
+        ) s ON s.periode = b.periode
+        SET b.saldo_akhir = s.saldo
+    """)
+
+
+def ringkasan_kas(cur, dari=None, sampai=None):
+    """(masuk, keluar, saldo_akhir) untuk rentang bulan [dari, sampai]; default seluruh periode"""
+    kondisi, params = [], []
+    if dari:
+        kondisi.append("periode >= %s")
+        params.append(dari.replace(day=1))
+    if sampai:
+        kondisi.append("periode <= %s")
+        params.append(sampai.replace(day=1))
+    where = ("WHERE " + " AND ".join(kondisi)) if kondisi else ""
+
+    cur.execute(f"SELECT COALESCE(SUM(masuk), 0), COALESCE(SUM(keluar), 0) FROM saldo_kas_bulanan {where}", params)
+    masuk, keluar = cur.fetchone()
+    cur.execute(f"SELECT saldo_akhir FROM saldo_kas_bulanan {where} ORDER BY periode DESC LIMIT 1", params)
+    baris = cur.fetchone()
+    return masuk, keluar, baris[0] if baris else Decimal(0)
+
+
+@app.cli.command('rebuild-saldo-kas')
+def rebuild_saldo_kas_command():
+    """Hitung ulang saldo berjalan kas dan rekap saldo bulanan."""
+    cur = mysql.connection.cursor()
+    rebuild_saldo_kas(cur)
+    mysql.connection.commit()
+    cur.close()
+    print("Saldo berjalan dan rekap bulanan kas berhasil dihitung ulang.")
+
+
 @app.route('/keuangan_kas')
 @login_required
 @admin_only
 def list_keuangan_kas():
     cur = mysql.connection.cursor()
+
+    cur.execute("SELECT periode, masuk, keluar, jumlah, saldo_akhir FROM saldo_kas_bulanan ORDER BY periode DESC")
+    rekap_bulanan = cur.fetchall()
+
+    # Tampilkan satu bulan per halaman (default bulan terakhir yang ada transaksinya)
+    try:
+        bulan = datetime.strptime(request.args['bulan'], '%Y-%m').date()
+    except (KeyError, ValueError):
+        bulan = rekap_bulanan[0][0] if rekap_bulanan else date.today().replace(day=1)
+
     cur.execute("""
-        SELECT id, deskripsi, tipe, kategori, tanggal, nominal
+        SELECT id, deskripsi, tipe, kategori, tanggal, nominal, saldo
         FROM keuangan_kas
+        WHERE tanggal >= %s AND tanggal < %s
         ORDER BY tanggal DESC, id DESC
-    """)
+    """, (bulan, awal_bulan_berikutnya(bulan)))
     data_transaksi = cur.fetchall()
 
-    cur.execute("SELECT SUM(nominal) FROM keuangan_kas WHERE tipe = 'Masuk'")
-    total_masuk = cur.fetchone()[0] or 0
-
-    cur.execute("SELECT SUM(nominal) FROM keuangan_kas WHERE tipe = 'Keluar'")
-    total_keluar = cur.fetchone()[0] or 0
-
-    saldo_akhir = total_masuk - total_keluar
+    total_masuk, total_keluar, saldo_akhir = ringkasan_kas(cur)
     cur.close()
 
     return render_template(
@@ -1246,7 +2938,9 @@ def list_keuangan_kas():
         transaksi=data_transaksi,
         saldo=saldo_akhir,
         masuk=total_masuk,
-        keluar=total_keluar
+        keluar=total_keluar,
+        rekap_bulanan=rekap_bulanan,
+        bulan=bulan
     )
 
 
@@ -1262,11 +2956,14 @@ def tambah_keuangan():
         tanggal = request.form['tanggal']
 
         cur = mysql.connection.cursor()
+        kunci_kas(cur)
         cur.execute("""
             INSERT INTO keuangan_kas (deskripsi, tipe, kategori, nominal, tanggal) 
             VALUES (%s, %s, %s, %s, %s)
         """, (deskripsi, tipe, kategori, nominal, tanggal))
+        perbarui_saldo_kas(cur, cur.lastrowid, tanggal, tipe, nominal, 1)
 
+        naikkan_versi(cur, 'keuangan_kas')
         mysql.connection.commit()
         cur.close()
 
@@ -1301,7 +2998,13 @@ def detail_keuangan(id):
 @admin_only
 def hapus_keuangan(id):
     cur = mysql.connection.cursor()
+    kunci_kas(cur)
+    cur.execute("SELECT tanggal, tipe, nominal FROM keuangan_kas WHERE id = %s FOR UPDATE", (id,))
+    lama = cur.fetchone()
     cur.execute("DELETE FROM keuangan_kas WHERE id = %s", (id,))
+    if lama and lama[0]:
+        perbarui_saldo_kas(cur, id, lama[0], lama[1], lama[2], -1)
+    naikkan_versi(cur, 'keuangan_kas')
     mysql.connection.commit()
     cur.close()
 
@@ -1322,21 +3025,89 @@ def list_keuangan():
 # =========================================================
 # 13. PENJUALAN DOMBA
 # =========================================================
+# Rekap harian dan bulanan (jumlah transaksi, ekor, pendapatan, terbayar,
+# sisa tagihan, transaksi belum lunas) diperbarui di transaksi yang sama
+# dengan INSERT/DELETE penjualan. Kartu ringkasan dan laporan periode
+# membaca rekap ini, bukan memindai tabel penjualan.
+KOLOM_KONTRIBUSI_PENJUALAN = "tanggal, jumlah, total_harga, terbayar, sisa_tagihan"
+KOLOM_REKAP_PENJUALAN = "jumlah_transaksi, ekor, pendapatan, terbayar, sisa_tagihan, belum_lunas"
 
-def generate_no_struk(cur):
-    """Generate nomor struk otomatis format: JL-YYYYMMDD-XXX"""
-    try:
-        hari_ini = date.today().strftime('%Y%m%d')
-        prefix = f"JL-{hari_ini}-"
-        cur.execute("SELECT COUNT(*) FROM penjualan WHERE no_struk LIKE %s", (prefix + '%',))
-        urutan = cur.fetchone()[0] + 1
-        return f"{prefix}{urutan:03d}"
-    except Exception:
-        # Fallback jika kolom no_struk belum ada
-        cur.execute("SELECT COUNT(*) FROM penjualan")
-        urutan = cur.fetchone()[0] + 1
-        hari_ini = date.today().strftime('%Y%m%d')
-        return f"JL-{hari_ini}-{urutan:03d}"
+
+def perbarui_rekap_penjualan(cur, penjualan, arah):
+    """Tambahkan (arah=1) atau kurangi (arah=-1) kontribusi satu penjualan.
+
+    `penjualan` berisi (tanggal, jumlah, total_harga, terbayar, sisa_tagihan).
+    """
+    tanggal, jumlah, total, terbayar, sisa = penjualan
+    if isinstance(tanggal, str):
+        tanggal = date.fromisoformat(tanggal)
+    sisa = float(sisa or 0)
+    delta = (
+        arah,
+        arah * int(jumlah or 0),
+        arah * float(total or 0),
+        arah * float(terbayar or 0),
+        arah * sisa,
+        arah if sisa > 0 else 0
+    )
+    for tabel, kunci, nilai in (
+        ('rekap_penjualan_harian', 'tanggal', tanggal),
+        ('rekap_penjualan_bulanan', 'periode', tanggal.replace(day=1)),
+    ):
+        cur.execute(f"""
+            INSERT INTO {tabel} ({kunci}, {KOLOM_REKAP_PENJUALAN})
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                jumlah_transaksi = jumlah_transaksi + VALUES(jumlah_transaksi),
+                ekor = ekor + VALUES(ekor),
+                pendapatan = pendapatan + VALUES(pendapatan),
+                terbayar = terbayar + VALUES(terbayar),
+                sisa_tagihan = sisa_tagihan + VALUES(sisa_tagihan),
+                belum_lunas = belum_lunas + VALUES(belum_lunas)
+        """, (nilai,) + delta)
+        if arah < 0:
+            cur.execute(f"DELETE FROM {tabel} WHERE {kunci} = %s AND jumlah_transaksi <= 0", (nilai,))
+
+
+def rebuild_rekap_penjualan(cur):
+    """Hitung ulang rekap penjualan harian dan bulanan dari tabel penjualan"""
+    awal = {
+        'harian': ('tanggal', "tanggal"),
+        'bulanan': ('periode', "DATE_SUB(tanggal, INTERVAL DAYOFMONTH(tanggal) - 1 DAY)"),
+    }
+    for periode, (kunci, ekspresi) in awal.items():
+        cur.execute(f"DELETE FROM rekap_penjualan_{periode}")
+        cur.execute(f"""
+            INSERT INTO rekap_penjualan_{periode} ({kunci}, {KOLOM_REKAP_PENJUALAN})
+            SELECT {ekspresi}, COUNT(*), COALESCE(SUM(jumlah), 0), COALESCE(SUM(total_harga), 0),
+                   COALESCE(SUM(terbayar), 0), COALESCE(SUM(sisa_tagihan), 0), SUM(sisa_tagihan > 0)
+            FROM penjualan
+            WHERE tanggal IS NOT NULL
+            GROUP BY 1
+        """)
+
+
+def ringkasan_penjualan(cur, dari=None, sampai=None):
+    """Total rekap untuk rentang tanggal; default seluruh periode (baca rekap bulanan)"""
+    kolom = ", ".join(f"COALESCE(SUM({k}), 0)" for k in KOLOM_REKAP_PENJUALAN.split(", "))
+    if dari is None and sampai is None:
+        cur.execute(f"SELECT {kolom} FROM rekap_penjualan_bulanan")
+    else:
+        cur.execute(f"""
+            SELECT {kolom} FROM rekap_penjualan_harian
+            WHERE tanggal BETWEEN %s AND %s
+        """, (dari or date.min, sampai or date.max))
+    return dict(zip(KOLOM_REKAP_PENJUALAN.split(", "), cur.fetchone()))
+
+
+@app.cli.command('rebuild-rekap-penjualan')
+def rebuild_rekap_penjualan_command():
+    """Hitung ulang rekap penjualan harian dan bulanan."""
+    cur = mysql.connection.cursor()
+    rebuild_rekap_penjualan(cur)
+    mysql.connection.commit()
+    cur.close()
+    print("Rekap penjualan harian dan bulanan berhasil dihitung ulang.")
 
 
 @app.route('/penjualan')
@@ -1345,17 +3116,23 @@ def generate_no_struk(cur):
 def list_penjualan():
     cur = mysql.connection.cursor()
 
-    cur.execute("SELECT * FROM penjualan ORDER BY tanggal DESC, id DESC")
-    penjualan_list = cur.fetchall()
+    cur.execute(f"SELECT periode, {KOLOM_REKAP_PENJUALAN} FROM rekap_penjualan_bulanan ORDER BY periode DESC")
+    rekap_bulanan = cur.fetchall()
 
-    cur.execute("SELECT COALESCE(SUM(total_harga), 0) FROM penjualan")
-    total_pendapatan = float(cur.fetchone()[0])
+    # Tampilkan satu bulan per halaman (default bulan terakhir yang ada penjualannya)
+    try:
+        bulan = datetime.strptime(request.args['bulan'], '%Y-%m').date()
+    except (KeyError, ValueError):
+        bulan = rekap_bulanan[0][0] if rekap_bulanan else date.today().replace(day=1)
 
-    cur.execute("SELECT COALESCE(SUM(jumlah), 0) FROM penjualan")
-    total_terjual = cur.fetchone()[0]
+    cur.execute("""
+        SELECT * FROM penjualan
+        WHERE tanggal >= %s AND tanggal < %s
+        ORDER BY tanggal DESC, id DESC
+    """, (bulan, awal_bulan_berikutnya(bulan)))
+    penjualan_list = cur.fetchall()
 
-    cur.execute("SELECT COUNT(*) FROM penjualan WHERE sisa_tagihan > 0")
-    belum_lunas = cur.fetchone()[0]
+    ringkasan = ringkasan_penjualan(cur)
 
     cur.execute("""
         SELECT id, nama_domba, jenis_kelamin, berat_kg, ear_tag_id, jenis_domba
@@ -1363,9 +3140,8 @@ def list_penjualan():
     """)
     domba_tersedia = cur.fetchall()
 
-    no_struk_auto = generate_no_struk(cur)
+    no_struk_auto = intip_nomor_berikutnya(cur, 'struk')
 
-    from datetime import datetime
     now = datetime.today()
 
     cur.close()
@@ -1373,9 +3149,12 @@ def list_penjualan():
     return render_template(
         'penjualan.html',
         penjualan_list=penjualan_list,
-        total_pendapatan=total_pendapatan,
-        total_terjual=total_terjual,
-        belum_lunas=belum_lunas,
+        total_pendapatan=float(ringkasan['pendapatan']),
+        total_terjual=ringkasan['ekor'],
+        total_transaksi=ringkasan['jumlah_transaksi'],
+        belum_lunas=ringkasan['belum_lunas'],
+        rekap_bulanan=rekap_bulanan,
+        bulan=bulan,
         domba_tersedia=domba_tersedia,
         no_struk_auto=no_struk_auto,
         now=now
@@ -1400,10 +3179,12 @@ def tambah_penjualan():
 
     cur = mysql.connection.cursor()
     try:
-        # Auto-generate no_struk dari form atau buat baru jika kosong
+        # No struk diisi manual dari form, atau dialokasikan otomatis jika kosong
         no_struk = request.form.get('no_struk', '').strip()
-        if not no_struk:
-            no_struk = generate_no_struk(cur)
+        if no_struk:
+            catat_nomor_manual(cur, 'struk', no_struk)
+        else:
+            no_struk = nomor_berikutnya(cur, 'struk')
 
         cur.execute("""
             INSERT INTO penjualan
@@ -1414,10 +3195,11 @@ def tambah_penjualan():
         """, (no_struk, nama_pembeli, keterangan_domba, jumlah,
               total_harga, terbayar, sisa_tagihan, tanggal,
               no_hp, catatan, harga_per_ekor))
+        new_id = cur.lastrowid
+        perbarui_rekap_penjualan(cur, (tanggal, jumlah, total_harga, terbayar, sisa_tagihan), 1)
+        naikkan_versi(cur, 'penjualan')
         mysql.connection.commit()
 
-        # Ambil ID transaksi yang baru disimpan untuk redirect ke struk
-        new_id = cur.lastrowid
         flash('Penjualan berhasil dicatat! Struk siap dicetak.', 'success')
         cur.close()
         return redirect(url_for('struk_penjualan', id=new_id))
@@ -1439,9 +3221,15 @@ def tambah_penjualan():
 @admin_only
 def hapus_penjualan(id):
     cur = mysql.connection.cursor()
+    cur.execute(f"SELECT {KOLOM_KONTRIBUSI_PENJUALAN} FROM penjualan WHERE id = %s FOR UPDATE", (id,))
+    lama = cur.fetchone()
     cur.execute("DELETE FROM penjualan WHERE id = %s", (id,))
+    if lama and lama[0]:
+        perbarui_rekap_penjualan(cur, lama, -1)
+    naikkan_versi(cur, 'penjualan')
     mysql.connection.commit()
     cur.close()
+    pdf_cache.hapus('struk_penjualan', id)
     flash('Transaksi penjualan berhasil dihapus.', 'warning')
     return redirect(url_for('list_penjualan'))
 
@@ -1449,6 +3237,7 @@ def hapus_penjualan(id):
 @app.route('/struk_penjualan/<int:id>')
 @login_required
 @admin_only
+@kondisional(baris=('penjualan', 'id'))
 def struk_penjualan(id):
     cur = mysql.connection.cursor()
     cur.execute("SELECT * FROM penjualan WHERE id = %s", (id,))
@@ -1462,24 +3251,10 @@ def struk_penjualan(id):
     return render_template('struk_penjualan.html', transaksi=transaksi)
 
 
-@app.route('/cetak_struk_pdf/<int:id>')
-@login_required
-@admin_only
-def cetak_struk_pdf(id):
-    cur = mysql.connection.cursor()
-    cur.execute("SELECT * FROM penjualan WHERE id = %s", (id,))
-    t = cur.fetchone()
-    cur.close()
-
-    if not t:
-        flash('Data tidak ditemukan!', 'danger')
-        return redirect(url_for('list_penjualan'))
-
+def gambar_struk_penjualan(pdf, t):
     # t index: 0=id, 1=no_struk, 2=nama_pembeli, 3=keterangan_domba,
     #          4=jumlah, 5=total_harga, 6=terbayar, 7=sisa_tagihan,
     #          8=tanggal, 9=no_hp, 10=catatan, 11=harga_per_ekor
-
-    pdf = FPDF()
     pdf.add_page()
     pdf.set_margins(15, 15, 15)
 
@@ -1587,12 +3362,577 @@ def cetak_struk_pdf(id):
     pdf.set_text_color(150, 150, 150)
     pdf.cell(0, 5, "Terima kasih telah berbelanja di Dombastis Farm — Barang yang sudah dibeli tidak dapat ditukar/dikembalikan.", ln=True, align='C')
 
-    response = make_response(pdf.output(dest='S').encode('latin-1'))
-    response.headers.set('Content-Disposition', 'attachment', filename=f'Struk_{t[1]}.pdf')
+
+@app.route('/cetak_struk_pdf/<int:id>')
+@login_required
+@admin_only
+def cetak_struk_pdf(id):
+    cur = mysql.connection.cursor()
+    cur.execute("SELECT no_struk, versi FROM penjualan WHERE id = %s", (id,))
+    t = cur.fetchone()
+    cur.close()
+
+    if not t:
+        flash('Data tidak ditemukan!', 'danger')
+        return redirect(url_for('list_penjualan'))
+
+    def buat():
+        cur = mysql.connection.cursor()
+        cur.execute("SELECT * FROM penjualan WHERE id = %s", (id,))
+        transaksi = cur.fetchone()
+        cur.close()
+        return render_pdf('struk_penjualan', gambar_struk_penjualan, transaksi)
+
+    return kirim_pdf('struk_penjualan', id, t[1], f'Struk_{t[0]}.pdf', buat)
+
+
+# =========================================================
+# 14. EKSPOR DATA
+# =========================================================
+# Data tabel (CSV/XLSX) dan dokumen per baris (struk penjualan / invoice)
+# dalam rentang tanggal. Baris selalu dibaca lewat SSCursor dan hasilnya
+# dialirkan ke klien sedikit demi sedikit, jadi memori worker tetap datar
+# berapa pun panjang rentangnya. Dokumen PDF memakai berkas dari cache bila
+# versinya sudah pernah dirender.
+SUMBER_EKSPOR_PDF = {
+    'penjualan': {
+        'tabel': 'penjualan',
+        'id': 'id',
+        'nomor': 'no_struk',
+        'pelanggan': 'nama_pembeli',
+        'jenis': 'struk_penjualan',
+        'gambar': gambar_struk_penjualan,
+        'awalan': 'Struk',
+    },
+    'keuangan': {
+        'tabel': 'keuangan',
+        'id': 'id_transaksi',
+        'nomor': 'no_invoice',
+        'pelanggan': 'pelanggan',
+        'jenis': 'invoice',
+        'gambar': gambar_invoice,
+        'awalan': 'Invoice',
+    },
+}
+
+# Satu PDF gabungan harus dibangun utuh di memori (tabel xref PDF ditulis
+# di akhir berkas), jadi jumlahnya dibatasi; di atas batas ini pakai ZIP.
+MAKS_PDF_GABUNGAN = 300
+
+
+def filter_ekspor(args, kolom_tanggal='tanggal', kolom_pelanggan=None, kolom_sisa=None):
+    """Bangun klausa WHERE rentang tanggal (+ pelanggan / belum lunas) dari query string"""
+    hari_ini = date.today()
+    dari = args.get('dari') or hari_ini.replace(day=1).isoformat()
+    sampai = args.get('sampai') or hari_ini.isoformat()
+
+    kondisi = [f"{kolom_tanggal} BETWEEN %s AND %s"]
+    params = [dari, sampai]
+    if kolom_pelanggan and args.get('pelanggan'):
+        kondisi.append(f"{kolom_pelanggan} LIKE %s")
+        params.append(f"%{args['pelanggan']}%")
+    if kolom_sisa and args.get('belum_lunas'):
+        kondisi.append(f"{kolom_sisa} > 0")
+
+    return " AND ".join(kondisi), params, dari, sampai
+
+
+# Ekspor tabel ke CSV/XLSX. Setiap sumber berisi judul kolom dan query
+# dengan placeholder {where}; hasilnya dialirkan baris demi baris.
+SUMBER_EKSPOR_DATA = {
+    'penjualan': {
+        'judul': 'Penjualan',
+        'tanggal': 'tanggal',
+        'kolom': ['No Struk', 'Tanggal', 'Pembeli', 'No HP', 'Keterangan Domba', 'Jumlah',
+                  'Harga per Ekor', 'Total Harga', 'Terbayar', 'Sisa Tagihan', 'Catatan'],
+        'query': """
+            SELECT no_struk, tanggal, nama_pembeli, no_hp, keterangan_domba, jumlah,
+                   harga_per_ekor, total_harga, terbayar, sisa_tagihan, catatan
+            FROM penjualan WHERE {where} ORDER BY tanggal, id
+        """,
+    },
+    'keuangan_kas': {
+        'judul': 'Kas',
+        'tanggal': 'tanggal',
+        'kolom': ['Tanggal', 'Tipe', 'Kategori', 'Deskripsi', 'Nominal'],
+        'query': """
+            SELECT tanggal, tipe, kategori, deskripsi, nominal
+            FROM keuangan_kas WHERE {where} ORDER BY tanggal, id
+        """,
+    },
+    'log_kerja': {
+        'judul': 'Log Kerja',
+        'tanggal': 'l.tanggal',
+        'kolom': ['Tanggal', 'Karyawan', 'Kandang', 'Buat Pakan', 'Beri Pakan', 'Sapu Kandang',
+                  'Cukur Domba', 'Disinfektan', 'Bersih Tandon', 'Cek Garam', 'Catatan'],
+        'query': """
+            SELECT l.tanggal, u.username, l.lokasi_kandang, l.buat_pakan, l.beri_pakan,
+                   l.sapu_kandang, l.cukur_domba, l.disinfektan, l.bersih_tandon,
+                   l.cek_garam, l.catatan
+            FROM log_kerja l LEFT JOIN users u ON u.id = l.user_id
+            WHERE {where} ORDER BY l.tanggal, l.id
+        """,
+    },
+    'rekam_medis': {
+        'judul': 'Rekam Medis',
+        'tanggal': 'r.tanggal_periksa',
+        'kolom': ['Tanggal Periksa', 'ID Domba', 'Nama Domba', 'Ear Tag', 'Diagnosa', 'Obat', 'Catatan'],
+        'query': """
+            SELECT r.tanggal_periksa, r.id_domba, d.nama_domba, d.ear_tag_id,
+                   r.diagnosa, r.obat, r.catatan
+            FROM rekam_medis r LEFT JOIN domba d ON d.id = r.id_domba
+            WHERE {where} ORDER BY r.tanggal_periksa, r.id_medis
+        """,
+    },
+}
+
+
+@app.route('/ekspor')
+@login_required
+@admin_only
+def ekspor():
+    hari_ini = date.today()
+    return render_template(
+        'ekspor.html',
+        dari=hari_ini.replace(day=1).isoformat(),
+        sampai=hari_ini.isoformat(),
+        maks_pdf_gabungan=MAKS_PDF_GABUNGAN,
+        sumber_data=SUMBER_EKSPOR_DATA
+    )
+
+
+def kueri_ekspor_dokumen(sumber, args):
+    """Query baris dokumen yang diekspor beserta jumlahnya dan nama dasar berkasnya"""
+    where, params, dari, sampai = filter_ekspor(
+        args, kolom_pelanggan=sumber['pelanggan'], kolom_sisa='sisa_tagihan'
+    )
+    tabel, kolom_id = sumber['tabel'], sumber['id']
+
+    cur = mysql.connection.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {tabel} WHERE {where}", params)
+    jumlah = cur.fetchone()[0]
+    cur.close()
+
+    # Kolom versi ditaruh paling akhir agar indeks kolom yang dipakai
+    # fungsi gambar_* tetap sama dengan SELECT *
+    query = f"SELECT *, versi FROM {tabel} WHERE {where} ORDER BY tanggal, {kolom_id}"
+    return query, params, jumlah, f"{sumber['awalan']}_{dari}_{sampai}"
+
+
+def zip_dokumen(sumber, query, params):
+    """Potongan berkas ZIP berisi satu PDF per baris, memakai cache PDF bila ada"""
+    def daftar_berkas():
+        for t in mysql.stream(query, params):
+            id_baris, versi = t[0], t[-1]
+            path = pdf_cache.ambil(sumber['jenis'], id_baris, versi)
+            if path is None:
+                isi = render_pdf(sumber['jenis'], sumber['gambar'], t)
+                path = pdf_cache.simpan(sumber['jenis'], id_baris, versi, isi)
+            yield f"{sumber['awalan']}_{t[1] or id_baris}.pdf", path
+
+    return zip_stream(daftar_berkas())
+
+
+def pdf_gabungan(sumber, query, params):
+    mulai = time.perf_counter()
+    pdf = FPDF()
+    for t in mysql.stream(query, params):
+        sumber['gambar'](pdf, t)
+    isi_pdf = pdf.output(dest='S')
+    isi_pdf = isi_pdf.encode('latin-1') if isinstance(isi_pdf, str) else bytes(isi_pdf)
+    metrics.catat_pdf(sumber['jenis'] + '_gabungan', mulai)
+    return isi_pdf
+
+
+def isi_ekspor_data(nama_tabel, args):
+    """(potongan berkas, mimetype, nama berkas) untuk ekspor tabel ke CSV/XLSX"""
+    sumber = SUMBER_EKSPOR_DATA[nama_tabel]
+    where, params, dari, sampai = filter_ekspor(args, kolom_tanggal=sumber['tanggal'])
+    baris = mysql.stream(sumber['query'].format(where=where), params)
+    nama_berkas = f"{nama_tabel}_{dari}_{sampai}"
+
+    if args.get('format') == 'xlsx':
+        return (xlsx_stream(sumber['kolom'], baris, sumber['judul']),
+                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                nama_berkas + '.xlsx')
+    return csv_stream(sumber['kolom'], baris), 'text/csv', nama_berkas + '.csv'
+
+
+def antrekan_ekspor(jenis):
+    """Masukkan ekspor dengan parameter query string saat ini ke antrian tugas"""
+    cur = mysql.connection.cursor()
+    id_tugas = antrian.masukkan(cur, jenis, request.args.to_dict(), session['id'])
+    mysql.connection.commit()
+    cur.close()
+    flash('Ekspor sedang diproses di latar belakang. Unduh hasilnya dari halaman Antrian Tugas.', 'success')
+    return redirect(url_for('list_antrian', sorot=id_tugas))
+
+
+@app.route('/ekspor/dokumen')
+@login_required
+@admin_only
+def ekspor_dokumen():
+    sumber = SUMBER_EKSPOR_PDF.get(request.args.get('sumber'))
+    if sumber is None:
+        flash('Sumber dokumen tidak dikenal!', 'danger')
+        return redirect(url_for('ekspor'))
+
+    query, params, jumlah, nama_dasar = kueri_ekspor_dokumen(sumber, request.args)
+
+    if jumlah == 0:
+        flash('Tidak ada dokumen pada rentang tanggal tersebut.', 'warning')
+        return redirect(url_for('ekspor'))
+
+    gabungan = request.args.get('format') != 'zip'
+    if gabungan and jumlah > MAKS_PDF_GABUNGAN:
+        flash(f'{jumlah} dokumen terlalu banyak untuk satu PDF (maks {MAKS_PDF_GABUNGAN}). '
+              'Gunakan format ZIP.', 'warning')
+        return redirect(url_for('ekspor'))
+
+    if request.args.get('antri'):
+        return antrekan_ekspor('ekspor_dokumen')
+
+    if not gabungan:
+        # Baris dibaca lewat mysql.stream (koneksi sendiri); koneksi request
+        # tidak perlu ditahan selama ZIP dialirkan
+        mysql.lepas()
+        response = app.response_class(
+            stream_with_context(zip_dokumen(sumber, query, params)),
+            mimetype='application/zip'
+        )
+        response.headers.set('Content-Disposition', 'attachment', filename=f'{nama_dasar}.zip')
+        return response
+
+    response = make_response(pdf_gabungan(sumber, query, params))
+    response.headers.set('Content-Disposition', 'attachment', filename=f'{nama_dasar}.pdf')
     response.headers.set('Content-Type', 'application/pdf')
     return response
 
 
+@app.route('/ekspor/data')
+@login_required
+@admin_only
+def ekspor_data():
+    nama_tabel = request.args.get('tabel')
+    if nama_tabel not in SUMBER_EKSPOR_DATA:
+        flash('Tabel ekspor tidak dikenal!', 'danger')
+        return redirect(url_for('ekspor'))
+
+    if request.args.get('antri'):
+        return antrekan_ekspor('ekspor_data')
+
+    isi, mimetype, nama_berkas = isi_ekspor_data(nama_tabel, request.args)
+    mysql.lepas()
+    response = app.response_class(stream_with_context(isi), mimetype=mimetype)
+    response.headers.set('Content-Disposition', 'attachment', filename=nama_berkas)
+    return response
+
+
+# =========================================================
+# 15. PENCARIAN
+# =========================================================
+# Pencarian memakai index FULLTEXT InnoDB (migrasi 7), yang ikut
+# diperbarui setiap INSERT/UPDATE. Setiap sumber menyumbang baris
+# (jenis, id, judul, keterangan, skor) dan hasilnya diurutkan berdasarkan
+# skor relevansi MATCH ... AGAINST. Ear tag seperti "DB-07" terpecah
+# menjadi token yang lebih pendek dari innodb_ft_min_token_size sehingga
+# tidak pernah masuk index FULLTEXT; domba juga dicari lewat index biasa
+# ear_tag_id (sama persis atau awalan) dan hasil itu diletakkan paling atas.
+SUMBER_PENCARIAN = {
+    'domba': """
+        SELECT 'domba', d.id, d.nama_domba, CONCAT_WS(' · ', d.ear_tag_id, d.jenis_domba, d.lokasi_kandang),
+               MAX(s.skor) AS skor
+        FROM (
+            SELECT id, MATCH(nama_domba, ear_tag_id, jenis_domba) AGAINST (%(kueri)s IN BOOLEAN MODE) AS skor
+            FROM domba
+            WHERE MATCH(nama_domba, ear_tag_id, jenis_domba) AGAINST (%(kueri)s IN BOOLEAN MODE)
+            UNION ALL
+            SELECT id, IF(ear_tag_id = %(tag)s, 100, 50)
+            FROM domba
+            WHERE ear_tag_id = %(tag)s OR ear_tag_id LIKE %(tag_awalan)s
+        ) s
+        JOIN domba d ON d.id = s.id
+        GROUP BY d.id
+    """,
+    'rekam_medis': """
+        SELECT 'rekam_medis', r.id_domba, r.diagnosa,
+               CONCAT_WS(' · ', r.tanggal_periksa, d.nama_domba, r.obat, r.catatan),
+               MATCH(r.diagnosa, r.obat, r.catatan) AGAINST (%(kueri)s IN BOOLEAN MODE) AS skor
+        FROM rekam_medis r LEFT JOIN domba d ON d.id = r.id_domba
+        WHERE MATCH(r.diagnosa, r.obat, r.catatan) AGAINST (%(kueri)s IN BOOLEAN MODE)
+    """,
+    'obat': """
+        SELECT 'obat', id, nama_obat, CONCAT_WS(' · ', brand, fungsi),
+               MATCH(nama_obat, brand, fungsi) AGAINST (%(kueri)s IN BOOLEAN MODE) AS skor
+        FROM obat
+        WHERE MATCH(nama_obat, brand, fungsi) AGAINST (%(kueri)s IN BOOLEAN MODE)
+    """,
+    'sop': """
+        SELECT 'sop', id, kegiatan, CONCAT_WS(' · ', waktu, takaran, penanggung_jawab, instruksi),
+               MATCH(kegiatan, takaran, instruksi, penanggung_jawab) AGAINST (%(kueri)s IN BOOLEAN MODE) AS skor
+        FROM sop
+        WHERE MATCH(kegiatan, takaran, instruksi, penanggung_jawab) AGAINST (%(kueri)s IN BOOLEAN MODE)
+    """,
+}
+BATAS_HALAMAN_CARI = 20
+_OPERATOR_FULLTEXT = re.compile(r'[+\-<>()~*"@]+')
+# innodb_ft_min_token_size bawaan; kata yang lebih pendek tidak pernah di-index
+PANJANG_MIN_TOKEN = 3
+
+
+def kueri_fulltext(teks):
+    """Ubah input bebas jadi kueri BOOLEAN MODE: setiap kata wajib ada, cocok awalan.
+
+    Kata yang lebih pendek dari PANJANG_MIN_TOKEN dibuang; jika diwajibkan,
+    kueri tidak akan pernah cocok dengan baris mana pun.
+    """
+    kata = [k for k in _OPERATOR_FULLTEXT.sub(' ', teks).split() if len(k) >= PANJANG_MIN_TOKEN]
+    return ' '.join(f'+{k}*' for k in kata[:10])
+
+
+def pola_awalan(teks):
+    """Pola LIKE 'teks%' dengan wildcard di dalam teks di-escape"""
+    return re.sub(r'([\\%_])', r'\\\1', teks) + '%'
+
+
+def tautan_hasil(jenis, id):
+    if jenis in ('domba', 'rekam_medis'):
+        return url_for('detail_domba', id=id)
+    if jenis == 'obat':
+        return url_for('list_obat')
+    return url_for('list_sop')
+
+
+@app.route('/cari')
+@login_required
+def cari():
+    q = request.args.get('q', '').strip()
+    jenis = request.args.get('jenis')
+    halaman = max(request.args.get('halaman', 1, type=int), 1)
+    kueri = kueri_fulltext(q)
+
+    hasil, ada_berikutnya = [], False
+    if q:
+        sumber = [SUMBER_PENCARIAN[jenis]] if jenis in SUMBER_PENCARIAN else list(SUMBER_PENCARIAN.values())
+        cur = mysql.connection.cursor()
+        cur.execute(
+            " UNION ALL ".join(f"({sql})" for sql in sumber)
+            + " ORDER BY skor DESC LIMIT %(limit)s OFFSET %(offset)s",
+            {
+                'kueri': kueri,
+                'tag': q,
+                'tag_awalan': pola_awalan(q),
+                'limit': BATAS_HALAMAN_CARI + 1,
+                'offset': (halaman - 1) * BATAS_HALAMAN_CARI,
+            }
+        )
+        rows = cur.fetchall()
+        cur.close()
+
+        ada_berikutnya = len(rows) > BATAS_HALAMAN_CARI
+        hasil = [
+            {
+                'jenis': r[0],
+                'id': r[1],
+                'judul': r[2],
+                'keterangan': r[3],
+                'skor': round(float(r[4]), 3),
+                'url': tautan_hasil(r[0], r[1]),
+            }
+            for r in rows[:BATAS_HALAMAN_CARI]
+        ]
+
+    if request.args.get('format') == 'json':
+        return jsonify({'data': hasil, 'next': halaman + 1 if ada_berikutnya else None})
+
+    return render_template(
+        'cari.html',
+        q=q,
+        jenis=jenis,
+        hasil=hasil,
+        halaman=halaman,
+        ada_berikutnya=ada_berikutnya
+    )
+
+
+# =========================================================
+# 16. ANTRIAN TUGAS LATAR
+# =========================================================
+# Pekerjaan berat (laporan PDF, ekspor besar, rebuild rekap) bisa diantrekan
+# ke tabel antrian_tugas alih-alih dijalankan di dalam request. Worker
+# terpisah (`flask --app app antrian-worker`, proses `worker` di Procfile)
+# menjalankannya di app context sendiri, jadi fungsi tugas memakai
+# mysql.connection dan helper yang sama dengan route.
+antrian = AntrianTugas(config.ANTRIAN_DIR, masa_simpan=timedelta(hours=config.ANTRIAN_MASA_SIMPAN_JAM))
+
+
+@tugas_latar('laporan_kesehatan', 'Laporan Kesehatan Domba')
+def tugas_laporan_kesehatan(parameter, berkas):
+    cur = mysql.connection.cursor()
+    cur.execute("SELECT nama_domba, versi FROM domba WHERE id = %s", (parameter['id'],))
+    domba = cur.fetchone()
+    cur.close()
+    if not domba:
+        raise ValueError(f"Domba {parameter['id']} tidak ditemukan")
+
+    path = pdf_cache.ambil('laporan_kesehatan', parameter['id'], domba[1])
+    if path is None:
+        isi = buat_laporan_kesehatan(parameter['id'])
+        pdf_cache.simpan('laporan_kesehatan', parameter['id'], domba[1], isi)
+    else:
+        with open(path, 'rb') as f:
+            isi = f.read()
+    berkas.write(isi)
+    return f'Laporan_{domba[0]}.pdf', 'application/pdf'
+
+
+@tugas_latar('ekspor_dokumen', 'Ekspor Struk / Invoice')
+def tugas_ekspor_dokumen(parameter, berkas):
+    sumber = SUMBER_EKSPOR_PDF[parameter['sumber']]
+    query, params, jumlah, nama_dasar = kueri_ekspor_dokumen(sumber, parameter)
+    if parameter.get('format') == 'zip':
+        for potongan in zip_dokumen(sumber, query, params):
+            berkas.write(potongan)
+        return f'{nama_dasar}.zip', 'application/zip'
+
+    berkas.write(pdf_gabungan(sumber, query, params))
+    return f'{nama_dasar}.pdf', 'application/pdf'
+
+
+@tugas_latar('ekspor_data', 'Ekspor Tabel')
+def tugas_ekspor_data(parameter, berkas):
+    isi, mimetype, nama_berkas = isi_ekspor_data(parameter['tabel'], parameter)
+    for potongan in isi:
+        berkas.write(potongan)
+    return nama_berkas, mimetype
+
+
+# Rebuild rekap yang juga tersedia sebagai perintah CLI
+REBUILD_LATAR = {
+    'rebuild_statistik': ('Hitung Ulang Statistik Populasi', rebuild_statistik),
+    'rebuild_rekap_berat': ('Hitung Ulang Rekap Berat', rebuild_rekap_berat),
+    'rebuild_saldo_kas': ('Hitung Ulang Saldo Kas', rebuild_saldo_kas),
+    'rebuild_rekap_penjualan': ('Hitung Ulang Rekap Penjualan', rebuild_rekap_penjualan),
+    'rebuild_stok_bahan': ('Hitung Ulang Stok Pakan', rebuild_stok_bahan),
+}
+
+
+def tugas_rebuild(rebuild):
+    def jalankan(parameter, berkas):
+        cur = mysql.connection.cursor()
+        rebuild(cur)
+        mysql.connection.commit()
+        cur.close()
+    return jalankan
+
+
+for _jenis, (_judul, _rebuild) in REBUILD_LATAR.items():
+    tugas_latar(_jenis, _judul)(tugas_rebuild(_rebuild))
+
+
+def tugas_milik_sendiri(cur, id):
+    """Tugas dengan id ini jika milik pengguna yang login (admin boleh semua)"""
+    tugas = antrian.ambil(cur, id)
+    if tugas and (session.get('role') == 'admin' or tugas['user_id'] == session['id']):
+        return tugas
+    return None
+
+
+def status_tugas_json(tugas):
+    return {
+        'id': tugas['id'],
+        'jenis': tugas['jenis'],
+        'judul': tugas['judul'],
+        'status': tugas['status'],
+        'percobaan': tugas['percobaan'],
+        'maks_percobaan': tugas['maks_percobaan'],
+        'pesan': tugas['pesan'],
+        'dibuat': tugas['dibuat'].isoformat(),
+        'selesai': tugas['selesai'].isoformat() if tugas['selesai'] else None,
+        'kedaluwarsa': tugas['kedaluwarsa'].isoformat() if tugas['kedaluwarsa'] else None,
+        'unduh': url_for('unduh_hasil_antrian', id=tugas['id'])
+        if tugas['status'] == 'selesai' and tugas['nama_berkas'] else None,
+    }
+
+
+@app.route('/antrian')
+@login_required
+def list_antrian():
+    cur = mysql.connection.cursor()
+    semua = session.get('role') == 'admin'
+    daftar = antrian.daftar(cur, None if semua else session['id'])
+    cur.close()
+    return render_template(
+        'antrian.html',
+        daftar=daftar,
+        sorot=request.args.get('sorot', type=int),
+        rebuild=REBUILD_LATAR if semua else {}
+    )
+
+
+@app.route('/api/antrian/<int:id>')
+@login_required
+def status_antrian(id):
+    cur = mysql.connection.cursor()
+    tugas = tugas_milik_sendiri(cur, id)
+    cur.close()
+    if tugas is None:
+        return jsonify({'error': 'Tugas tidak ditemukan'}), 404
+    return jsonify(status_tugas_json(tugas))
+
+
+@app.route('/antrian/<int:id>/unduh')
+@login_required
+def unduh_hasil_antrian(id):
+    cur = mysql.connection.cursor()
+    tugas = tugas_milik_sendiri(cur, id)
+    cur.close()
+
+    path = antrian.path_hasil(id)
+    if not tugas or tugas['status'] != 'selesai' or not tugas['nama_berkas'] or not os.path.exists(path):
+        flash('Hasil tugas tidak tersedia atau sudah kedaluwarsa.', 'warning')
+        return redirect(url_for('list_antrian'))
+
+    return send_file(path, mimetype=tugas['mimetype'], as_attachment=True, download_name=tugas['nama_berkas'])
+
+
+@app.route('/antrian/<int:id>/ulang', methods=['POST'])
+@login_required
+def ulangi_antrian(id):
+    cur = mysql.connection.cursor()
+    if tugas_milik_sendiri(cur, id) and antrian.ulangi(cur, id):
+        mysql.connection.commit()
+        flash('Tugas dimasukkan kembali ke antrian.', 'success')
+    else:
+        flash('Hanya tugas yang gagal yang bisa diulang.', 'warning')
+    cur.close()
+    return redirect(url_for('list_antrian', sorot=id))
+
+
+@app.route('/antrian/rebuild', methods=['POST'])
+@login_required
+@admin_only
+def antrekan_rebuild():
+    jenis = request.form.get('jenis')
+    if jenis not in REBUILD_LATAR:
+        flash('Jenis rebuild tidak dikenal!', 'danger')
+        return redirect(url_for('list_antrian'))
+
+    cur = mysql.connection.cursor()
+    id_tugas = antrian.masukkan(cur, jenis, user_id=session['id'])
+    mysql.connection.commit()
+    cur.close()
+    flash(f'{REBUILD_LATAR[jenis][0]} dimasukkan ke antrian.', 'success')
+    return redirect(url_for('list_antrian', sorot=id_tugas))
+
+
+@app.cli.command('antrian-worker')
+@click.option('--proses', default=config.ANTRIAN_PROSES, show_default=True, help='Jumlah proses worker.')
+def antrian_worker_command(proses):
+    """Jalankan worker antrian tugas latar sampai dihentikan (SIGTERM / Ctrl+C)."""
+    antrian.jalankan_pool(app, mysql, proses)
+
+
 # =========================================================
 # RUN APP
 # =========================================================
@@ -0,0 +1,194 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import urllib.parse
+import urllib.request
+
+# Pustaka pihak ketiga yang dulu dimuat dari CDN. CSS digabung jadi satu
+# vendor.css; font dan gambar yang dirujuk lewat url() ikut diunduh dan
+# rujukannya ditulis ulang ke berkas lokal.
+VENDOR_CSS = [
+    'https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@200;400;600;700;800;900&display=swap',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
+    'https://cdnjs.cloudflare.com/ajax/libs/animate.css/4.1.1/animate.min.css',
+    'https://unpkg.com/aos@2.3.1/dist/aos.css',
+]
+VENDOR_JS = {
+    'aos.js': 'https://unpkg.com/aos@2.3.1/dist/aos.js',
+    'chart.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js',
+}
+
+# Tanpa build (mis. saat development) JS tetap diambil dari CDN
+CDN_CADANGAN = dict(VENDOR_JS)
+
+# Berkas yang sudah terkompresi tidak perlu varian .gz/.br
+TANPA_KOMPRESI = ('.woff', '.woff2', '.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+# Google Fonts hanya mengirim woff2 ke browser modern
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+
+_URL_CSS = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def unduh(url):
+    req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(req, timeout=60) as res:
+        return res.read()
+
+
+class PembangunAset:
+    """Bangun aset statis ke `tujuan` (mis. static/dist) beserta manifest.json.
+
+    Setiap berkas diberi nama <dasar>.<hash isi>.<ekstensi> sehingga bisa
+    di-cache browser selamanya (immutable); berkas teks juga ditulis dalam
+    varian .gz dan .br untuk dikirim apa adanya oleh route aset.
+    """
+
+    def __init__(self, tujuan, log=print):
+        self.tujuan = tujuan
+        self.log = log
+        self.manifest = {}
+        self._terunduh = {}
+
+    def tulis(self, nama, isi):
+        """Simpan isi dengan nama ber-hash lalu catat di manifest; kembalikan nama ber-hash"""
+        dasar, ext = os.path.splitext(nama)
+        ber_hash = f'{dasar}.{hashlib.sha256(isi).hexdigest()[:12]}{ext}'
+        path = os.path.join(self.tujuan, ber_hash)
+        with open(path, 'wb') as f:
+            f.write(isi)
+
+        if ext.lower() not in TANPA_KOMPRESI:
+            self._kompres(path, isi)
+        self.manifest[nama] = ber_hash
+        return ber_hash
+
+    def _kompres(self, path, isi):
+        gz = gzip.compress(isi, compresslevel=9, mtime=0)
+        if len(gz) < len(isi):
+            with open(path + '.gz', 'wb') as f:
+                f.write(gz)
+        try:
+            import brotli
+        except ImportError:
+            return
+        br = brotli.compress(isi, quality=11)
+        if len(br) < len(isi):
+            with open(path + '.br', 'wb') as f:
+                f.write(br)
+
+    def _lokalkan_url_css(self, css, url_css):
+        """Unduh setiap url() yang dirujuk CSS dan ganti dengan nama berkas lokal ber-hash"""
+        def ganti(m):
+            rujukan = m.group(2).strip()
+            if rujukan.startswith('data:'):
+                return m.group(0)
+            alamat, _, fragmen = urllib.parse.urljoin(url_css, rujukan).partition('#')
+            if alamat not in self._terunduh:
+                nama = os.path.basename(urllib.parse.urlparse(alamat).path)
+                self._terunduh[alamat] = self.tulis(nama, unduh(alamat))
+            return f"url({self._terunduh[alamat]}{'#' + fragmen if fragmen else ''})"
+
+        return _URL_CSS.sub(ganti, css)
+
+    def vendor_css(self):
+        bagian = []
+        for url in VENDOR_CSS:
+            self.log(f'  unduh {url}')
+            css = unduh(url).decode('utf-8')
+            bagian.append(f'/* {url} */\n' + self._lokalkan_url_css(css, url))
+        return self.tulis('vendor.css', '\n'.join(bagian).encode('utf-8'))
+
+    def vendor_js(self):
+        for nama, url in VENDOR_JS.items():
+            self.log(f'  unduh {url}')
+            self.tulis(nama, unduh(url))
+
+    def tailwind(self, biner, masukan, config):
+        """CSS Tailwind yang hanya berisi class yang dipakai template (purge) dan sudah di-minify"""
+        fd, keluaran = tempfile.mkstemp(suffix='.css')
+        os.close(fd)
+        try:
+            # Glob `content` di config relatif terhadap direktori kerja, jadi
+            # Tailwind dijalankan dari direktori config-nya
+            subprocess.run(
+                [biner, '-c', config, '-i', masukan, '-o', keluaran, '--minify'],
+                check=True, cwd=os.path.dirname(os.path.abspath(config))
+            )
+            with open(keluaran, 'rb') as f:
+                return self.tulis('app.css', f.read())
+        finally:
+            os.remove(keluaran)
+
+    def bangun(self, tailwind_bin, masukan_css, config_tailwind):
+        """Bangun ke direktori sementara lalu pasang ke `tujuan`.
+
+        Direktori yang sedang dipakai worker tidak pernah dikosongkan: berkas
+        ber-hash baru disalin di samping yang lama (halaman yang sudah
+        terlanjur dirender tetap bisa memuat aset lamanya) dan manifest.json
+        ditulis paling akhir lewat rename atomik. Build yang gagal di tengah
+        jalan tidak mengubah apa pun.
+        """
+        akhir = self.tujuan
+        induk = os.path.dirname(os.path.abspath(akhir))
+        os.makedirs(induk, exist_ok=True)
+        self.tujuan = tempfile.mkdtemp(prefix='.aset-', dir=induk)
+        try:
+            self.log('Tailwind CSS...')
+            self.tailwind(tailwind_bin, masukan_css, config_tailwind)
+            self.log('CSS vendor...')
+            self.vendor_css()
+            self.log('JS vendor...')
+            self.vendor_js()
+
+            os.makedirs(akhir, exist_ok=True)
+            for nama in os.listdir(self.tujuan):
+                if not os.path.exists(os.path.join(akhir, nama)):
+                    shutil.copy2(os.path.join(self.tujuan, nama), os.path.join(akhir, nama))
+
+            fd, sementara = tempfile.mkstemp(prefix='.manifest-', suffix='.json', dir=akhir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.manifest, f, indent=2, sort_keys=True)
+            os.chmod(sementara, 0o644)
+            os.replace(sementara, os.path.join(akhir, 'manifest.json'))
+        finally:
+            shutil.rmtree(self.tujuan, ignore_errors=True)
+            self.tujuan = akhir
+        return self.manifest
+
+
+class ManifestAset:
+    """Petakan nama logis aset (mis. 'app.css') ke nama berkas ber-hash dari manifest.json.
+
+    Manifest dibaca ulang hanya jika berkasnya berubah, jadi build baru
+    langsung terpakai tanpa restart worker.
+    """
+
+    def __init__(self, direktori):
+        self.direktori = direktori
+        self.path = os.path.join(direktori, 'manifest.json')
+        self._mtime = None
+        self._isi = {}
+
+    def _muat(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._mtime, self._isi = None, {}
+            return self._isi
+        if mtime != self._mtime:
+            with open(self.path) as f:
+                self._isi = json.load(f)
+            self._mtime = mtime
+        return self._isi
+
+    def ambil(self, nama):
+        return self._muat().get(nama)
+
+    def __contains__(self, nama):
+        return nama in self._muat()
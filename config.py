@@ -6,4 +6,40 @@ import os
 MYSQL_HOST = os.environ.get('MYSQLHOST', 'localhost')
 MYSQL_USER = os.environ.get('MYSQLUSER', 'root')
 MYSQL_PASSWORD = os.environ.get('MYSQLPASSWORD', '')
-MYSQL_DB = os.environ.get('MYSQLDATABASE', 'dombastis')
\ No newline at end of file
+MYSQL_DB = os.environ.get('MYSQLDATABASE', 'dombastis')
+MYSQL_PORT = int(os.environ.get('MYSQLPORT', 3306))
+
+# Pool koneksi database (per proses worker gunicorn). Satu request ekspor
+# stream bisa memakai dua koneksi (koneksi request + mysql.stream), jadi
+# bawaannya 2x jumlah thread gunicorn (GUNICORN_THREADS, gunicorn.conf.py)
+MYSQL_POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE', 2 * int(os.environ.get('GUNICORN_THREADS', 4))))
+MYSQL_POOL_IDLE_TIMEOUT = int(os.environ.get('MYSQL_POOL_IDLE_TIMEOUT', 300))
+MYSQL_POOL_TIMEOUT = int(os.environ.get('MYSQL_POOL_TIMEOUT', 10))
+
+# Query yang lebih lama dari ambang ini (milidetik) dicatat beserta EXPLAIN-nya
+SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', 200))
+
+# Jika di-set, /metrics hanya bisa diakses dengan header "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Direktori cache PDF (invoice, struk, laporan kesehatan)
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', 'cache/pdf')
+
+# Antrian tugas latar (laporan PDF, ekspor besar, rebuild rekap)
+ANTRIAN_DIR = os.environ.get('ANTRIAN_DIR', 'cache/antrian')
+ANTRIAN_PROSES = int(os.environ.get('ANTRIAN_PROSES', 2))
+ANTRIAN_MASA_SIMPAN_JAM = int(os.environ.get('ANTRIAN_MASA_SIMPAN_JAM', 24))
+
+# Bytecode template Jinja yang sudah dikompilasi (dipakai bersama semua worker)
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR', 'cache/jinja')
+
+# Aset statis hasil `flask --app app bangun-aset` (nama ber-hash + manifest.json)
+ASET_DIR = os.environ.get('ASET_DIR', 'static/dist')
+# Biner Tailwind CLI; paket pytailwindcss (requirements) menyediakan perintah `tailwindcss`
+TAILWIND_BIN = os.environ.get('TAILWIND_BIN', 'tailwindcss')
+
+# Kompresi respons (brotli/gzip) untuk HTML/JSON/CSV; matikan jika proxy di depan sudah mengompresi
+KOMPRESI_AKTIF = os.environ.get('KOMPRESI_AKTIF', '1') == '1'
+KOMPRESI_LEVEL_GZIP = int(os.environ.get('KOMPRESI_LEVEL_GZIP', 6))
+KOMPRESI_LEVEL_BROTLI = int(os.environ.get('KOMPRESI_LEVEL_BROTLI', 4))
+KOMPRESI_MIN_BYTES = int(os.environ.get('KOMPRESI_MIN_BYTES', 1024))
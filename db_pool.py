@@ -0,0 +1,206 @@
+import threading
+import time
+
+import MySQLdb
+import MySQLdb.cursors
+from flask import g
+
+
+class PoolTimeout(Exception):
+    """Tidak ada koneksi yang bebas dalam batas waktu tunggu"""
+
+
+class ConnectionPool:
+    """Pool koneksi MySQL berukuran tetap yang aman dipakai antar-thread.
+
+    Koneksi dibuat saat dibutuhkan (bukan saat import) sehingga aman
+    dipakai bersama gunicorn yang mem-fork worker setelah app dimuat.
+    Setiap checkout melakukan ping; koneksi yang mati atau terlalu lama
+    menganggur ditutup dan diganti yang baru.
+    """
+
+    def __init__(self, connect_kwargs, size=5, idle_timeout=300, checkout_timeout=10):
+        self.connect_kwargs = connect_kwargs
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._terbuka = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._created = 0
+        self._recycled = 0
+
+    def _buat(self):
+        conn = MySQLdb.connect(**self.connect_kwargs)
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _tutup(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        batas = time.monotonic() + self.checkout_timeout
+        conn = None
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn, terakhir = self._idle.pop()
+                        if time.monotonic() - terakhir > self.idle_timeout:
+                            self._tutup(conn)
+                            self._terbuka -= 1
+                            self._recycled += 1
+                            conn = None
+                            continue
+                        break
+                    if self._terbuka < self.size:
+                        self._terbuka += 1
+                        break
+                    sisa = batas - time.monotonic()
+                    if sisa <= 0:
+                        raise PoolTimeout(f"Semua {self.size} koneksi database sedang dipakai")
+                    self._cond.wait(sisa)
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            if conn is not None:
+                try:
+                    conn.ping()
+                except MySQLdb.OperationalError:
+                    self._tutup(conn)
+                    with self._cond:
+                        self._recycled += 1
+                    conn = None
+            if conn is None:
+                conn = self._buat()
+        except Exception:
+            with self._cond:
+                self._terbuka -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def release(self, conn):
+        rusak = False
+        try:
+            # Buang transaksi yang tidak di-commit, sama seperti menutup koneksi
+            conn.rollback()
+        except Exception:
+            rusak = True
+
+        with self._cond:
+            self._in_use -= 1
+            if rusak:
+                self._tutup(conn)
+                self._terbuka -= 1
+                self._recycled += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._terbuka,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'created': self._created,
+                'recycled': self._recycled,
+            }
+
+
+class MySQLPool:
+    """Pengganti flask_mysqldb.MySQL yang meminjam koneksi dari pool.
+
+    `mysql.connection` tetap bisa dipakai seperti sebelumnya: satu koneksi
+    per app context, dikembalikan ke pool saat context berakhir. `wrapper`
+    (opsional) membungkus koneksi sebelum diserahkan ke route.
+    """
+
+    def __init__(self, app=None, wrapper=None):
+        self.pool = None
+        self.wrapper = wrapper
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MYSQL_PORT', 3306)
+        app.config.setdefault('MYSQL_CHARSET', 'utf8')
+        app.config.setdefault('MYSQL_POOL_SIZE', 5)
+        app.config.setdefault('MYSQL_POOL_IDLE_TIMEOUT', 300)
+        app.config.setdefault('MYSQL_POOL_TIMEOUT', 10)
+
+        self.pool = ConnectionPool(
+            {
+                'host': app.config['MYSQL_HOST'],
+                'user': app.config['MYSQL_USER'],
+                'passwd': app.config['MYSQL_PASSWORD'],
+                'db': app.config['MYSQL_DB'],
+                'port': int(app.config['MYSQL_PORT']),
+                'charset': app.config['MYSQL_CHARSET'],
+                'use_unicode': True,
+            },
+            size=int(app.config['MYSQL_POOL_SIZE']),
+            idle_timeout=float(app.config['MYSQL_POOL_IDLE_TIMEOUT']),
+            checkout_timeout=float(app.config['MYSQL_POOL_TIMEOUT']),
+        )
+        app.teardown_appcontext(self.teardown)
+
+    @property
+    def connection(self):
+        if '_mysql_conn' not in g:
+            g._mysql_raw = self.pool.acquire()
+            g._mysql_conn = self.wrapper(g._mysql_raw) if self.wrapper else g._mysql_raw
+        return g._mysql_conn
+
+    def lepas(self):
+        """Kembalikan koneksi request ke pool sebelum app context berakhir.
+
+        Dipanggil route yang mengembalikan respons stream panjang: tanpa ini
+        koneksi request tetap dipinjam sampai stream selesai, padahal isinya
+        dibaca lewat `stream()` dengan koneksi lain. Akses `connection`
+        berikutnya meminjam koneksi baru.
+        """
+        self.teardown(None)
+
+    def teardown(self, exception):
+        g.pop('_mysql_conn', None)
+        conn = g.pop('_mysql_raw', None)
+        if conn is not None:
+            self.pool.release(conn)
+
+    def stream(self, query, args=None):
+        """Iterasi hasil query baris demi baris lewat SSCursor.
+
+        Memakai koneksi tersendiri dari pool (bukan koneksi request) karena
+        koneksi dengan hasil unbuffered yang belum habis dibaca tidak bisa
+        dipakai untuk query lain. Koneksi dikembalikan saat iterasi selesai
+        atau generator ditutup.
+        """
+        raw = self.pool.acquire()
+        try:
+            conn = self.wrapper(raw) if self.wrapper else raw
+            cur = conn.cursor(MySQLdb.cursors.SSCursor)
+            try:
+                cur.execute(query, args)
+                for baris in cur:
+                    yield baris
+            finally:
+                cur.close()
+        finally:
+            self.pool.release(raw)
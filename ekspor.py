@@ -0,0 +1,177 @@
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+
+class _Penampung:
+    """Objek file tulis-saja (tanpa seek/tell) yang menampung byte sampai diambil"""
+
+    def __init__(self):
+        self._potongan = []
+
+    def write(self, data):
+        self._potongan.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def ambil(self):
+        data = b''.join(self._potongan)
+        self._potongan.clear()
+        return data
+
+
+def zip_stream(berkas):
+    """Bangun arsip ZIP dari iterable (nama di arsip, path berkas) sambil
+    meng-yield byte arsip setiap kali satu berkas selesai ditulis.
+
+    Output tidak bisa di-seek, jadi zipfile menulis data descriptor setelah
+    tiap berkas; arsip tidak pernah ditampung utuh di memori.
+    """
+    penampung = _Penampung()
+    with zipfile.ZipFile(penampung, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nama, path in berkas:
+            zf.write(path, nama)
+            yield penampung.ambil()
+    yield penampung.ambil()
+
+
+# Jumlah baris yang dikumpulkan sebelum satu potongan dikirim ke klien
+BARIS_PER_POTONGAN = 500
+
+
+def csv_stream(kolom, baris):
+    """Yield CSV (UTF-8 dengan BOM agar terbaca benar di Excel) per potongan baris"""
+    buffer = io.StringIO()
+    penulis = csv.writer(buffer)
+    buffer.write('\ufeff')
+    penulis.writerow(kolom)
+
+    for n, b in enumerate(baris, 1):
+        penulis.writerow(b)
+        if n % BARIS_PER_POTONGAN == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+# ---------------------------------------------------------
+# XLSX ditulis langsung sebagai XML di dalam ZIP yang dialirkan.
+# openpyxl/XlsxWriter menampung workbook di memori atau berkas sementara
+# sampai selesai; di sini setiap potongan baris langsung dikirim ke klien.
+# ---------------------------------------------------------
+_XLSX_TETAP = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Style 1 = tanggal (numFmt 14), style 2 = tanggal + jam, style 3 = header tebal
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="4"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+_EPOCH_EXCEL = datetime(1899, 12, 30)
+_KARAKTER_ILEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _sel(nilai, style=0):
+    if nilai is None:
+        return '<c/>'
+    if isinstance(nilai, bool):
+        return f'<c t="b"><v>{int(nilai)}</v></c>'
+    if isinstance(nilai, (int, float, Decimal)):
+        return f'<c><v>{nilai}</v></c>'
+    if isinstance(nilai, datetime):
+        serial = (nilai - _EPOCH_EXCEL).total_seconds() / 86400
+        return f'<c s="2"><v>{serial}</v></c>'
+    if isinstance(nilai, date):
+        return f'<c s="1"><v>{(nilai - _EPOCH_EXCEL.date()).days}</v></c>'
+    teks = escape(_KARAKTER_ILEGAL.sub('', str(nilai)))
+    gaya = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{gaya}><is><t xml:space="preserve">{teks}</t></is></c>'
+
+
+def _baris_xml(nilai, style=0):
+    return '<row>' + ''.join(_sel(v, style) for v in nilai) + '</row>'
+
+
+def xlsx_stream(kolom, baris, nama_sheet='Data'):
+    """Yield workbook XLSX satu sheet; baris data ditulis dan dikirim per potongan"""
+    penampung = _Penampung()
+    with zipfile.ZipFile(penampung, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nama, isi in _XLSX_TETAP.items():
+            zf.writestr(nama, isi)
+        zf.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(nama_sheet[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        yield penampung.ambil()
+
+        # Ukuran sheet tidak diketahui di awal, jadi paksa ZIP64 untuk entri ini
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            potongan = [
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>',
+                _baris_xml(kolom, style=3),
+            ]
+            for n, b in enumerate(baris, 1):
+                potongan.append(_baris_xml(b))
+                if n % BARIS_PER_POTONGAN == 0:
+                    sheet.write(''.join(potongan).encode('utf-8'))
+                    potongan.clear()
+                    yield penampung.ambil()
+            potongan.append('</sheetData></worksheet>')
+            sheet.write(''.join(potongan).encode('utf-8'))
+    yield penampung.ambil()
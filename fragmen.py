@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+class CacheFragmen(Extension):
+    """Tag Jinja `{% cache 'nama', kunci... %} ... {% endcache %}`.
+
+    Isi blok dirender sekali lalu disimpan per proses worker dengan kunci
+    (nama, kunci...). Kunci berisi versi data (lihat versi_data di app.py)
+    dan apa pun yang membuat isinya berbeda (role, endpoint), sehingga
+    begitu datanya berubah kunci baru otomatis dirender ulang; entri lama
+    tersingkir sendiri oleh batas LRU.
+    """
+
+    tags = {'cache'}
+    MAKS_ENTRI = 256
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(cache_fragmen=OrderedDict(), cache_fragmen_lock=threading.Lock())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        kunci = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            kunci.append(parser.parse_expression())
+        isi = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [nodes.Tuple(kunci, 'load')]), [], [], isi
+        ).set_lineno(lineno)
+
+    def _render(self, kunci, caller):
+        cache, lock = self.environment.cache_fragmen, self.environment.cache_fragmen_lock
+        with lock:
+            if kunci in cache:
+                cache.move_to_end(kunci)
+                return cache[kunci]
+
+        # Render di luar lock; dua request yang miss bersamaan hanya
+        # merender dua kali, hasilnya sama
+        html = Markup(caller())
+        with lock:
+            cache[kunci] = html
+            while len(cache) > self.MAKS_ENTRI:
+                cache.popitem(last=False)
+        return html
+
+
+class Tunda:
+    """Baris hasil query yang baru dibaca saat template pertama kali memakainya.
+
+    Dipakai bersama {% cache %}: jika fragmennya sudah ada di cache, query
+    di balik `ambil()` tidak pernah dijalankan.
+    """
+
+    def __init__(self, ambil):
+        self._ambil = ambil
+        self._baris = None
+
+    def _muat(self):
+        if self._baris is None:
+            self._baris = list(self._ambil())
+        return self._baris
+
+    def __iter__(self):
+        return iter(self._muat())
+
+    def __len__(self):
+        return len(self._muat())
+
+    def __bool__(self):
+        return bool(self._muat())
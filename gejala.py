@@ -0,0 +1,88 @@
+import math
+import re
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+_KATA = re.compile(r'[a-z0-9]+')
+KATA_UMUM = frozenset("""
+    dan atau yang di ke dari pada untuk dengan tidak ada ini itu juga sudah
+    setelah sebelum saat agak sangat sering kadang masih mulai jadi lebih
+""".split())
+
+
+def token(teks):
+    """Pecah teks gejala jadi token huruf kecil tanpa kata umum dan akhiran -nya"""
+    hasil = []
+    for kata in _KATA.findall((teks or '').lower()):
+        if len(kata) > 5 and kata.endswith('nya'):
+            kata = kata[:-3]
+        if len(kata) > 1 and kata not in KATA_UMUM:
+            hasil.append(kata)
+    return hasil
+
+
+class IndeksGejala:
+    """Inverted index TF-IDF atas teks gejala referensi_medis.
+
+    Dibangun sekali dari seluruh baris referensi; setiap pencarian hanya
+    menelusuri posting list token yang ada di kueri, jadi waktunya
+    bergantung pada panjang kueri, bukan jumlah referensi.
+    """
+
+    def __init__(self, baris):
+        # baris: (id, gejala, diagnosa_prediksi, kategori_obat, nama_obat_rekomendasi)
+        self.dokumen = {}
+        frekuensi = {}
+        df = Counter()
+        for b in baris:
+            tf = Counter(token(b[1]))
+            if not tf:
+                continue
+            self.dokumen[b[0]] = b
+            frekuensi[b[0]] = tf
+            df.update(tf.keys())
+
+        n = len(frekuensi)
+        self.idf = {t: math.log((1 + n) / (1 + d)) + 1 for t, d in df.items()}
+        self.kosakata = sorted(self.idf)
+
+        self.posting = defaultdict(list)
+        for id_dok, tf in frekuensi.items():
+            bobot = {t: (1 + math.log(f)) * self.idf[t] for t, f in tf.items()}
+            norma = math.sqrt(sum(w * w for w in bobot.values()))
+            for t, w in bobot.items():
+                self.posting[t].append((id_dok, w / norma))
+
+    def _perluas(self, t):
+        """Token yang tidak dikenal dicocokkan sebagai awalan kosakata (mis. 'menc' -> 'mencret')"""
+        if t in self.idf or len(t) < 3:
+            return [t] if t in self.idf else []
+        i = bisect_left(self.kosakata, t)
+        hasil = []
+        while i < len(self.kosakata) and self.kosakata[i].startswith(t):
+            hasil.append(self.kosakata[i])
+            i += 1
+        return hasil
+
+    def cari(self, teks, jumlah=5):
+        """Kembalikan [(skor, baris_referensi), ...] terurut dari yang paling cocok"""
+        kueri = Counter()
+        for t in token(teks):
+            for k in self._perluas(t):
+                kueri[k] += 1
+        if not kueri:
+            return []
+
+        bobot = {t: (1 + math.log(f)) * self.idf[t] for t, f in kueri.items()}
+        norma = math.sqrt(sum(w * w for w in bobot.values()))
+
+        skor = defaultdict(float)
+        for t, wq in bobot.items():
+            for id_dok, wd in self.posting[t]:
+                skor[id_dok] += wq / norma * wd
+
+        teratas = sorted(skor.items(), key=lambda s: s[1], reverse=True)[:jumlah]
+        return [(round(s, 4), self.dokumen[id_dok]) for id_dok, s in teratas]
+
+    def __len__(self):
+        return len(self.dokumen)
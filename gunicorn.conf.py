@@ -0,0 +1,27 @@
+import os
+import shutil
+
+# Metrik Prometheus mode multiproses: setiap worker menulis nilainya ke
+# direktori ini dan /metrics menjumlahkannya. Harus di-set sebelum app
+# (dan prometheus_client) di-import oleh worker.
+METRICS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/dombastis_metrics')
+
+# Worker gthread: heartbeat ke arbiter tetap berjalan selama satu thread
+# mengalirkan ekspor panjang, sedangkan worker sync akan dibunuh setelah
+# `timeout` detik. Pool koneksi aman dipakai antar-thread; ukurannya
+# (MYSQL_POOL_SIZE di config.py) bawaannya 2x `threads` karena request
+# ekspor stream bisa meminjam dua koneksi sekaligus. Jika `threads` dinaikkan
+# lewat GUNICORN_THREADS, pool ikut membesar kecuali MYSQL_POOL_SIZE di-set.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+
+def on_starting(server):
+    # Bersihkan sisa berkas metrik dari proses gunicorn sebelumnya
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
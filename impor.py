@@ -0,0 +1,130 @@
+import csv
+import io
+
+# Nama kolom yang diterima di baris header berkas impor (huruf kecil)
+ALIAS_KOLOM = {
+    'nama': ('nama', 'nama_domba', 'kode'),
+    'jenis_kelamin': ('jenis_kelamin', 'jk', 'kelamin'),
+    'berat_kg': ('berat_kg', 'berat'),
+    'ear_tag_id': ('ear_tag_id', 'ear_tag', 'eartag'),
+    'jenis_domba': ('jenis_domba', 'jenis', 'ras'),
+    'lokasi_kandang': ('lokasi_kandang', 'kandang', 'lokasi'),
+    'nomor_kamar': ('nomor_kamar', 'kamar'),
+}
+JENIS_KELAMIN = {'jantan': 'Jantan', 'j': 'Jantan', 'betina': 'Betina', 'b': 'Betina'}
+MAKS_BARIS = 10000
+
+
+class BerkasTidakValid(Exception):
+    """Berkas impor tidak bisa dibaca atau header-nya tidak lengkap"""
+
+
+def baca_tabel(nama_berkas, berkas):
+    """Baca berkas CSV atau XLSX dan kembalikan list baris (list of str) termasuk header"""
+    if nama_berkas.lower().endswith('.xlsx'):
+        try:
+            import openpyxl
+        except ImportError:
+            raise BerkasTidakValid('Impor XLSX membutuhkan paket openpyxl')
+        try:
+            wb = openpyxl.load_workbook(berkas, read_only=True, data_only=True)
+        except Exception as e:
+            raise BerkasTidakValid(f'Berkas XLSX tidak bisa dibaca: {e}')
+        baris = [
+            ['' if v is None else str(v).strip() for v in r]
+            for r in wb.active.iter_rows(values_only=True)
+        ]
+        wb.close()
+        return baris
+
+    try:
+        teks = berkas.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise BerkasTidakValid('Berkas CSV harus ber-encoding UTF-8')
+    contoh = teks[:2048]
+    try:
+        dialek = csv.Sniffer().sniff(contoh, delimiters=',;\t')
+    except csv.Error:
+        dialek = csv.excel
+    return [[v.strip() for v in r] for r in csv.reader(io.StringIO(teks), dialek)]
+
+
+def petakan_header(header):
+    """Posisi setiap kolom standar di header berkas"""
+    header = [h.strip().lower().replace(' ', '_') for h in header]
+    posisi = {}
+    for kolom, alias in ALIAS_KOLOM.items():
+        for a in alias:
+            if a in header:
+                posisi[kolom] = header.index(a)
+                break
+    kurang = [k for k in ('nama', 'jenis_kelamin', 'lokasi_kandang') if k not in posisi]
+    if kurang:
+        raise BerkasTidakValid('Kolom wajib tidak ditemukan: ' + ', '.join(kurang))
+    return posisi
+
+
+def validasi_domba(baris, kandang_valid):
+    """Validasi semua baris data sekaligus.
+
+    Mengembalikan (data, galat): `data` berisi tuple siap INSERT
+    (nama, jk, berat, ear_tag, jenis, lokasi, kamar, nomor_baris) dan
+    `galat` berisi (nomor_baris, pesan) untuk setiap baris yang salah.
+    """
+    if not baris:
+        raise BerkasTidakValid('Berkas kosong')
+    posisi = petakan_header(baris[0])
+    isi = [b for b in baris[1:] if any(b)]
+    if len(isi) > MAKS_BARIS:
+        raise BerkasTidakValid(f'Maksimal {MAKS_BARIS} baris per impor')
+
+    def ambil(b, kolom):
+        i = posisi.get(kolom)
+        return b[i].strip() if i is not None and i < len(b) else ''
+
+    data, galat, ear_tag_terpakai = [], [], {}
+    for nomor, b in enumerate(isi, start=2):
+        pesan = []
+        nama = ambil(b, 'nama')
+        if not nama:
+            pesan.append('nama kosong')
+
+        jk = JENIS_KELAMIN.get(ambil(b, 'jenis_kelamin').lower())
+        if jk is None:
+            pesan.append('jenis kelamin harus Jantan/Betina')
+
+        berat = ambil(b, 'berat_kg').replace(',', '.')
+        if berat:
+            try:
+                berat = float(berat)
+                if not 0 < berat < 500:
+                    pesan.append('berat di luar rentang wajar')
+            except ValueError:
+                pesan.append(f'berat "{berat}" bukan angka')
+        else:
+            berat = None
+
+        lokasi = ambil(b, 'lokasi_kandang')
+        if lokasi not in kandang_valid:
+            pesan.append(f'kandang "{lokasi}" tidak terdaftar')
+
+        kamar = ambil(b, 'nomor_kamar') or '0'
+        try:
+            kamar = int(float(kamar))
+            if kamar < 0:
+                raise ValueError
+        except ValueError:
+            pesan.append(f'nomor kamar "{kamar}" tidak valid')
+
+        ear_tag = ambil(b, 'ear_tag_id') or '-'
+        if ear_tag != '-':
+            if ear_tag in ear_tag_terpakai:
+                pesan.append(f'ear tag {ear_tag} ganda (baris {ear_tag_terpakai[ear_tag]})')
+            ear_tag_terpakai.setdefault(ear_tag, nomor)
+
+        if pesan:
+            galat.append((nomor, '; '.join(pesan)))
+        else:
+            data.append((nama, jk, berat, ear_tag, ambil(b, 'jenis_domba') or 'Lokal', lokasi, kamar, nomor))
+
+    return data, galat
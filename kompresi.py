@@ -0,0 +1,122 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Tipe konten yang layak dikompresi; PDF/ZIP/XLSX/gambar sudah terkompresi
+TIPE_TERKOMPRESI = (
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'text/xml',
+    'image/svg+xml',
+)
+
+
+def pilih_encoding(accept_encoding, brotli_tersedia=True):
+    """Encoding terbaik yang diterima klien ('br', 'gzip' atau None) dari header Accept-Encoding"""
+    diterima = {}
+    for bagian in accept_encoding.lower().split(','):
+        nama, _, param = bagian.strip().partition(';')
+        q = 1.0
+        param = param.strip()
+        if param.startswith('q='):
+            try:
+                q = float(param[2:])
+            except ValueError:
+                q = 0.0
+        diterima[nama.strip()] = q
+
+    def q(nama):
+        return diterima.get(nama, diterima.get('*', 0.0))
+
+    pilihan = [(q('br'), 1, 'br')] if brotli_tersedia else []
+    pilihan.append((q('gzip'), 0, 'gzip'))
+    nilai, _, encoding = max(pilihan)
+    return encoding if nilai > 0 else None
+
+
+class KompresiRespons:
+    """Middleware WSGI yang mengompresi respons dengan brotli atau gzip.
+
+    Keputusan diambil dari header respons saja: hanya status 200, tipe
+    konten di `tipe`, tanpa Content-Encoding (mis. aset .br/.gz dari route
+    aset) dan tanpa Cache-Control: no-transform. Respons dengan
+    Content-Length di bawah `min_bytes` dikirim apa adanya; respons stream
+    (tanpa Content-Length, mis. ekspor CSV) dikompresi potongan demi
+    potongan tanpa ditampung seluruhnya di memori.
+    """
+
+    def __init__(self, wsgi_app, level_gzip=6, level_brotli=4, min_bytes=1024, tipe=TIPE_TERKOMPRESI):
+        self.wsgi_app = wsgi_app
+        self.level_gzip = level_gzip
+        self.level_brotli = level_brotli
+        self.min_bytes = min_bytes
+        self.tipe = tipe
+
+    def __call__(self, environ, start_response):
+        encoding = pilih_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''), brotli is not None)
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.wsgi_app(environ, start_response)
+
+        dipilih = []
+
+        def start_response_kompresi(status, headers, exc_info=None):
+            if self._layak(status, headers):
+                headers = self._ubah_header(headers, encoding)
+                dipilih.append(encoding)
+            return start_response(status, headers, exc_info)
+
+        isi = self.wsgi_app(environ, start_response_kompresi)
+        if not dipilih:
+            return isi
+        return self._kompres(isi, encoding)
+
+    def _layak(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        h = {k.lower(): v for k, v in headers}
+        if 'content-encoding' in h or 'no-transform' in h.get('cache-control', ''):
+            return False
+        if h.get('content-type', '').split(';')[0].strip().lower() not in self.tipe:
+            return False
+        panjang = h.get('content-length')
+        return panjang is None or int(panjang) >= self.min_bytes
+
+    @staticmethod
+    def _ubah_header(headers, encoding):
+        baru, vary = [], None
+        for k, v in headers:
+            kunci = k.lower()
+            if kunci == 'content-length':
+                continue
+            if kunci == 'vary':
+                vary = v
+                continue
+            if kunci == 'etag' and not v.startswith('W/'):
+                # Isi byte berubah, jadi ETag kuat harus dilemahkan
+                v = 'W/' + v
+            baru.append((k, v))
+        if vary and 'accept-encoding' not in vary.lower():
+            vary = f'{vary}, Accept-Encoding'
+        baru.append(('Vary', vary or 'Accept-Encoding'))
+        baru.append(('Content-Encoding', encoding))
+        return baru
+
+    def _kompres(self, isi, encoding):
+        if encoding == 'br':
+            kompresor = brotli.Compressor(quality=self.level_brotli)
+            proses, akhiri = kompresor.process, kompresor.finish
+        else:
+            kompresor = zlib.compressobj(self.level_gzip, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            proses, akhiri = kompresor.compress, kompresor.flush
+        try:
+            for potongan in isi:
+                if potongan:
+                    keluar = proses(potongan)
+                    if keluar:
+                        yield keluar
+            yield akhiri()
+        finally:
+            if hasattr(isi, 'close'):
+                isi.close()
@@ -0,0 +1,103 @@
+import os
+import time
+
+from flask import Response, abort, before_render_template, g, request, template_rendered
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Di bawah gunicorn, PROMETHEUS_MULTIPROC_DIR di-set oleh gunicorn.conf.py
+# sebelum app dimuat sehingga setiap worker menulis nilainya ke berkas
+# bersama dan /metrics menjumlahkan semua worker.
+MULTIPROSES = bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+BUCKET_LATENSI = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_TOTAL = Counter(
+    'dombastis_http_requests_total', 'Jumlah request HTTP',
+    ['endpoint', 'method', 'status']
+)
+REQUEST_LATENSI = Histogram(
+    'dombastis_http_request_duration_seconds', 'Durasi request HTTP',
+    ['endpoint', 'method'], buckets=BUCKET_LATENSI
+)
+REQUEST_AKTIF = Gauge(
+    'dombastis_http_requests_in_flight', 'Request yang sedang diproses',
+    multiprocess_mode='livesum'
+)
+DB_WAKTU = Histogram(
+    'dombastis_db_time_per_request_seconds', 'Total waktu query database per request',
+    ['endpoint'], buckets=BUCKET_LATENSI
+)
+DB_QUERY = Counter(
+    'dombastis_db_queries_total', 'Jumlah query database',
+    ['endpoint']
+)
+TEMPLATE_WAKTU = Histogram(
+    'dombastis_template_render_seconds', 'Durasi render template Jinja',
+    ['template'], buckets=BUCKET_LATENSI
+)
+PDF_WAKTU = Histogram(
+    'dombastis_pdf_generation_seconds', 'Durasi pembuatan dokumen PDF',
+    ['dokumen'], buckets=BUCKET_LATENSI
+)
+POOL = Gauge(
+    'dombastis_db_pool', 'Status pool koneksi database',
+    ['keadaan'], multiprocess_mode='livesum'
+)
+
+
+def catat_pdf(dokumen, mulai):
+    """Catat durasi pembuatan PDF sejak `mulai` (time.perf_counter())"""
+    PDF_WAKTU.labels(dokumen).observe(time.perf_counter() - mulai)
+
+
+def _label_endpoint():
+    # Pakai nama endpoint, bukan path, agar jumlah label tetap terbatas
+    return request.endpoint or 'tidak_ditemukan'
+
+
+def init_app(app, pool=None, token=None):
+    @app.before_request
+    def _mulai_request():
+        g._metrics_mulai = time.perf_counter()
+        REQUEST_AKTIF.inc()
+
+    @app.after_request
+    def _catat_request(response):
+        mulai = g.pop('_metrics_mulai', None)
+        if mulai is not None:
+            endpoint = _label_endpoint()
+            REQUEST_TOTAL.labels(endpoint, request.method, response.status_code).inc()
+            REQUEST_LATENSI.labels(endpoint, request.method).observe(time.perf_counter() - mulai)
+            DB_WAKTU.labels(endpoint).observe(g.get('db_waktu', 0.0))
+            DB_QUERY.labels(endpoint).inc(g.get('db_query', 0))
+        if pool is not None:
+            for keadaan, nilai in pool.stats().items():
+                POOL.labels(keadaan).set(nilai)
+        return response
+
+    @app.teardown_request
+    def _selesai_request(exception):
+        REQUEST_AKTIF.dec()
+
+    @before_render_template.connect_via(app)
+    def _mulai_template(sender, template, context, **extra):
+        g.setdefault('_metrics_template', []).append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def _selesai_template(sender, template, context, **extra):
+        tumpukan = g.get('_metrics_template')
+        if tumpukan:
+            TEMPLATE_WAKTU.labels(template.name or '-').observe(time.perf_counter() - tumpukan.pop())
+
+    @app.route('/metrics')
+    def metrics():
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        if MULTIPROSES:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,97 @@
+from datetime import datetime
+
+# Registry migrasi skema: {versi: (deskripsi, fungsi(cur))}
+MIGRASI = {}
+
+NAMA_LOCK = 'dombastis_migrasi'
+
+
+def migrasi(versi, deskripsi):
+    """Daftarkan fungsi sebagai migrasi bernomor. Nomor tidak boleh dipakai ulang."""
+    def daftar(fungsi):
+        if versi in MIGRASI:
+            raise ValueError(f"Nomor migrasi {versi} sudah dipakai")
+        MIGRASI[versi] = (deskripsi, fungsi)
+        return fungsi
+    return daftar
+
+
+def versi_sekarang(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versi       INT PRIMARY KEY,
+            deskripsi   VARCHAR(255),
+            dijalankan  DATETIME
+        )
+    """)
+    cur.execute("SELECT COALESCE(MAX(versi), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+
+def versi_terbaru():
+    return max(MIGRASI) if MIGRASI else 0
+
+
+def jalankan_migrasi(conn, log=print):
+    """Jalankan semua migrasi yang belum tercatat di schema_version, urut naik.
+
+    Migrasi hanya maju (tidak ada rollback). DDL MySQL auto-commit, jadi versi
+    dicatat setelah tiap migrasi selesai; migrasi ditulis idempotent agar aman
+    diulang jika proses terhenti di tengah jalan. GET_LOCK mencegah dua proses
+    deploy menjalankan migrasi bersamaan.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, 60)", (NAMA_LOCK,))
+    if cur.fetchone()[0] != 1:
+        raise RuntimeError("Migrasi lain sedang berjalan")
+
+    try:
+        sekarang = versi_sekarang(cur)
+        dijalankan = []
+        for versi in sorted(MIGRASI):
+            if versi <= sekarang:
+                continue
+            deskripsi, fungsi = MIGRASI[versi]
+            log(f"-> {versi:04d} {deskripsi}")
+            fungsi(cur)
+            cur.execute(
+                "INSERT INTO schema_version (versi, deskripsi, dijalankan) VALUES (%s, %s, %s)",
+                (versi, deskripsi, datetime.now())
+            )
+            conn.commit()
+            dijalankan.append(versi)
+        return dijalankan
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.execute("SELECT RELEASE_LOCK(%s)", (NAMA_LOCK,))
+        cur.close()
+
+
+def kolom_ada(cur, tabel, kolom):
+    cur.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (tabel, kolom))
+    return cur.fetchone()[0] > 0
+
+
+def index_ada(cur, tabel, nama):
+    cur.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (tabel, nama))
+    return cur.fetchone()[0] > 0
+
+
+def tambah_kolom(cur, tabel, kolom, definisi):
+    """ALTER TABLE ... ADD COLUMN yang aman diulang (MySQL maupun MariaDB)"""
+    if not kolom_ada(cur, tabel, kolom):
+        cur.execute(f"ALTER TABLE {tabel} ADD COLUMN {kolom} {definisi}")
+
+
+def buat_index(cur, tabel, nama, kolom, jenis='INDEX'):
+    """CREATE INDEX yang aman diulang. `jenis` bisa 'INDEX', 'UNIQUE INDEX' atau 'FULLTEXT INDEX'"""
+    if not index_ada(cur, tabel, nama):
+        cur.execute(f"CREATE {jenis} {nama} ON {tabel} ({kolom})")
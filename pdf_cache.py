@@ -0,0 +1,53 @@
+import glob
+import os
+import tempfile
+
+
+class PdfCache:
+    """Cache berkas PDF di disk dengan kunci (jenis dokumen, id baris, versi baris).
+
+    Versi baris dinaikkan setiap kali data sumber berubah, sehingga berkas
+    lama otomatis tidak terpakai lagi; berkas versi lama dihapus saat versi
+    baru ditulis.
+    """
+
+    def __init__(self, direktori):
+        self.direktori = direktori
+
+    def path(self, jenis, id, versi):
+        return os.path.join(self.direktori, jenis, f'{id}-v{versi}.pdf')
+
+    @staticmethod
+    def etag(jenis, id, versi):
+        return f'{jenis}-{id}-v{versi}'
+
+    def ambil(self, jenis, id, versi):
+        path = self.path(jenis, id, versi)
+        return path if os.path.exists(path) else None
+
+    def simpan(self, jenis, id, versi, isi):
+        path = self.path(jenis, id, versi)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Tulis ke berkas sementara lalu rename agar worker lain tidak
+        # pernah membaca PDF yang setengah jadi
+        fd, sementara = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(isi)
+        os.replace(sementara, path)
+
+        for lama in glob.glob(os.path.join(self.direktori, jenis, f'{id}-v*.pdf')):
+            if lama != path:
+                self._hapus_berkas(lama)
+        return path
+
+    def hapus(self, jenis, id):
+        for lama in glob.glob(os.path.join(self.direktori, jenis, f'{id}-v*.pdf')):
+            self._hapus_berkas(lama)
+
+    @staticmethod
+    def _hapus_berkas(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
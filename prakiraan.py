@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+import numpy as np
+
+JENDELA_HARI = 28
+JENDELA_PENDEK = 7
+
+
+def matriks_harian(mutasi, bahan, awal, jumlah_hari):
+    """Susun pemakaian harian menjadi array [bahan x hari].
+
+    `mutasi` berisi (nama_bahan, tanggal, jumlah) yang sudah dijumlahkan per
+    hari; nama bahan dicocokkan tanpa membedakan huruf besar/kecil, sama
+    seperti primary key stok_bahan.
+    """
+    indeks = {b.lower(): i for i, b in enumerate(bahan)}
+    baris, kolom, nilai = [], [], []
+    for nama, tanggal, jumlah in mutasi:
+        i = indeks.get((nama or '').strip().lower())
+        hari = (tanggal - awal).days
+        if i is not None and 0 <= hari < jumlah_hari:
+            baris.append(i)
+            kolom.append(hari)
+            nilai.append(float(jumlah))
+
+    m = np.zeros((len(bahan), jumlah_hari))
+    np.add.at(m, (np.array(baris, dtype=int), np.array(kolom, dtype=int)), np.array(nilai))
+    return m
+
+
+def rata_bergulir(m, lebar):
+    """Rata-rata bergulir `lebar` hari untuk setiap baris; kolom terakhir = hari ini"""
+    c = np.cumsum(np.pad(m, ((0, 0), (1, 0))), axis=1)
+    return (c[:, lebar:] - c[:, :-lebar]) / lebar
+
+
+def porsi_kandang(ekor, rata_berat, hari_beri, jendela):
+    """Bagian pemakaian pakan tiap kandang: biomassa (ekor x rata-rata berat) x frekuensi diberi pakan.
+
+    Kandang tanpa data timbang memakai rata-rata berat seluruh kandang; jika
+    belum ada log beri_pakan sama sekali, semua kandang dianggap diberi
+    pakan setiap hari.
+    """
+    ekor = np.asarray(ekor, dtype=float)
+    rata_berat = np.asarray(rata_berat, dtype=float)
+    hari_beri = np.asarray(hari_beri, dtype=float)
+
+    diketahui = ~np.isnan(rata_berat)
+    if diketahui.any():
+        rata_berat = np.where(diketahui, rata_berat, np.average(rata_berat[diketahui], weights=ekor[diketahui] + 1e-9))
+    else:
+        rata_berat = np.ones_like(ekor)
+
+    frekuensi = hari_beri / jendela if hari_beri.sum() > 0 else np.ones_like(ekor)
+    bobot = ekor * rata_berat * np.clip(frekuensi, 0, 1)
+    total = bobot.sum()
+    return (bobot / total if total > 0 else np.zeros_like(bobot)), rata_berat
+
+
+def proyeksi_pakan(bahan, saldo, mutasi, kandang, hari_ini, jendela=JENDELA_HARI, pendek=JENDELA_PENDEK):
+    """Proyeksi hari sampai stok habis untuk semua bahan dalam satu kali hitung.
+
+    bahan/saldo: nama dan sisa stok setiap bahan (urutan sama).
+    mutasi: pemakaian (Keluar) per bahan per hari selama `jendela` hari terakhir.
+    kandang: (nama, ekor, rata_berat atau None, hari_beri_pakan) per kandang.
+
+    Laju harian yang dipakai adalah yang lebih besar dari rata-rata `pendek`
+    dan `jendela` hari, sehingga lonjakan pemakaian terbaru langsung
+    memperpendek perkiraan tanpa dikalahkan minggu-minggu yang sepi.
+    """
+    awal = hari_ini - timedelta(days=jendela - 1)
+    m = matriks_harian(mutasi, bahan, awal, jendela)
+    saldo = np.asarray([float(s) for s in saldo])
+
+    laju_pendek = m[:, -pendek:].mean(axis=1)
+    laju_panjang = m.mean(axis=1)
+    laju = np.maximum(laju_pendek, laju_panjang)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hari_habis = np.where(laju > 0, np.maximum(saldo, 0) / laju, np.inf)
+    tren = rata_bergulir(m, pendek)
+
+    nama_kandang = [k[0] for k in kandang]
+    ekor = [k[1] for k in kandang]
+    porsi, rata_berat = porsi_kandang(
+        ekor, [np.nan if k[2] is None else float(k[2]) for k in kandang], [k[3] for k in kandang], jendela
+    )
+    # [bahan x kandang]: laju harian setiap bahan yang dihabiskan tiap kandang
+    per_kandang = laju[:, None] * porsi[None, :]
+
+    hasil_bahan = []
+    for i, nama in enumerate(bahan):
+        habis = hari_habis[i]
+        hasil_bahan.append({
+            'bahan': nama,
+            'saldo': round(saldo[i], 2),
+            'laju_harian': round(laju[i], 2),
+            'laju_pendek': round(laju_pendek[i], 2),
+            'laju_panjang': round(laju_panjang[i], 2),
+            'hari_habis': None if np.isinf(habis) else round(habis, 1),
+            'tanggal_habis': None if np.isinf(habis) else hari_ini + timedelta(days=int(habis)),
+            'tren': [round(v, 2) for v in tren[i].tolist()],
+        })
+
+    hasil_kandang = []
+    for j, nama in enumerate(nama_kandang):
+        total = per_kandang[:, j].sum()
+        hasil_kandang.append({
+            'kandang': nama,
+            'ekor': int(ekor[j]),
+            'rata_berat': round(rata_berat[j], 2),
+            'hari_beri_pakan': int(kandang[j][3]),
+            'porsi': round(porsi[j], 4),
+            'laju_harian': round(total, 2),
+            'per_ekor': round(total / ekor[j], 3) if ekor[j] else None,
+            'per_bahan': {bahan[i]: round(per_kandang[i, j], 2) for i in range(len(bahan)) if per_kandang[i, j] > 0},
+        })
+
+    return hasil_bahan, hasil_kandang
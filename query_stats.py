@@ -0,0 +1,178 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context, request
+from MySQLdb.cursors import CursorUseResultMixIn
+
+logger = logging.getLogger('dombastis.sql')
+
+_SPASI = re.compile(r'\s+')
+_BISA_EXPLAIN = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')
+
+
+def normalisasi(sql):
+    return _SPASI.sub(' ', sql).strip()
+
+
+def bentuk_params(params, banyak=False):
+    """Ringkas bentuk parameter tanpa menyimpan nilainya (bisa berisi data pribadi)"""
+    if params is None:
+        return '-'
+    if banyak:
+        params = list(params)
+        lebar = len(params[0]) if params and hasattr(params[0], '__len__') else 0
+        return f'{len(params)}x{lebar}'
+    if isinstance(params, dict):
+        return 'dict[' + ','.join(sorted(params)) + ']'
+    return f'{type(params).__name__}[{len(params)}]'
+
+
+class QueryStats:
+    """Agregat waktu query per (endpoint, statement) di dalam satu proses worker"""
+
+    def __init__(self, slow_ms=200, maks_entri=500, maks_lambat=50):
+        self.slow_ms = slow_ms
+        self.maks_entri = maks_entri
+        self._lock = threading.Lock()
+        self._data = {}
+        self.lambat = deque(maxlen=maks_lambat)
+
+    def catat(self, endpoint, statement, params, baris, durasi_ms):
+        kunci = (endpoint, statement)
+        with self._lock:
+            entri = self._data.get(kunci)
+            if entri is None:
+                if len(self._data) >= self.maks_entri:
+                    # Buang statement dengan total waktu terkecil
+                    terkecil = min(self._data, key=lambda k: self._data[k]['total_ms'])
+                    del self._data[terkecil]
+                entri = self._data[kunci] = {
+                    'endpoint': endpoint,
+                    'statement': statement,
+                    'params': params,
+                    'jumlah': 0,
+                    'total_ms': 0.0,
+                    'maks_ms': 0.0,
+                    'baris': 0,
+                }
+            entri['jumlah'] += 1
+            entri['total_ms'] += durasi_ms
+            entri['maks_ms'] = max(entri['maks_ms'], durasi_ms)
+            entri['baris'] += max(baris or 0, 0)
+
+    def catat_lambat(self, endpoint, statement, params, baris, durasi_ms, plan):
+        self.lambat.appendleft({
+            'waktu': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'endpoint': endpoint,
+            'statement': statement,
+            'params': params,
+            'baris': baris,
+            'durasi_ms': durasi_ms,
+            'plan': plan,
+        })
+
+    def teratas(self, jumlah=50):
+        with self._lock:
+            data = [dict(e) for e in self._data.values()]
+        data.sort(key=lambda e: e['total_ms'], reverse=True)
+        for e in data:
+            e['rata_ms'] = e['total_ms'] / e['jumlah']
+        return data[:jumlah]
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+        self.lambat.clear()
+
+    @property
+    def pid(self):
+        return os.getpid()
+
+
+class InstrumentedCursor:
+    """Cursor MySQLdb yang mencatat statement, bentuk parameter, jumlah baris dan durasi"""
+
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, nama):
+        return getattr(self._cursor, nama)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def execute(self, query, args=None):
+        return self._jalankan(self._cursor.execute, query, args, False)
+
+    def executemany(self, query, args):
+        return self._jalankan(self._cursor.executemany, query, args, True)
+
+    def _jalankan(self, fungsi, query, args, banyak):
+        mulai = time.perf_counter()
+        try:
+            return fungsi(query, args)
+        finally:
+            durasi_ms = (time.perf_counter() - mulai) * 1000
+            self._rekam(query, args, banyak, durasi_ms)
+
+    def _rekam(self, query, args, banyak, durasi_ms):
+        if has_request_context():
+            endpoint = request.endpoint or request.path
+            g.db_waktu = g.get('db_waktu', 0.0) + durasi_ms / 1000
+            g.db_query = g.get('db_query', 0) + 1
+        else:
+            endpoint = '(cli/worker)'
+
+        statement = normalisasi(query)
+        params = bentuk_params(args, banyak)
+        baris = self._cursor.rowcount
+        self._stats.catat(endpoint, statement, params, baris, durasi_ms)
+
+        if durasi_ms >= self._stats.slow_ms:
+            plan = self._explain(query, args, banyak)
+            self._stats.catat_lambat(endpoint, statement, params, baris, durasi_ms, plan)
+            logger.warning(
+                "Query lambat %.1f ms [%s] %s params=%s rows=%s plan=%s",
+                durasi_ms, endpoint, statement, params, baris, plan
+            )
+
+    def _explain(self, query, args, banyak):
+        # Cursor unbuffered (SSCursor) masih memegang hasil di koneksi yang sama
+        if isinstance(self._cursor, CursorUseResultMixIn) or banyak:
+            return None
+        if not normalisasi(query).upper().startswith(_BISA_EXPLAIN):
+            return None
+        try:
+            cur = self._cursor.connection.cursor()
+            cur.execute('EXPLAIN ' + query, args)
+            kolom = [d[0] for d in cur.description]
+            plan = [dict(zip(kolom, r)) for r in cur.fetchall()]
+            cur.close()
+            return plan
+        except Exception as e:
+            return f'EXPLAIN gagal: {e}'
+
+
+class InstrumentedConnection:
+    """Bungkus koneksi MySQLdb agar setiap cursor() yang dibuat ikut terinstrumentasi"""
+
+    def __init__(self, conn, stats):
+        self._conn = conn
+        self._stats = stats
+
+    def __getattr__(self, nama):
+        return getattr(self._conn, nama)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._stats)
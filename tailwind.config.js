@@ -0,0 +1,16 @@
+// Dipakai `flask --app app bangun-aset`: hanya class yang muncul di
+// template (dan app.py) yang masuk ke static/dist/app.*.css
+module.exports = {
+    // app.py ikut dipindai: PALET_KANDANG menyimpan class warna kandang
+    content: ['./templates/**/*.html', './app.py'],
+    theme: {
+        extend: {
+            colors: {
+                dombaGreen: '#0f4c3a',
+                dombaYellow: '#ffc107',
+                dombaLight: '#F3F6F5',
+                dombaDark: '#0a3327'
+            }
+        }
+    }
+}